@@ -0,0 +1,11 @@
+"""Benchmarks of the find_isbns library on a synthetic ebook corpus.
+
+The corpus is generated offline and deterministically (see `corpus.py`): text
+files of varying size and ISBN density, single-line HTML, zip and tar archives
+with nested members and EPUBs. The library functions are timed on this corpus
+(see `bench.py`) and the throughputs (MB/s, files/s) are saved as JSON so that
+runs can be compared::
+
+   $ python -m benchmarks --output before.json
+   $ python -m benchmarks --output after.json --compare before.json
+"""
@@ -0,0 +1,71 @@
+"""Command-line interface of the benchmarks::
+
+   $ python -m benchmarks [--corpus-dir DIR] [--seed N] [--scale F]
+                          [--repeat N] [--only NAME ...] [--output FILE]
+                          [--compare FILE]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+from benchmarks.bench import BENCHMARKS, format_results, run_benchmarks
+from benchmarks.corpus import generate_corpus
+
+
+def setup_argparser():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks',
+        description='Time the find_isbns library on a synthetic ebook corpus.')
+    parser.add_argument(
+        '--corpus-dir', metavar='DIR',
+        default=os.path.join(tempfile.gettempdir(), 'find_isbns_benchmark_corpus'),
+        help='''Directory of the corpus. It is generated only if it doesn't
+             exist yet with the same seed and scale. (default: %(default)s)''')
+    parser.add_argument(
+        '--seed', type=int, default=0,
+        help='Seed of the corpus generator. (default: %(default)s)')
+    parser.add_argument(
+        '--scale', type=float, default=1.0,
+        help='''Scale of the sizes of the corpus files, e.g. 0.1 for a quick
+             run. (default: %(default)s)''')
+    parser.add_argument(
+        '--repeat', metavar='N', type=int, default=3,
+        help='Number of runs of each benchmark, the best time is kept. '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--only', metavar='NAME', nargs='+', choices=list(BENCHMARKS),
+        help='Run only these benchmarks (choose from %(choices)s).')
+    parser.add_argument(
+        '--output', metavar='FILE',
+        help='Save the results as JSON in FILE.')
+    parser.add_argument(
+        '--compare', metavar='FILE',
+        help='Show the speedups relative to the results saved in FILE by a '
+             'previous run.')
+    return parser
+
+
+def main():
+    args = setup_argparser().parse_args()
+    baseline = None
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+    print(f'Generating the corpus in {args.corpus_dir}...', file=sys.stderr)
+    manifest = generate_corpus(args.corpus_dir, args.seed, args.scale)
+    print('Running the benchmarks...', file=sys.stderr)
+    run = run_benchmarks(args.corpus_dir, manifest, args.only, args.repeat)
+    if baseline and baseline.get('corpus') != run['corpus']:
+        print('Warning: the baseline was run on another corpus '
+              f"({baseline.get('corpus')})", file=sys.stderr)
+    print(format_results(run, baseline))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""Timing of the library functions on the synthetic corpus, see `corpus.py`.
+
+Each benchmark runs a library function on all the files of some kinds of the
+corpus (e.g. the text files) and is repeated to keep the best time, from which
+the throughputs are computed: MB/s (of input files), files/s and, for the ISBN
+validation, candidates/s.
+"""
+import datetime
+import os
+import platform
+import re
+import statistics
+import sys
+import time
+
+from find_isbns import __version__
+from find_isbns import lib
+
+# Tools that can be called by the benchmarked functions (e.g. ebook-meta for the
+# EPUBs within archives), their presence is saved with the results
+TOOLS = ['7z', 'ebook-meta', 'pdftotext', 'djvutxt', 'tesseract']
+
+
+def _read_texts(corpus_dir, files):
+    texts = []
+    for file in files:
+        with open(os.path.join(corpus_dir, file['path']), 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    return texts
+
+
+# Returns the ISBN candidates (e.g. '9780306406157', '0306406152') of the texts
+# as given to is_isbn_valid()
+def _get_candidates(texts):
+    isbn_regex = re.compile(lib.ISBN_REGEX)
+    return [match.group().replace('-', '') for text in texts
+            for match in isbn_regex.finditer(text)]
+
+
+def bench_find_isbns(corpus_dir, files):
+    texts = _read_texts(corpus_dir, files)
+    return lambda: [lib.find_isbns(text) for text in texts], None
+
+
+def bench_reorder_file_content(corpus_dir, files):
+    paths = [os.path.join(corpus_dir, file['path']) for file in files]
+    return lambda: [lib.reorder_file_content(path) for path in paths], None
+
+
+def bench_find_isbns_in_mmap(corpus_dir, files):
+    paths = [os.path.join(corpus_dir, file['path']) for file in files]
+    return lambda: [lib.find_isbns_in_mmap(path) for path in paths], None
+
+
+def bench_search_file_for_isbns(corpus_dir, files):
+    paths = [os.path.join(corpus_dir, file['path']) for file in files]
+    return lambda: [lib.search_file_for_isbns(path, cache_dir=None)
+                    for path in paths], None
+
+
+def bench_is_isbn_valid(corpus_dir, files):
+    candidates = _get_candidates(_read_texts(corpus_dir, files))
+    return lambda: [lib.is_isbn_valid(isbn) for isbn in candidates], len(candidates)
+
+
+def bench_are_isbns_valid(corpus_dir, files):
+    candidates = _get_candidates(_read_texts(corpus_dir, files))
+    return lambda: lib.are_isbns_valid(candidates), len(candidates)
+
+
+def bench_get_all_isbns_from_archive(corpus_dir, files):
+    paths = [os.path.join(corpus_dir, file['path']) for file in files]
+    return lambda: [lib.get_all_isbns_from_archive(path) for path in paths], None
+
+
+def bench_search_epub_for_isbns(corpus_dir, files):
+    paths = [os.path.join(corpus_dir, file['path']) for file in files]
+    return lambda: [lib.search_epub_for_isbns(path) for path in paths], None
+
+
+def bench_read_ebook_metadata(corpus_dir, files):
+    _check_ebook_metadata(corpus_dir, files)
+    paths = [os.path.join(corpus_dir, file['path']) for file in files]
+    args = [(path, lib.get_mime_type(path), _get_djvused_stub(file, []))
+            for path, file in zip(paths, files)]
+    return lambda: [lib.read_ebook_metadata(*arg) for arg in args], None
+
+
+# Checks that the metadata read in-process from the files (see
+# lib.read_ebook_metadata()) contains their title and the planted ISBNs (and
+# only them), and that `djvused` is only run for the compressed djvu
+# annotations. Raises ValueError otherwise.
+def _check_ebook_metadata(corpus_dir, files):
+    for file in files:
+        path = os.path.join(corpus_dir, file['path'])
+        calls = []
+        metadata = lib.read_ebook_metadata(path, lib.get_mime_type(path),
+                                           _get_djvused_stub(file, calls))
+        isbns = lib.find_isbns(metadata or '')
+        isbns = isbns.split(lib.ISBN_RET_SEPARATOR) if isbns else []
+        expected_calls = [['djvused', '-e', 'print-meta', path]] \
+            if 'djvused_output' in file else []
+        if metadata is None or sorted(isbns) != sorted(file['isbns']) \
+                or file.get('title', '') not in metadata or calls != expected_calls:
+            raise ValueError(f"Wrong metadata read from {file['path']}: {metadata!r} "
+                             f"(ISBNs: {isbns}, expected: {file['isbns']})")
+
+
+# Returns a runner (see lib.run_cmd()) that records the commands in `calls` and
+# outputs the expected `djvused -e print-meta` of the file, i.e. the benchmark
+# doesn't depend on djvulibre
+def _get_djvused_stub(file, calls):
+    def run(args, **kwargs):
+        calls.append(args)
+        return lib.Result(stdout=file.get('djvused_output', ''), returncode=0, args=args)
+    return run
+
+
+# name: (kinds of files of the corpus, setup function). A setup function returns
+# the function to time and the number of items it processes (None: the files).
+BENCHMARKS = {
+    'find_isbns': (['text', 'html'], bench_find_isbns),
+    'reorder_file_content': (['text'], bench_reorder_file_content),
+    'find_isbns_in_mmap': (['text', 'html'], bench_find_isbns_in_mmap),
+    'search_file_for_isbns': (['text', 'html'], bench_search_file_for_isbns),
+    'is_isbn_valid': (['text', 'html'], bench_is_isbn_valid),
+    'are_isbns_valid': (['text', 'html'], bench_are_isbns_valid),
+    'get_all_isbns_from_archive': (['archive'], bench_get_all_isbns_from_archive),
+    'search_epub_for_isbns': (['epub'], bench_search_epub_for_isbns),
+    'read_ebook_metadata': (['metadata'], bench_read_ebook_metadata),
+}
+
+
+# Runs the benchmarks (all of them or the ones in `names`) on the corpus whose
+# manifest is given (see corpus.generate_corpus()) and returns the results
+# that can be saved as JSON
+def run_benchmarks(corpus_dir, manifest, names=None, repeat=3):
+    results = {}
+    for name, (kinds, setup) in BENCHMARKS.items():
+        if names and name not in names:
+            continue
+        files = [file for file in manifest['files'] if file['kind'] in kinds]
+        func, n_items = setup(corpus_dir, files)
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        best = min(times)
+        n_bytes = sum(file['size'] for file in files)
+        results[name] = {
+            'files': len(files),
+            'bytes': n_bytes,
+            'items': n_items,
+            'best_s': best,
+            'median_s': statistics.median(times),
+            'mb_per_s': n_bytes / best / 1e6 if best else None,
+            'files_per_s': len(files) / best if best and n_items is None else None,
+            'items_per_s': n_items / best if best and n_items is not None else None,
+        }
+    return {
+        'find_isbns_version': __version__,
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': lib._get_numpy() is not None,
+        'tools': {tool: lib.command_exists(tool) for tool in TOOLS},
+        'corpus': {'seed': manifest['seed'], 'scale': manifest['scale']},
+        'repeat': repeat,
+        'results': results,
+    }
+
+
+def _format_rate(value, fmt='.1f'):
+    return '-' if value is None else format(value, fmt)
+
+
+# Returns the results (see run_benchmarks()) as a table and, with `baseline`
+# (results of a previous run), the speedups relative to it
+def format_results(run, baseline=None):
+    header = ['benchmark', 'files', 'MB', 'best (s)', 'MB/s', 'files/s', 'items/s']
+    if baseline:
+        header.append('speedup')
+    rows = [header]
+    for name, result in run['results'].items():
+        row = [name, str(result['files']), f"{result['bytes'] / 1e6:.1f}",
+               f"{result['best_s']:.4f}", _format_rate(result['mb_per_s']),
+               _format_rate(result['files_per_s']),
+               _format_rate(result['items_per_s'], '.0f')]
+        if baseline:
+            old = baseline['results'].get(name)
+            row.append(f"{old['best_s'] / result['best_s']:.2f}x"
+                       if old and result['best_s'] else '-')
+        rows.append(row)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(header))]
+    return '\n'.join('  '.join(value.ljust(width) if i == 0 else value.rjust(width)
+                               for i, (value, width) in enumerate(zip(row, widths)))
+                     for row in rows)
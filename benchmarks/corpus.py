@@ -0,0 +1,503 @@
+"""Generator of the synthetic ebook corpus used by the benchmarks.
+
+The corpus only depends on the seed and the scale, i.e. two runs with the same
+options generate the same files (byte for byte), without any network access
+or external tool. The generated files are listed in `manifest.json` with the
+ISBNs planted in each of them.
+"""
+import io
+import json
+import os
+import random
+import struct
+import tarfile
+import zipfile
+import zlib
+
+# Version of the corpus layout, a corpus generated by another version is
+# generated again
+CORPUS_VERSION = 2
+MANIFEST_NAME = 'manifest.json'
+# Sizes in bytes (before scaling)
+TEXT_SIZES = {'small': 64 * 1024, 'medium': 1024 * 1024, 'large': 8 * 1024 * 1024}
+HTML_SIZES = {'medium': 1024 * 1024, 'large': 8 * 1024 * 1024}
+ARCHIVE_MEMBER_SIZE = 64 * 1024
+EPUB_CHAPTER_SIZE = 32 * 1024
+# Number of bytes of text by planted ISBN (None: a few ISBNs at the start, in
+# the middle and at the end of the file)
+ISBN_DENSITIES = {'none': 0, 'sparse': None, 'dense': 2048}
+
+WORDS = ('the', 'of', 'and', 'to', 'in', 'book', 'chapter', 'press', 'edition',
+         'published', 'copyright', 'rights', 'reserved', 'library', 'congress',
+         'catalog', 'printed', 'united', 'states', 'first', 'second', 'author',
+         'data', 'page', 'index', 'science', 'history', 'theory', 'number',
+         'university', 'introduction', 'preface', 'contents', 'figure', 'table')
+
+
+# Returns a valid ISBN-13 (978 or 979 prefix)
+def make_isbn13(rng):
+    digits = rng.choice(['978', '979']) + ''.join(rng.choice('0123456789')
+                                                  for _ in range(9))
+    total = sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits))
+    return digits + str((10 - total % 10) % 10)
+
+
+# Returns a valid ISBN-10, its check digit can be 'X'
+def make_isbn10(rng):
+    digits = ''.join(rng.choice('0123456789') for _ in range(9))
+    total = sum(int(d) * (10 - i) for i, d in enumerate(digits))
+    check = (11 - total % 11) % 11
+    return digits + ('X' if check == 10 else str(check))
+
+
+# Returns 10 digits that are not a valid ISBN-10, e.g. a phone number
+def make_invalid_digits(rng):
+    digits = [rng.choice('0123456789') for _ in range(10)]
+    total = sum(int(d) * (10 - i) for i, d in enumerate(digits))
+    if total % 11 == 0:
+        digits[-1] = str((int(digits[-1]) + 1) % 10)
+    return ''.join(digits)
+
+
+# Returns how an ISBN is written in a text, e.g. 'ISBN 978-0-306-40615-7'
+def format_isbn(rng, isbn):
+    style = rng.randrange(4)
+    if style == 0:
+        return f'ISBN {isbn}'
+    elif style == 1 and len(isbn) == 13:
+        return f'ISBN-13: {isbn[:3]}-{isbn[3]}-{isbn[4:7]}-{isbn[7:12]}-{isbn[12]}'
+    elif style == 1:
+        return f'ISBN-10: {isbn[0]}-{isbn[1:4]}-{isbn[4:9]}-{isbn[9]}'
+    elif style == 2:
+        return f'({isbn})'
+    return isbn
+
+
+# Returns a line of filler text. Some lines contain numbers that look like
+# ISBNs but are not valid (e.g. phone numbers, page ranges), as in real books.
+def make_line(rng):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(6, 14))]
+    noise = rng.randrange(20)
+    if noise == 0:
+        words.append(make_invalid_digits(rng))
+    elif noise == 1:
+        digits = make_invalid_digits(rng)
+        words.append(f'{digits[:3]}-{digits[3:6]}-{digits[6:]}')
+    elif noise == 2:
+        words.append(f'pp. {rng.randint(1, 500)}-{rng.randint(501, 999)}')
+    return ' '.join(words).capitalize() + '.'
+
+
+# Returns the text (with lines of about 80 characters) of about `size` bytes
+# and the list of ISBNs planted in it according to `density` (see
+# ISBN_DENSITIES)
+def make_text(rng, size, density):
+    # A pool of lines is much faster to sample than generating each word
+    pool = [make_line(rng) for _ in range(2000)]
+    lines = []
+    isbns = []
+    length = 0
+    next_isbn = density if density else None
+    n_lines = 0
+    while length < size:
+        line = rng.choice(pool)
+        if density is None and n_lines == 5 \
+                or next_isbn is not None and length >= next_isbn:
+            isbn = make_isbn13(rng) if rng.randrange(3) else make_isbn10(rng)
+            isbns.append(isbn)
+            line = f'{line} {format_isbn(rng, isbn)}'
+            if next_isbn is not None:
+                next_isbn += density
+        lines.append(line)
+        length += len(line) + 1
+        n_lines += 1
+    if density is None:
+        # The last lines, e.g. the copyright page at the end of some books
+        isbn = make_isbn13(rng)
+        isbns.append(isbn)
+        lines.insert(len(lines) - 3, f'Printed in the United States. {format_isbn(rng, isbn)}')
+        # The middle of the file
+        isbn = make_isbn13(rng)
+        isbns.append(isbn)
+        lines.insert(len(lines) // 2, format_isbn(rng, isbn))
+    return '\n'.join(lines) + '\n', isbns
+
+
+# Returns an HTML page on a single line (e.g. a minified page) of about
+# `size` bytes and its ISBNs
+def make_html(rng, size):
+    text, isbns = make_text(rng, size, ISBN_DENSITIES['dense'] * 8)
+    paragraphs = ''.join(f'<p>{line}</p>' for line in text.splitlines())
+    return (f'<!DOCTYPE html><html><head><title>Catalog</title></head><body>'
+            f'{paragraphs}</body></html>', isbns)
+
+
+# Returns the content of an EPUB built with zipfile and its ISBNs. The ISBN is
+# either in the OPF (`dc:identifier`), only in the copyright page at the end
+# of the book or nowhere.
+def make_epub(rng, n_chapters, isbn_location):
+    isbn = make_isbn13(rng)
+    identifier = f'urn:isbn:{isbn}' if isbn_location == 'opf' else \
+        f'urn:uuid:{rng.getrandbits(128):032x}'
+    manifest = ''.join(f'<item id="ch{i}" href="ch{i}.xhtml" '
+                       f'media-type="application/xhtml+xml"/>'
+                       for i in range(n_chapters + 1))
+    spine = ''.join(f'<itemref idref="ch{i}"/>' for i in range(n_chapters + 1))
+    opf = (f'<?xml version="1.0" encoding="utf-8"?>'
+           f'<package xmlns="http://www.idpf.org/2007/opf" version="2.0" '
+           f'unique-identifier="id"><metadata '
+           f'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+           f'<dc:title>Book</dc:title><dc:identifier id="id">{identifier}'
+           f'</dc:identifier></metadata><manifest>{manifest}</manifest>'
+           f'<spine>{spine}</spine></package>')
+    container = ('<?xml version="1.0"?><container version="1.0" '
+                 'xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+                 '<rootfiles><rootfile full-path="OEBPS/content.opf" '
+                 'media-type="application/oebps-package+xml"/></rootfiles>'
+                 '</container>')
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        # The mimetype must be the first member and not compressed
+        zf.writestr(_zipinfo('mimetype'), 'application/epub+zip',
+                    compress_type=zipfile.ZIP_STORED)
+        zf.writestr(_zipinfo('META-INF/container.xml'), container)
+        zf.writestr(_zipinfo('OEBPS/content.opf'), opf)
+        for i in range(n_chapters + 1):
+            if i == n_chapters:
+                body = ('<p>Copyright. All rights reserved.</p>'
+                        + (f'<p>ISBN {isbn}</p>' if isbn_location == 'copyright' else ''))
+            else:
+                text, _ = make_text(rng, EPUB_CHAPTER_SIZE, ISBN_DENSITIES['none'])
+                body = ''.join(f'<p>{line}</p>\n' for line in text.splitlines())
+            zf.writestr(_zipinfo(f'OEBPS/ch{i}.xhtml'),
+                        f'<html xmlns="http://www.w3.org/1999/xhtml"><body>'
+                        f'{body}</body></html>')
+    return buffer.getvalue(), [] if isbn_location == 'none' else [isbn]
+
+
+# Returns the content of a zip archive with the `members` ({name: bytes})
+def make_zip(members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for name, data in members.items():
+            zf.writestr(_zipinfo(name), data)
+    return buffer.getvalue()
+
+
+# Returns the content of a tar archive (`mode` 'w' or e.g. 'w:gz') with the
+# `members` ({name: bytes})
+def make_tar(members, mode='w'):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode=mode) as tf:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            # Fixed metadata so that the archive is the same at each run
+            info.mtime = 0
+            tf.addfile(info, io.BytesIO(data))
+    if mode.endswith('gz'):
+        # The gzip header has a timestamp (the mtime of the tarfile)
+        data = bytearray(buffer.getvalue())
+        data[4:8] = b'\0\0\0\0'
+        return bytes(data)
+    return buffer.getvalue()
+
+
+# Returns the content of a pdf with a classic cross-reference table, updated
+# once (an incremental update replaces its Info dictionary), its title (a
+# literal string with escapes) and its ISBNs:
+# in a UTF-16BE hexadecimal string of the Info dictionary and in the XMP
+# packet (with an indirect /Length). The ISBN of the replaced Info dictionary
+# and the one of the XMP document ID must not be found.
+def make_pdf_xref_table(rng):
+    info_isbn, xmp_isbn = make_isbn13(rng), make_isbn10(rng)
+    old_isbn, id_isbn = make_isbn13(rng), make_isbn13(rng)
+    xmp = _make_xmp(f'<prism:isbn>{format_isbn(rng, xmp_isbn)}</prism:isbn>',
+                    f'xmpMM:DocumentID="uuid:{id_isbn}"')
+    subject = ('ISBN ' + info_isbn).encode('utf-16-be')
+    objects = {
+        1: b'<< /Type /Catalog /Pages 2 0 R /Metadata 4 0 R >>',
+        2: b'<< /Type /Pages /Kids [] /Count 0 >>',
+        3: b'<< /Title (Draft) /Subject (ISBN %s) >>' % old_isbn.encode(),
+        4: b'<< /Type /Metadata /Subtype /XML /Length 5 0 R >>\nstream\n'
+           + xmp + b'\nendstream',
+        5: b'%d' % len(xmp),
+    }
+    data, xref = _add_pdf_revision(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n', objects,
+                                   b'/Size 6 /Root 1 0 R /Info 3 0 R')
+    objects = {3: b'<< /Title (A \\(nested\\) title \\050draft\\051) /Subject <FEFF%s> '
+                  b'/Producer (corpus) >>' % subject.hex().upper().encode()}
+    data, _ = _add_pdf_revision(data, objects, b'/Size 6 /Root 1 0 R /Info 3 0 R '
+                                b'/Prev %d' % xref)
+    return data, 'A (nested) title (draft)', [info_isbn, xmp_isbn]
+
+
+# Returns the content of a pdf whose cross-reference stream (with PNG
+# predictors of all the filter types and two subsections) points to a
+# compressed Info dictionary in an object stream, its title and its ISBNs: in
+# the Info dictionary and in the compressed XMP packet. The ISBN of the object
+# after the Info dictionary in the object stream must not be found.
+def make_pdf_xref_stream(rng):
+    info_isbn, xmp_isbn = make_isbn10(rng), make_isbn13(rng)
+    xmp = zlib.compress(_make_xmp(
+        f'<pdf:Keywords>ebook; {format_isbn(rng, xmp_isbn)}</pdf:Keywords>'))
+    info = b'<< /Title (Compressed objects) /Keywords (ISBN: %s) >>' % info_isbn.encode()
+    pages = b'<< /Type /Pages /Kids [] /Count 0 >>'
+    outline = b'<< /Title (See ISBN %s) >>' % make_isbn13(rng).encode()
+    header = b'3 0 2 %d 7 %d ' % (len(info), len(info) + len(pages))
+    objects = zlib.compress(header + info + pages + outline)
+    data = b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n'
+    offsets = {}
+    for num, body in [(1, b'<< /Type /Catalog /Pages 2 0 R /Metadata 4 0 R >>'),
+                      (4, b'<< /Type /Metadata /Subtype /XML /Filter /FlateDecode '
+                          b'/Length %d >>\nstream\r\n%s\nendstream' % (len(xmp), xmp)),
+                      (5, b'<< /Type /ObjStm /N 3 /First %d /Filter /FlateDecode '
+                          b'/Length %d >>\nstream\n%s\nendstream'
+                          % (len(header), len(objects), objects))]:
+        offsets[num] = len(data)
+        data += b'%d 0 obj\n%s\nendobj\n' % (num, body)
+    xref = len(data)
+    # Type, offset (or object stream) and generation (or index) of objects 0-7
+    entries = [(0, 0, 255), (1, offsets[1], 0), (2, 5, 1), (2, 5, 0),
+               (1, offsets[4], 0), (1, offsets[5], 0), (1, xref, 0), (2, 5, 2)]
+    rows = [bytes([type_]) + value.to_bytes(2, 'big') + bytes([index])
+            for type_, value, index in entries]
+    stream = zlib.compress(_png_predict(rows))
+    data += (b'6 0 obj\n<< /Type /XRef /Size 8 /Index [0 3 3 5] /W [1 2 1] '
+             b'/Root 1 0 R /Info 3 0 R /Filter /FlateDecode '
+             b'/DecodeParms << /Columns 4 /Predictor 12 >> /Length %d >>\n'
+             b'stream\n%s\nendstream\nendobj\nstartxref\n%d\n%%%%EOF\n'
+             % (len(stream), stream, xref))
+    return data, 'Compressed objects', [info_isbn, xmp_isbn]
+
+
+# Returns the content of a mobi file (a Palm database whose first record has
+# the MOBI header), its title (UTF-8) and its ISBN, in an EXTH record among
+# other records. The
+# ISBN-like number of the author record must not be found.
+def make_mobi(rng):
+    isbn = make_isbn13(rng)
+    exth_records = [(100, f'Author {make_isbn13(rng)}'), (104, format_isbn(rng, isbn)),
+                    (113, 'B00' + ''.join(rng.choice('0123456789ABCDEFGHIJ')
+                                          for _ in range(7))),
+                    (503, 'Le titre mis à jour')]
+    exth = b''.join(struct.pack('>II', type_, len(value.encode()) + 8) + value.encode()
+                    for type_, value in exth_records)
+    exth = b'EXTH' + struct.pack('>II', 12 + len(exth), len(exth_records)) + exth
+    title = 'Un livre à lire'.encode()
+    # PalmDOC header (16 bytes) and MOBI header (232 bytes): identifier,
+    # header length, mobi type, text encoding (UTF-8), full name offset and
+    # length, EXTH flags
+    record0 = bytearray(16 + 232)
+    record0[16:20] = b'MOBI'
+    struct.pack_into('>III', record0, 20, 232, 2, 65001)
+    struct.pack_into('>II', record0, 0x54, len(record0) + len(exth), len(title))
+    struct.pack_into('>I', record0, 0x80, 0x40)
+    record0 = bytes(record0) + exth + title + b'\0' * 4
+    # Palm database header and the list of the records (offset, attributes)
+    header = bytearray(78)
+    header[:8] = b'A_book\0\0'
+    header[60:68] = b'BOOKMOBI'
+    struct.pack_into('>H', header, 76, 2)
+    offset = 78 + 2 * 8 + 2
+    records = struct.pack('>II', offset, 0) + struct.pack('>II', offset + len(record0), 1)
+    return (bytes(header) + records + b'\0\0' + record0 + b'Text record.',
+            title.decode(), [isbn])
+
+
+# Returns the content of a multi-page djvu document, its title and its ISBNs, in the
+# metadata annotations shared by the pages (DJVI component) and in the ones of
+# the first page, after a chunk of odd size. The ISBNs of a hyperlink and of
+# the annotations of the second page must not be found.
+def make_djvu(rng):
+    shared_isbn, page_isbn = make_isbn13(rng), make_isbn10(rng)
+    annotations = (f'(background #ffffff)\n(metadata (title "A \\"quoted\\" (title)") '
+                   f'(isbn "{format_isbn(rng, shared_isbn)}"))\n'
+                   f'(maparea "http://example.com/{make_isbn13(rng)}" "" (rect 0 0 1 1))')
+    shared = _djvu_form(b'DJVI', _djvu_chunk(b'ANTa', annotations.encode()))
+    page1 = _djvu_form(b'DJVU', _djvu_chunk(b'INFO', bytes(10))
+                       + _djvu_chunk(b'INCL', b'shared_anno.iff')
+                       + _djvu_chunk(b'ANTa', f'(metadata (isbn "{page_isbn}"))'.encode()))
+    page2 = _djvu_form(b'DJVU', _djvu_chunk(b'INFO', bytes(10)) + _djvu_chunk(
+        b'ANTa', f'(metadata (isbn "{make_isbn13(rng)}"))'.encode()))
+    document = _djvu_form(b'DJVM', _djvu_chunk(b'DIRM', b'\x81\x00\x03')
+                          + shared + page1 + page2)
+    return b'AT&T' + document, 'A "quoted" (title)', [shared_isbn, page_isbn]
+
+
+# Returns the content of a single-page djvu document with compressed (ANTz)
+# annotations, its ISBN and the output of `djvused -e print-meta` for it, i.e.
+# the reader has to give the file to djvused (the random bytes are not a real
+# BZZ stream)
+def make_djvu_antz(rng):
+    isbn = make_isbn13(rng)
+    page = _djvu_form(b'DJVU', _djvu_chunk(b'INFO', bytes(10)) + _djvu_chunk(
+        b'ANTz', bytes(rng.randrange(256) for _ in range(33))))
+    return b'AT&T' + page, [isbn], f'isbn\t"{isbn}"\n'
+
+
+def _add_pdf_revision(data, objects, trailer):
+    offsets = {}
+    for num, body in sorted(objects.items()):
+        offsets[num] = len(data)
+        data += b'%d 0 obj\n%s\nendobj\n' % (num, body)
+    xref = len(data)
+    data += b'xref\n'
+    if b'/Prev' not in trailer:
+        data += b'0 1\n0000000000 65535 f\r\n'
+    # One subsection by object, the entries are 20 bytes long
+    for num, offset in sorted(offsets.items()):
+        data += b'%d 1\n%010d 00000 n\r\n' % (num, offset)
+    data += b'trailer\n<< %s >>\nstartxref\n%d\n%%%%EOF\n' % (trailer, xref)
+    return data, xref
+
+
+def _make_xmp(elements, attributes=''):
+    return (f'<?xpacket begin="" id="W5M0MpCehiHzreSzNTczkc9d"?>'
+            f'<x:xmpmeta xmlns:x="adobe:ns:meta/"><rdf:RDF '
+            f'xmlns:rdf="http://www.w3.org/1999/02/22-rdf-syntax-ns#">'
+            f'<rdf:Description xmlns:dc="http://purl.org/dc/elements/1.1/" '
+            f'xmlns:pdf="http://ns.adobe.com/pdf/1.3/" '
+            f'xmlns:prism="http://prismstandard.org/namespaces/basic/2.0/" '
+            f'xmlns:xmpMM="http://ns.adobe.com/xap/1.0/mm/" {attributes}>'
+            f'<dc:title><rdf:Alt><rdf:li xml:lang="x-default">Book</rdf:li>'
+            f'</rdf:Alt></dc:title>{elements}</rdf:Description></rdf:RDF>'
+            f'</x:xmpmeta><?xpacket end="w"?>').encode()
+
+
+# Applies the PNG filters to the rows (one byte by pixel), the filter type of
+# each row cycles over None, Paeth, Sub, Up and Average
+def _png_predict(rows):
+    data = b''
+    prior = bytes(len(rows[0]))
+    for i, row in enumerate(rows):
+        filter_type = (0, 4, 1, 2, 3)[i % 5]
+        filtered = bytearray()
+        for j, value in enumerate(row):
+            left = row[j - 1] if j else 0
+            up = prior[j]
+            up_left = prior[j - 1] if j else 0
+            if filter_type == 1:
+                value -= left
+            elif filter_type == 2:
+                value -= up
+            elif filter_type == 3:
+                value -= (left + up) // 2
+            elif filter_type == 4:
+                estimate = left + up - up_left
+                distance_left, distance_up, distance_up_left = \
+                    abs(estimate - left), abs(estimate - up), abs(estimate - up_left)
+                if distance_left <= distance_up and distance_left <= distance_up_left:
+                    value -= left
+                elif distance_up <= distance_up_left:
+                    value -= up
+                else:
+                    value -= up_left
+            filtered.append(value & 0xFF)
+        data += bytes([filter_type]) + bytes(filtered)
+        prior = row
+    return data
+
+
+def _djvu_chunk(chunk_id, data):
+    # The chunks are aligned on even offsets
+    return chunk_id + struct.pack('>I', len(data)) + data + b'\0' * (len(data) % 2)
+
+
+def _djvu_form(form_type, chunks):
+    return b'FORM' + struct.pack('>I', 4 + len(chunks)) + form_type + chunks
+
+
+def _zipinfo(name):
+    # Fixed timestamp so that the archive is the same at each run
+    info = zipfile.ZipInfo(name, date_time=(1980, 1, 1, 0, 0, 0))
+    info.compress_type = zipfile.ZIP_DEFLATED
+    return info
+
+
+# Generates the corpus in `corpus_dir` (if not already generated with the same
+# options) and returns its manifest: {'seed', 'scale', 'files': [...]} where
+# each file is {'path' (relative), 'kind', 'size', 'isbns'} (and the 'title'
+# of the metadata files or the 'djvused_output' of the djvu with compressed
+# annotations)
+def generate_corpus(corpus_dir, seed=0, scale=1.0):
+    manifest_path = os.path.join(corpus_dir, MANIFEST_NAME)
+    if os.path.isfile(manifest_path):
+        with open(manifest_path, 'r') as f:
+            manifest = json.load(f)
+        if (manifest.get('version'), manifest.get('seed'), manifest.get('scale')) \
+                == (CORPUS_VERSION, seed, scale):
+            return manifest
+    rng = random.Random(seed)
+    files = []
+
+    def add(kind, path, data, isbns, **extra):
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        file_path = os.path.join(corpus_dir, path)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with open(file_path, 'wb') as f:
+            f.write(data)
+        files.append({'path': path, 'kind': kind, 'size': len(data),
+                      'isbns': isbns, **extra})
+
+    def scaled(size):
+        return max(4096, int(size * scale))
+
+    # Text files
+    for size_name, size in TEXT_SIZES.items():
+        for density_name, density in ISBN_DENSITIES.items():
+            add('text', f'text/{density_name}-{size_name}.txt',
+                *make_text(rng, scaled(size), density))
+    # Single-line HTML
+    for size_name, size in HTML_SIZES.items():
+        add('html', f'html/oneline-{size_name}.html', *make_html(rng, scaled(size)))
+    # EPUBs
+    for i, isbn_location in enumerate(['opf', 'copyright', 'none', 'opf', 'copyright']):
+        add('epub', f'epub/book-{i}-{isbn_location}.epub',
+            *make_epub(rng, max(1, int(8 * scale)), isbn_location))
+
+    # Archives, some of them with nested archives and EPUBs
+    def make_members(n):
+        members = {}
+        isbns = []
+        for j in range(n):
+            text, text_isbns = make_text(rng, scaled(ARCHIVE_MEMBER_SIZE),
+                                         ISBN_DENSITIES['sparse'] if j % 3 == 0
+                                         else ISBN_DENSITIES['none'])
+            members[f'docs/part-{j}.txt'] = text.encode('utf-8')
+            isbns += text_isbns
+        return members, isbns
+
+    members, isbns = make_members(12)
+    add('archive', 'archives/flat.zip', make_zip(members), isbns)
+    members, isbns = make_members(12)
+    add('archive', 'archives/flat.tar.gz', make_tar(members, 'w:gz'), isbns)
+    members, isbns = make_members(4)
+    inner_members, inner_isbns = make_members(4)
+    epub, epub_isbns = make_epub(rng, 2, 'copyright')
+    members['inner/inner.zip'] = make_zip(inner_members)
+    members['inner/book.epub'] = epub
+    add('archive', 'archives/nested.zip', make_zip(members),
+        isbns + inner_isbns + epub_isbns)
+    members, isbns = make_members(4)
+    inner_members, inner_isbns = make_members(4)
+    members['inner/inner.tar.gz'] = make_tar(inner_members, 'w:gz')
+    add('archive', 'archives/nested.tar', make_tar(members), isbns + inner_isbns)
+
+
+    # Ebooks with their ISBNs in the metadata read in-process (not scaled)
+    for path, make in [('metadata/xref-table.pdf', make_pdf_xref_table),
+                       ('metadata/xref-stream.pdf', make_pdf_xref_stream),
+                       ('metadata/exth.mobi', make_mobi),
+                       ('metadata/anta.djvu', make_djvu)]:
+        data, title, isbns = make(rng)
+        add('metadata', path, data, isbns, title=title)
+    data, isbns, djvused_output = make_djvu_antz(rng)
+    add('metadata', 'metadata/antz.djvu', data, isbns, djvused_output=djvused_output)
+
+    manifest = {'version': CORPUS_VERSION, 'seed': seed, 'scale': scale,
+                'files': files}
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    return manifest
@@ -0,0 +1,72 @@
+"""Regression check of the cold start of the script `find_isbns`::
+
+   $ python -m benchmarks.startup [--runs N] [--max-ms MS]
+
+The script is imported with `python -X importtime` in fresh interpreters: the
+median cumulative import time is reported and the check fails (exit code 1)
+if a module that must only be imported by the stages that need it (e.g.
+asyncio, sqlite3) is imported at startup, or if the import time is above
+`--max-ms`.
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULE = 'find_isbns.scripts.find_isbns'
+# Modules that are slow to import and not needed to parse the arguments
+DEFERRED_MODULES = ['asyncio', 'concurrent.futures.process', 'hashlib', 'json',
+                    'mimetypes', 'pathlib', 'shutil', 'sqlite3', 'subprocess',
+                    'tarfile', 'tempfile', 'urllib.parse', 'xml.etree.ElementTree',
+                    'zipfile']
+
+
+# Returns the cumulative import times in microseconds ({module: us}) of
+# `module` imported in a fresh interpreter
+def get_import_times(module=MODULE):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    import_times = {}
+    for line in result.stderr.splitlines():
+        # e.g. 'import time:       560 |      31000 | find_isbns.scripts.find_isbns'
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        import_times[name.strip()] = int(cumulative)
+    return import_times
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.startup',
+        description='Check the cold start (import time) of the script find_isbns.')
+    parser.add_argument('--runs', metavar='N', type=int, default=10,
+                        help='Number of fresh interpreters. (default: %(default)s)')
+    parser.add_argument('--max-ms', metavar='MS', type=float,
+                        help='Fail if the median import time is above MS.')
+    parser.add_argument('--output', metavar='FILE',
+                        help='Save the results as JSON in FILE.')
+    args = parser.parse_args()
+    runs = [get_import_times() for _ in range(args.runs)]
+    median_ms = statistics.median(run[MODULE] for run in runs) / 1000
+    imported = sorted(module for module in DEFERRED_MODULES if module in runs[-1])
+    print(f'Import time of {MODULE}: {median_ms:.1f} ms (median of {args.runs} runs)')
+    failed = False
+    if imported:
+        print(f"Modules imported at startup but that should be deferred: "
+              f"{', '.join(imported)}")
+        failed = True
+    if args.max_ms is not None and median_ms > args.max_ms:
+        print(f'The import time is above {args.max_ms} ms')
+        failed = True
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'module': MODULE, 'median_ms': median_ms,
+                       'deferred_modules_imported': imported}, f, indent=2)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
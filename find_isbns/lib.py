@@ -7,22 +7,39 @@ Ref.:
 - https://github.com/na--/ebook-tools/blob/master/find-isbns.sh
 - https://github.com/na--/ebook-tools/blob/master/lib.sh
 """
-import ast
+# NOTE: the modules that are slow to import (e.g. asyncio, sqlite3, zipfile,
+# subprocess) are imported by the functions that need them so that the
+# startup of the script stays fast, e.g. when it is run once per file
+import codecs
+import glob
+import io
+import itertools
 import logging
-import mimetypes
+import math
+import mmap
 import os
+import posixpath
 import re
-import shlex
-import shutil
+import signal
+import sys
 import string
-import subprocess
-import tempfile
-from argparse import Namespace
-from pathlib import Path
+import threading
+import time
+import weakref
+import zlib
+from functools import lru_cache, partial
+from collections import deque
+from contextlib import closing, contextmanager, nullcontext
 from types import SimpleNamespace
 
 from find_isbns import __version__
 
+try:
+    # Not available on Windows, only used by the profiler
+    import resource
+except ImportError:
+    resource = None
+
 # import ipdb
 
 logger = logging.getLogger('find_lib')
@@ -33,12 +50,48 @@ logger.setLevel(logging.CRITICAL + 1)
 # Default config values
 # =====================
 
+# Archive options
+# ===============
+# Size budgets (uncompressed) when scanning zip/tar archives: bigger members are
+# skipped and the scan stops once the total is reached
+ARCHIVE_MAX_MEMBER_SIZE = 512 * 1024 * 1024
+ARCHIVE_MAX_TOTAL_SIZE = 4 * 1024 * 1024 * 1024
+# Text members up to this size are searched from memory
+ARCHIVE_MAX_IN_MEMORY_SIZE = 32 * 1024 * 1024
+
+# Batch options
+# =============
+# Number of worker processes used when searching many files at once
+JOBS = os.cpu_count() or 1
+# Maximum number of child processes run at the same time by the asyncio API
+ASYNC_MAX_PROCESSES = os.cpu_count() or 1
+
+# Cache options
+# =============
+# Where the results of search_file_for_isbns() are cached between runs
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                         os.path.join(os.path.expanduser('~'), '.cache'),
+                         'find_isbns')
+# The least recently used results are evicted beyond this number of entries
+CACHE_MAX_ENTRIES = 1000000
+
 # convert_to_txt options
 # ======================
+# If True, pdf and djvu documents are converted and searched by page windows
+# (first pages, last pages, then the middle) until ISBNs are found
+CONVERT_PROGRESSIVE = False
+# Number of pages in the first and last windows of the progressive conversion
+CONVERT_PROGRESSIVE_PAGES = (10, 5)
+# If True, the converters that can write the text on their stdout (e.g.
+# pdftotext, djvutxt) are searched as they convert and stopped as soon as the
+# first lines (see `isbn_reorder_files`) contain ISBNs
+CONVERT_STREAM = False
+# Converter backends (see register_converter()) or 'auto' for the cheapest
+# available one, e.g. an in-process pdf backend if its module is installed
 DJVU_CONVERT_METHOD = 'djvutxt'
 EPUB_CONVERT_METHOD = 'epubtxt'
 MSWORD_CONVERT_METHOD = 'textutil'  # not supported in script `find_isbns`
-PDF_CONVERT_METHOD = 'pdftotext'
+PDF_CONVERT_METHOD = 'auto'
 
 # Finding ISBNs options
 # =====================
@@ -50,6 +103,8 @@ ISBN_IGNORED_FILES = '^(image/(gif|svg.+)|application/(x-shockwave-flash|CDFV2|v
 # False to disable the functionality or (first_lines,last_lines) to enable it
 ISBN_REORDER_FILES = [400, 50]
 ISBN_RET_SEPARATOR = '\n'
+# Minimum number of ISBN candidates validated at once with NumPy (if installed)
+ISBN_BATCH_MIN_SIZE = 1000
 # NOTE: If you use Calibre versions that are older than 2.84, it's required to
 # manually set the following option to an empty string
 # ISBN_METADATA_FETCH_ORDER = ['Goodreads', 'Amazon.com', 'Google', 'ISBNDB', 'WorldCat xISBN', 'OZON.ru']
@@ -64,8 +119,451 @@ LOGGING_LEVEL = 'info'
 OCR_ENABLED = 'false'
 OCR_COMMAND = 'tesseract_wrapper'
 OCR_ONLY_FIRST_LAST_PAGES = (7, 3)
+# Number of pages that are rasterized and OCRed at the same time
+# NOTE: when many files are searched at once (see find_batch()), each of the
+# `jobs` worker processes OCRs by default `OCR_JOBS // jobs` pages at the same
+# time (at least 1) instead, i.e. not up to cores² gs/tesseract processes
+OCR_JOBS = os.cpu_count() or 1
+# Maximum number of consecutive pages rasterized by a single gs/ddjvu call
+OCR_RASTER_PAGES = 10
+# Where the page images are rasterized before being piped to the OCR, RAM-backed
+# if possible (None for `scratch_dir`), see ScratchWorkspace
+OCR_SCRATCH_DIR = '/dev/shm' if os.path.isdir('/dev/shm') else None
+# If True, the pages are OCRed by priority (first pages, last pages in reverse,
+# then the rest) and OCR stops at the first page that contains valid ISBNs
+OCR_EARLY_EXIT = False
+
+# Timeout options
+# ===============
+# Maximum time in seconds of each stage of the search of a file (None for no
+# limit): the commands that take longer are killed and the file is skipped
+EBOOK_META_TIMEOUT = 60
+ARCHIVE_TIMEOUT = 600
+CONVERT_TIMEOUT = 600
+# For each page (its rasterization and OCR)
+OCR_PAGE_TIMEOUT = 300
+# Maximum total time in seconds of the search of a file (None for no limit)
+FILE_TIMEOUT = None
+
+# Profiling options
+# =================
+# Steps of search_file_for_isbns() in the profile reports, see Profiler
+PROFILE_STEPS = ('filename', 'cache', 'text', 'ebook-meta', 'archive',
+                 'convert', 'ocr')
+
+# Server options
+# ==============
+# Maximum number of requests searched or waiting for a worker at once (None for
+# 4 by worker), the requests beyond wait until some are done
+SERVER_MAX_IN_FLIGHT = None
+# Maximum time in seconds to finish the requests in flight once the server is
+# stopped (SIGTERM, SIGINT), then the searches still running are killed
+SERVER_DRAIN_TIMEOUT = 60
+
+# Scratch options
+# ===============
+# Where the scratch workspace of each searched file is created (None for the
+# default temp dir), e.g. for its .txt conversion and its extracted archives
+SCRATCH_DIR = None
+
+# Options that affect the results of search_file_for_isbns() with their defaults,
+# see get_options_fingerprint()
+_CACHE_KEY_OPTIONS = {
+    'isbn_blacklist_regex': ISBN_BLACKLIST_REGEX,
+    'isbn_direct_files': ISBN_DIRECT_FILES,
+    'isbn_ignored_files': ISBN_IGNORED_FILES,
+    'isbn_regex': ISBN_REGEX,
+    'isbn_reorder_files': ISBN_REORDER_FILES,
+    'djvu_convert_method': DJVU_CONVERT_METHOD,
+    'epub_convert_method': EPUB_CONVERT_METHOD,
+    'msword_convert_method': MSWORD_CONVERT_METHOD,
+    'pdf_convert_method': PDF_CONVERT_METHOD,
+    'ocr_command': OCR_COMMAND,
+    'ocr_enabled': OCR_ENABLED,
+    'ocr_only_first_last_pages': OCR_ONLY_FIRST_LAST_PAGES,
+    'convert_progressive': CONVERT_PROGRESSIVE,
+    'convert_progressive_pages': CONVERT_PROGRESSIVE_PAGES,
+    'convert_stream': CONVERT_STREAM,
+    'ocr_early_exit': OCR_EARLY_EXIT
+}
+# One ResultCache per (process, cache dir), see get_result_cache()
+_RESULT_CACHES = {}
+# Semaphores of the asyncio API, by event loop and then by limit
+_ASYNC_SEMAPHORES = weakref.WeakKeyDictionary()
+# File signatures (magic bytes) checked in this order by sniff_mime_type(): the
+# MIME type of a file whose first bytes contain `signature` at `offset`
+_MAGIC_SIGNATURES = (
+    # (offset, signature, MIME type)
+    (0, b'%PDF-', 'application/pdf'),
+    (0, b'AT&TFORM', 'image/vnd.djvu'),
+    (0, b'PK\x03\x04', 'application/zip'),
+    (0, b'PK\x05\x06', 'application/zip'),  # empty zip
+    (0, b'Rar!\x1a\x07', 'application/vnd.rar'),
+    (0, b"7z\xbc\xaf'\x1c", 'application/x-7z-compressed'),
+    (0, b'\x1f\x8b', 'application/gzip'),
+    (0, b'BZh', 'application/x-bzip2'),
+    (0, b'\xfd7zXZ\x00', 'application/x-xz'),
+    (257, b'ustar', 'application/x-tar'),
+    # OLE compound file, also used by xls and ppt (see get_mime_type())
+    (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword'),
+    (60, b'BOOKMOBI', 'application/x-mobipocket-ebook'),
+    (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (0, b'\xff\xd8\xff', 'image/jpeg'),
+    (0, b'GIF87a', 'image/gif'),
+    (0, b'GIF89a', 'image/gif'),
+    (0, b'II*\x00', 'image/tiff'),
+    (0, b'MM\x00*', 'image/tiff'),
+)
+# Number of bytes read from the start of a file by sniff_mime_type()
+_SNIFF_SIZE = 4096
+# MIME types found by sniff_mime_type()
+_SNIFFED_MIME_TYPES = {mime_type for _, _, mime_type in _MAGIC_SIGNATURES} \
+    | {'application/epub+zip', 'text/plain'}
+# Sniffed MIME types of containers that are refined by the file extension in
+# get_mime_type(), e.g. a docx or cbz is a zip and an xls an OLE file
+_GENERIC_MIME_TYPES = ('application/zip', 'application/vnd.rar', 'application/msword',
+                       'text/plain')
+# (sniffed, guessed) MIME types where the extension refines the content even if
+# the guessed type can be sniffed: an epub whose first member isn't 'mimetype'
+# is only sniffed as a zip
+_REFINED_SNIFFED_MIME_TYPES = {('application/zip', 'application/epub+zip')}
+# The steps of search_file_for_isbns() that can't find ISBNs in some file types
+# are skipped:
+# - the archives are only extracted (step 5)
+_ARCHIVE_MIME_TYPES_REGEX = \
+    '^application/(zip|vnd\\.rar|x-7z-compressed|gzip|x-bzip2|x-xz|x-tar)$'
+# - these documents and images are not archives (step 5 is skipped)
+_NOT_ARCHIVE_MIME_TYPES_REGEX = \
+    '^(application/(pdf|epub\\+zip|x-mobipocket-ebook)|image/.+)$'
+# - ebook-meta can't read the metadata of images (step 4 is skipped)
+_NO_METADATA_MIME_TYPES_REGEX = '^image/(?!vnd\\.djvu).+$'
+# Maximum number of bytes read by the in-process metadata readers for a single
+# structure (e.g. the PDF Info dictionary, the MOBI header), see
+# read_ebook_metadata()
+_METADATA_MAX_READ_SIZE = 1024 * 1024
+# Metadata fields that can contain ISBNs: in the XMP packets (local names,
+# lowercase) and the EXTH records of MOBI files (types)
+_XMP_FIELDS = ('description', 'identifier', 'isbn', 'keywords', 'subject', 'title')
+_MOBI_EXTH_FIELDS = {
+    104: 'isbn',
+    105: 'subject',
+    112: 'source',
+    113: 'asin',
+    503: 'updated_title'
+}
+# Tools whose paths are resolved by the workers of the server before the first
+# request, see IsbnServer
+_SERVER_TOOLS = ('7z', 'catdoc', 'ddjvu', 'djvused', 'djvutxt', 'ebook-convert',
+                 'ebook-meta', 'gs', 'mdls', 'pdfinfo', 'pdftotext', 'tesseract',
+                 'textutil')
+# Removes everything except numbers [0-9], 'x', and 'X' from the ISBN matches
+# NOTE: equivalent to UNIX command `tr -c -d '0-9xX'`
+_ISBN_DELETE_TABLE = str.maketrans(
+    '', '', string.printable[10:].replace('x', '').replace('X', ''))
+# Runs of characters (from a digit) long enough to contain a match of
+# ISBN_REGEX, see IsbnMatcher
+_ISBN_PREFILTER_REGEX = re.compile('[0-9][0-9xX-]{9,}')
+_ISBN_PREFILTER_BYTES_REGEX = re.compile(b'[0-9][0-9xX-]{9,}')
+# Bytes that can't be part of an ISBN match, a text can be split after them
+# without changing the matches
+_NON_ISBN_BYTES_REGEX = re.compile(b'[^0-9xX-]')
+# Size of the reads of the stdout of a converter, see search_converter_stream()
+_STREAM_CHUNK_SIZE = 64 * 1024
+
+
+# A backend of convert_to_txt() that converts the files whose MIME type matches
+# the regex `mime_types` to text, see register_converter(). `func` is called as
+#   func(input_file, output_file[, first_page, last_page][, run=run])
+# and returns a Result: the pages (1-based, inclusive) are only given to the
+# backends that can convert a range of pages (`pages`) and `run` (see
+# run_cmd()) to the command-line ones (not `in_process`). The cheapest
+# (`cost`) available backend is used by default, `available` is a function
+# that checks if the backend can be used, e.g. if its tool is installed.
+# With `stream`, the command-line backend writes the text on its stdout when
+# `output_file` is '-', see convert_stream().
+# The time limit of the stage (see get_stage_runner()) is enforced by `run` for
+# the command-line backends. The in-process ones with `timeout` are given
+# `check_timeout` (see get_timeout_checker()) to call between the pages, the
+# other ones (e.g. from plugins) run without time limit.
+class ConverterBackend:
+    def __init__(self, name, mime_types, func, cost, available,
+                 in_process=False, pages=False, stream=False, timeout=False):
+        self.name = name
+        self.mime_types = mime_types
+        self.func = func
+        self.cost = cost
+        self.available = available
+        self.in_process = in_process
+        self.pages = pages
+        self.stream = stream
+        self.timeout = timeout
+
+    def convert(self, input_file, output_file, first_page=None, last_page=None,
+                run=None):
+        args = [input_file, output_file]
+        if first_page or last_page:
+            args += [first_page, last_page]
+        if self.in_process and self.timeout:
+            return self.func(*args, check_timeout=get_timeout_checker(run))
+        if self.in_process:
+            return self.func(*args)
+        return self.func(*args, run=run)
+
+    # Converts the file with its text written on the stdout of the command
+    # which is given by chunks (bytes) to `stdout_callback`, see run_cmd()
+    def convert_stream(self, input_file, stdout_callback, run=None):
+        return self.func(input_file, '-',
+                         run=partial(run or run_cmd, stdout_callback=stdout_callback))
+
+    def handles(self, mime_type):
+        return re.match(self.mime_types, mime_type) is not None
+
+    def __repr__(self):
+        return f'ConverterBackend({self.name!r}, cost={self.cost})'
+
+
+# Searches texts for ISBNs with the compiled `isbn_regex` and
+# `isbn_blacklist_regex`, see find_isbns(). Use get_isbn_matcher() to reuse
+# the same matcher for the same regexes.
+# With the default ISBN_REGEX, a cheap prefilter first looks for runs of at
+# least 10 digits/hyphens and the full regex (with its costly look-behind) is
+# only run on those runs. The results are the same since every match of
+# ISBN_REGEX is within such a run and can't be next to a digit.
+class IsbnMatcher:
+    def __init__(self, isbn_regex=ISBN_REGEX,
+                 isbn_blacklist_regex=ISBN_BLACKLIST_REGEX):
+        self.isbn_regex = re.compile(isbn_regex)
+        self.isbn_blacklist_regex = re.compile(isbn_blacklist_regex)
+        if self.isbn_regex.pattern == ISBN_REGEX:
+            self.prefilter_regex = _ISBN_PREFILTER_REGEX
+        else:
+            self.prefilter_regex = None
+        # Bytes version of the regex to search bytes-like objects, e.g. a
+        # mmap of a text file (None if the regex can't be used on bytes)
+        try:
+            self.isbn_bytes_regex = re.compile(isbn_regex.encode())
+        except (re.error, UnicodeEncodeError):
+            self.isbn_bytes_regex = None
+
+    # Returns the new valid ISBNs found in `input_str` in the order they
+    # appear. Candidates that are in `seen` are skipped and the checked ones
+    # are added to it, thus a text can be searched piece by piece by sharing
+    # `seen` between calls.
+    # `input_str` can also be a bytes-like object (only the matches are
+    # decoded) and the search can be limited to `input_str[pos:endpos]`.
+    def findall(self, input_str, seen=None, pos=0, endpos=None):
+        seen = set() if seen is None else seen
+        debug = logger.isEnabledFor(logging.DEBUG)
+        candidates = []
+        for match in self.finditer(input_str, pos, endpos):
+            match = match.group()
+            if not isinstance(match, str):
+                match = match.decode('utf-8', errors='ignore')
+            match = match.translate(_ISBN_DELETE_TABLE)
+            # Only keep unique ISBNs
+            if match in seen:
+                if debug:
+                    logger.debug(f'Non-unique ISBN found: {match}')
+                continue
+            seen.add(match)
+            candidates.append(match)
+        isbns = []
+        # Validate ISBNs
+        for match, valid in zip(candidates, are_isbns_valid(candidates)):
+            if valid:
+                if self.isbn_blacklist_regex.match(match):
+                    if debug:
+                        logger.debug(f'Wrong ISBN (blacklisted): {match}')
+                else:
+                    if debug:
+                        logger.debug(f'Valid ISBN found: {match}')
+                    isbns.append(match)
+            elif debug:
+                logger.debug(f'Invalid ISBN found: {match}')
+        return isbns
+
+    # Iterates over the ISBN-like matches in `input_str[pos:endpos]`
+    def finditer(self, input_str, pos=0, endpos=None):
+        endpos = len(input_str) if endpos is None else endpos
+        if isinstance(input_str, str):
+            isbn_regex = self.isbn_regex
+            prefilter_regex = self.prefilter_regex
+        else:
+            isbn_regex = self.isbn_bytes_regex
+            prefilter_regex = self.prefilter_regex and _ISBN_PREFILTER_BYTES_REGEX
+        if prefilter_regex is None:
+            yield from isbn_regex.finditer(input_str, pos, endpos)
+            return
+        for run in prefilter_regex.finditer(input_str, pos, endpos):
+            # NOTE: with pos/endpos, the look-behind still sees the character
+            # before the run (not a digit) and the look-ahead sees the end
+            yield from isbn_regex.finditer(input_str, run.start(), run.end())
+
 
+# Per-step profile of search_file_for_isbns(), see its `profile` argument and
+# the `--profile` option of the script. For each searched file, a report
+# (dict) gives the resource usage of the whole search (`total`) and of each of
+# its steps (`steps`, see PROFILE_STEPS):
+# - `wall_time` and `cpu_time` (of this process) in seconds
+# - `children_cpu_time`: CPU time of the child processes (e.g. pdftotext)
+# - `read_bytes` and `write_bytes`: bytes read and written by this process
+#   (files and pipes, Linux only)
+# - `peak_rss` and `children_peak_rss`: peak memory in bytes (since the start
+#   of the process) at the end of the step
+# The reports are kept in `reports` and, with `report_file`, appended as JSON
+# lines to this file so that the worker processes of find_batch() can write
+# to the same report, see load_profile_reports().
+# NOTE: the files found within an archive are counted in its `archive` step
+# and the asyncio API isn't profiled
+class Profiler:
+    def __init__(self, report_file=None):
+        self.report_file = report_file
+        self.reports = []
+        self._report = None
+        self._step = None
 
+    @contextmanager
+    def file(self, file_path):
+        import json
+        if self._report is not None:
+            # e.g. a file within an archive
+            yield None
+            return
+        report = self._report = {'file': str(file_path), 'steps': {}}
+        start = _get_resource_usage()
+        try:
+            yield report
+        finally:
+            report['total'] = _get_resource_usage_delta(start)
+            self._report = None
+            self.reports.append(report)
+            if self.report_file:
+                # A single write of a whole line so that the lines of the
+                # worker processes are not interleaved
+                with open(self.report_file, 'a') as f:
+                    f.write(json.dumps(report) + '\n')
+
+    @contextmanager
+    def step(self, name):
+        if self._report is None or self._step is not None:
+            # No file being profiled or nested step
+            yield
+            return
+        self._step = name
+        start = _get_resource_usage()
+        try:
+            yield
+        finally:
+            usage = _get_resource_usage_delta(start)
+            self._step = None
+            steps = self._report['steps']
+            if name in steps:
+                # e.g. the epub is converted again after a failed direct search
+                for key, value in usage.items():
+                    if value is not None and key.endswith('peak_rss'):
+                        steps[name][key] = value
+                    elif value is not None:
+                        steps[name][key] += value
+            else:
+                steps[name] = usage
+
+
+# Persistent cache of the results of search_file_for_isbns() stored in a
+# SQLite database within `cache_dir`.
+# The results are keyed by the file content hash and a fingerprint of the
+# options that affect them, see get_options_fingerprint(). Both found ISBNs and
+# "no ISBN found" results are cached, except the ones of a search with a failed
+# or timed out stage (see _search_file_with_cache()). The least recently used
+# results are evicted when there are more than `max_entries` results.
+# NOTE: each process must use its own instance, see get_result_cache()
+class ResultCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES):
+        import sqlite3
+        os.makedirs(cache_dir, exist_ok=True)
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.db_path = os.path.join(cache_dir, 'results.sqlite3')
+        self._conn = sqlite3.connect(self.db_path, timeout=60)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        with self._conn:
+            # Avoid hashing again files that didn't change since the last run
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS files (
+                                  path TEXT PRIMARY KEY, size INTEGER,
+                                  mtime_ns INTEGER, inode INTEGER,
+                                  digest TEXT)""")
+            self._conn.execute("""CREATE TABLE IF NOT EXISTS results (
+                                  digest TEXT, fingerprint TEXT, isbns TEXT,
+                                  last_used REAL,
+                                  PRIMARY KEY (digest, fingerprint))""")
+            self._conn.execute("""CREATE INDEX IF NOT EXISTS results_last_used
+                                  ON results (last_used)""")
+        self._n_new_results = 0
+        self.evict()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        self._conn.close()
+
+    def evict(self):
+        n_entries = self._conn.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if n_entries <= self.max_entries:
+            return 0
+        # Evict a bit more than needed so that we don't evict after each insert
+        n_evicted = n_entries - int(self.max_entries * 0.9)
+        logger.debug(f'Evicting {n_evicted} results from the cache')
+        with self._conn:
+            self._conn.execute("""DELETE FROM results WHERE rowid IN (
+                                  SELECT rowid FROM results
+                                  ORDER BY last_used LIMIT ?)""", (n_evicted,))
+            self._conn.execute("""DELETE FROM files WHERE digest NOT IN (
+                                  SELECT digest FROM results)""")
+        return n_evicted
+
+    # Returns the list of cached ISBNs (empty if no ISBN was found) or None if
+    # the file was never searched with these options
+    def get(self, digest, fingerprint):
+        row = self._conn.execute('SELECT isbns FROM results WHERE digest = ? '
+                                 'AND fingerprint = ?',
+                                 (digest, fingerprint)).fetchone()
+        if row is None:
+            return None
+        with self._conn:
+            self._conn.execute('UPDATE results SET last_used = ? WHERE digest = ? '
+                               'AND fingerprint = ?',
+                               (time.time(), digest, fingerprint))
+        return row[0].split('\n') if row[0] else []
+
+    def get_file_digest(self, file_path):
+        file_path = os.path.abspath(file_path)
+        stat = os.stat(file_path)
+        row = self._conn.execute('SELECT size, mtime_ns, inode, digest FROM files '
+                                 'WHERE path = ?', (file_path,)).fetchone()
+        if row and tuple(row[:3]) == (stat.st_size, stat.st_mtime_ns, stat.st_ino):
+            return row[3]
+        digest = get_file_hash(file_path)
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?)',
+                               (file_path, stat.st_size, stat.st_mtime_ns,
+                                stat.st_ino, digest))
+        return digest
+
+    def set(self, digest, fingerprint, isbns):
+        with self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)',
+                               (digest, fingerprint, '\n'.join(isbns), time.time()))
+        self._n_new_results += 1
+        if self._n_new_results % 1000 == 0:
+            self.evict()
+
+
+# Result of a command, see run_cmd(). The stdout and stderr can be given as raw
+# bytes and are only decoded (UTF-8) when they are accessed.
 class Result:
     def __init__(self, stdout='', stderr='', returncode=None, args=None):
         self.stdout = stdout
@@ -73,6 +571,34 @@ class Result:
         self.returncode = returncode
         self.args = args
 
+    @property
+    def stdout(self):
+        if isinstance(self._stdout, bytes):
+            self._stdout = self._stdout.decode('utf-8', errors='replace')
+        return self._stdout
+
+    @stdout.setter
+    def stdout(self, value):
+        self._stdout = value
+
+    @property
+    def stderr(self):
+        if isinstance(self._stderr, bytes):
+            self._stderr = self._stderr.decode('utf-8', errors='replace')
+        return self._stderr
+
+    @stderr.setter
+    def stderr(self, value):
+        self._stderr = value
+
+    # Returns the stdout converted with `type_` (e.g. int) or None if it can't
+    # be converted
+    def parse_stdout(self, type_=int):
+        try:
+            return type_(self.stdout.strip())
+        except (AttributeError, TypeError, ValueError):
+            return None
+
     def __repr__(self):
         return self.__str__()
 
@@ -82,6 +608,634 @@ class Result:
                f'returncode={self.returncode}, args={self.args}'
 
 
+# Server that searches files or strings for ISBNs sent over the Unix socket
+# `socket_path`, see serve(). A pool of `jobs` worker processes is started once
+# and stays warm: the regexes are compiled and the tool paths resolved before
+# the first request, thus the latency of a small file is the one of its search.
+#
+# Protocol: a client sends requests, one per line, and gets a JSON object per
+# request (on a line) in the same order. A request is a path or a string, or a
+# JSON object {"input": ..., "id": ...} whose "id" is sent back. The responses
+# are the ones of find_stream(), e.g.
+#   {"input": "book.pdf", "isbns": ["9780306406157"], "stage": "text", "elapsed_ms": 52.1}
+# or have an 'error' if the request can't be searched.
+#
+# At most `max_in_flight` requests (by default 4 by worker) are searched or
+# queued at once, the connections beyond wait for a free slot. drain() stops
+# the server gracefully: no connection is accepted anymore, the requests in
+# flight are finished (the searches still running after `drain_timeout` are
+# killed) and the requests received afterwards get an error.
+class IsbnServer:
+    def __init__(self, socket_path, jobs=JOBS, max_in_flight=SERVER_MAX_IN_FLIGHT,
+                 drain_timeout=SERVER_DRAIN_TIMEOUT, **kwargs):
+        kwargs.pop('input_data', None)
+        self.socket_path = socket_path
+        self.jobs = max(1, jobs or JOBS)
+        self.max_in_flight = max_in_flight or self.jobs * 4
+        self.drain_timeout = drain_timeout
+        kwargs['ocr_jobs'] = _get_worker_ocr_jobs(self.jobs, kwargs.get('ocr_jobs'))
+        self.kwargs = kwargs
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._draining = threading.Event()
+        self._threads = set()
+        self._executor = None
+        # The PIDs of the workers, reported by _init_server_worker()
+        self._pid_queue = None
+        self._worker_pids = set()
+
+    def drain(self):
+        self._draining.set()
+
+    def serve_forever(self):
+        import multiprocessing
+        import socket
+        from concurrent.futures import ProcessPoolExecutor
+        _remove_stale_socket(self.socket_path)
+        self._pid_queue = multiprocessing.Queue()
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.jobs, initializer=_init_server_worker,
+            initargs=(self.kwargs, self._pid_queue))
+        try:
+            # Start all the workers now rather than at the first requests
+            for future in [self._executor.submit(os.getpid) for _ in range(self.jobs)]:
+                future.result()
+            with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+                sock.bind(self.socket_path)
+                try:
+                    sock.listen()
+                    # To check regularly if the server is draining
+                    sock.settimeout(0.2)
+                    logger.info(f'Listening on {self.socket_path} with {self.jobs} '
+                                f'worker{"s" if self.jobs > 1 else ""}')
+                    while not self._draining.is_set():
+                        try:
+                            conn, _ = sock.accept()
+                        except socket.timeout:
+                            continue
+                        thread = threading.Thread(target=self._handle_connection,
+                                                  args=(conn,), daemon=True)
+                        self._threads.add(thread)
+                        thread.start()
+                finally:
+                    remove_file(self.socket_path)
+            logger.info('Draining the requests in flight...')
+            self._wait_for_connections()
+        finally:
+            self._executor.shutdown(wait=True)
+            self._pid_queue.close()
+
+    def _wait_for_connections(self):
+        deadline = None if self.drain_timeout is None \
+            else time.monotonic() + self.drain_timeout
+        for thread in list(self._threads):
+            thread.join(None if deadline is None
+                        else max(0, deadline - time.monotonic()))
+        if any(thread.is_alive() for thread in self._threads):
+            logger.warning(yellow('The drain timeout expired, the searches still '
+                                  'running are killed'))
+            # The workers kill the process groups of their tools, see
+            # _init_server_worker()
+            for pid in self._get_worker_pids():
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+            for thread in list(self._threads):
+                thread.join(1)
+
+    # Returns the PIDs of the workers started so far (the executor starts them
+    # on demand)
+    def _get_worker_pids(self):
+        import queue
+        while True:
+            try:
+                self._worker_pids.add(self._pid_queue.get_nowait())
+            except queue.Empty:
+                return self._worker_pids
+
+    def _handle_connection(self, conn):
+        import json
+        import socket
+        buffer = b''
+        try:
+            with conn:
+                conn.settimeout(0.2)
+                while True:
+                    if b'\n' not in buffer:
+                        try:
+                            data = conn.recv(65536)
+                        except socket.timeout:
+                            if self._draining.is_set() and not buffer:
+                                break
+                            continue
+                        if not data:
+                            break
+                        buffer += data
+                        continue
+                    line, buffer = buffer.split(b'\n', 1)
+                    line = line.decode('utf-8', errors='replace').strip()
+                    if line:
+                        response = self._handle_request(line)
+                        conn.settimeout(None)
+                        conn.sendall(json.dumps(response).encode() + b'\n')
+                        conn.settimeout(0.2)
+        except OSError as e:
+            # e.g. the client closed the connection before the response
+            logger.debug(f'Connection error: {e}')
+        finally:
+            self._threads.discard(threading.current_thread())
+
+    def _handle_request(self, line):
+        import json
+        request = {'input': line}
+        if line.startswith('{'):
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                return {'input': None, 'isbns': [], 'error': f'invalid request: {e}'}
+        response = {'id': request['id']} if 'id' in request else {}
+        if not isinstance(request.get('input'), str):
+            response.update(input=None, isbns=[],
+                            error="invalid request: 'input' must be a string")
+            return response
+        if not self._acquire_slot():
+            response.update(input=request['input'], isbns=[],
+                            error='the server is shutting down')
+            return response
+        try:
+            future = self._executor.submit(_find_stream_worker, request['input'],
+                                           self.kwargs)
+            response.update(future.result())
+        except SystemExit:
+            # See _exit_server_worker()
+            response.update(input=request['input'], isbns=[],
+                            error='the search was killed after the drain timeout')
+        except Exception as e:
+            # e.g. BrokenProcessPool
+            response.update(input=request['input'], isbns=[],
+                            error=str(e) or type(e).__name__)
+        finally:
+            self._slots.release()
+        return response
+
+    # Waits for a free slot, returns False if the server is stopped meanwhile
+    def _acquire_slot(self):
+        while not self._draining.is_set():
+            if self._slots.acquire(timeout=0.2):
+                return True
+        return False
+
+
+# Scratch workspace of the search of a file (see search_file_for_isbns()): a
+# directory created on first use under `scratch_dir` (the default temp dir if
+# None) and shared by all the stages, e.g. for the .txt of the conversion, the
+# archives extracted by 7z and the members of the zip/tar archives (with the
+# files within them). The page images of the OCR, which are written once and
+# read once, go to a directory under `ocr_scratch_dir` (e.g. RAM-backed
+# /dev/shm) unless it is the same location.
+# The files are named after a counter within these private directories, thus no
+# file descriptor is opened (unlike tempfile.mkstemp()), and everything is
+# removed by cleanup() at the end of the with block, also after an error or a
+# timeout. account() measures the size of the workspace and keeps its peak.
+class ScratchWorkspace:
+    def __init__(self, scratch_dir=SCRATCH_DIR, ocr_scratch_dir=OCR_SCRATCH_DIR):
+        self.scratch_dir = scratch_dir
+        self.ocr_scratch_dir = ocr_scratch_dir
+        self.peak_size = 0
+        self._dirs = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cleanup()
+
+    # Returns the size in bytes of the files in the workspace
+    def account(self):
+        size = 0
+        for path in list(self._dirs.values()):
+            for dirpath, _, files in os.walk(path):
+                for name in files:
+                    try:
+                        size += os.lstat(os.path.join(dirpath, name)).st_size
+                    except OSError:
+                        # e.g. removed by another OCR thread
+                        pass
+        self.peak_size = max(self.peak_size, size)
+        return size
+
+    def cleanup(self):
+        with self._lock:
+            dirs = list(self._dirs.values())
+            self._dirs.clear()
+        for path in dirs:
+            logger.debug(f"Removing the scratch workspace '{path}' (peak size: "
+                         f"{self.peak_size} bytes)")
+            remove_tree(path)
+
+    # Returns the directory of the workspace (with `images`, the one of the page
+    # images), it is created on first use
+    def get_dir(self, images=False):
+        import tempfile
+        root = (images and self.ocr_scratch_dir) or self.scratch_dir \
+            or tempfile.gettempdir()
+        with self._lock:
+            if root not in self._dirs:
+                self._dirs[root] = tempfile.mkdtemp(prefix='find_isbns-', dir=root)
+            return self._dirs[root]
+
+    # Creates a new subdirectory, e.g. for the files extracted from an archive
+    def mkdir(self, images=False):
+        path = self.new_path(images=images)
+        os.mkdir(path)
+        return path
+
+    # Returns the path of a new file in the workspace (the file isn't created)
+    def new_path(self, suffix='', images=False):
+        return os.path.join(self.get_dir(images), f'{next(self._counter)}{suffix}')
+
+
+# Raised when a stage of search_file_for_isbns() (e.g. 'convert') takes longer
+# than its timeout or when the time budget of the file is used up
+class StageTimeoutError(Exception):
+    def __init__(self, stage, timeout):
+        self.stage = stage
+        self.timeout = timeout
+        super().__init__(f"the stage '{stage}' was cut off after {timeout:.1f} s")
+
+
+# Searches the text that a converter writes on its stdout (see
+# search_converter_stream()) for ISBNs as it is received, in the same order
+# as find_isbns_in_file() with `isbn_reorder_files`: the first lines are
+# searched right away, the last lines are kept to be searched in reverse at
+# the end and the lines in between (the middle) are searched as soon as they
+# can't be among the last ones. feed() returns True (the converter can be
+# stopped) once the first lines are searched and contain ISBNs or, without
+# `isbn_reorder_files`, as soon as a chunk contains ISBNs.
+class _TextStreamSearch:
+    def __init__(self, matcher, isbn_reorder_files=ISBN_REORDER_FILES):
+        self.matcher = matcher
+        if isbn_reorder_files:
+            self.scan_first, self.reverse_last = [int(i) for i in isbn_reorder_files]
+        else:
+            self.scan_first, self.reverse_last = None, 0
+        self.num_lines = 0
+        self.seen = set()
+        # The middle is searched before the last lines are known, see close()
+        self.middle_seen = None
+        self.first_isbns = []
+        self.middle_isbns = []
+        self.last_lines = deque()
+        self.has_text = False
+        self.stopped = False
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self._carry = b''
+
+    def feed(self, data):
+        if self.stopped:
+            return True
+        block = self._carry + data
+        if b'\n' not in data and len(block) < _STREAM_CHUNK_SIZE:
+            # Wait for the end of the line, only the lines longer than the
+            # chunk size are searched by pieces
+            self._carry = block
+            return False
+        block, self._carry = _split_text_block(block, _STREAM_CHUNK_SIZE)
+        self._search(self._decoder.decode(block))
+        return self.stopped
+
+    # Returns the ISBNs found in the text
+    def close(self):
+        if not self.stopped:
+            self._search(self._decoder.decode(self._carry, final=True))
+        if self.stopped:
+            return self.first_isbns
+        if self.last_lines and not self.last_lines[-1].endswith('\n'):
+            # Not joined with the line before once reversed
+            self.last_lines[-1] += '\n'
+        last_isbns = self.matcher.findall(''.join(reversed(self.last_lines)), self.seen)
+        middle_isbns = [isbn for isbn in self.middle_isbns if isbn not in last_isbns]
+        return self.first_isbns + last_isbns + middle_isbns
+
+    def _search(self, text):
+        if not text:
+            return
+        self.has_text = self.has_text or re.search('[A-Za-z0-9]', text) is not None
+        if self.scan_first is None:
+            self.first_isbns.extend(self.matcher.findall(text, self.seen))
+            self.stopped = bool(self.first_isbns)
+            return
+        # NOTE: only '\n' ends a line like in iter_file_content(), e.g. not the
+        # form feeds between the pages of pdftotext
+        lines = re.findall('[^\n]*\n|[^\n]+', text)
+        if self.num_lines < self.scan_first:
+            first_lines = lines[:self.scan_first - self.num_lines]
+            del lines[:len(first_lines)]
+            self.num_lines += len(first_lines)
+            self.first_isbns.extend(self.matcher.findall(''.join(first_lines), self.seen))
+            if self.num_lines < self.scan_first:
+                return
+            if self.first_isbns:
+                self.stopped = True
+                return
+        self.last_lines.extend(lines)
+        middle = [self.last_lines.popleft()
+                  for _ in range(len(self.last_lines) - self.reverse_last)]
+        if middle:
+            if self.middle_seen is None:
+                self.middle_seen = set(self.seen)
+            self.middle_isbns.extend(self.matcher.findall(''.join(middle), self.middle_seen))
+
+
+# Reads the objects of a pdf file by their numbers from its cross-reference
+# tables or streams (following the previous sections of the updated files),
+# only the needed bytes are read. The objects can be in object streams. Used by
+# read_ebook_metadata().
+# Ref.: PDF 1.7 (ISO 32000-1), section 7.5
+class _PdfObjects:
+    def __init__(self, f):
+        self.f = f
+        self.size = os.fstat(f.fileno()).st_size
+        # Most recent first: ('table', entries offset, first object, count)
+        # or ('stream', {object number: entry})
+        self.sections = []
+        self.trailer = b''
+        f.seek(max(0, self.size - 1024))
+        startxrefs = re.findall(rb'startxref\s+(\d+)', f.read())
+        if not startxrefs:
+            raise ValueError('startxref not found')
+        offset = int(startxrefs[-1])
+        seen = set()
+        while offset is not None and offset not in seen:
+            seen.add(offset)
+            f.seek(offset)
+            if f.read(4) == b'xref':
+                trailer = self._read_xref_table(offset + 4)
+            else:
+                trailer = self._read_xref_stream(offset)
+            self.trailer = self.trailer or trailer
+            # Hybrid files also have a cross-reference stream
+            xref_stream = _get_pdf_int(trailer, b'XRefStm')
+            if xref_stream is not None and xref_stream not in seen:
+                seen.add(xref_stream)
+                self._read_xref_stream(xref_stream)
+            offset = _get_pdf_int(trailer, b'Prev')
+
+    # Returns the dictionary (or other value) and the raw stream (None if not
+    # a stream) of the object `num`
+    def get_object(self, num):
+        entry = self._find_entry(num)
+        if entry is None:
+            raise ValueError(f'object {num} not found')
+        if entry[0] == 'compressed':
+            return self._get_compressed_object(*entry[1:]), None
+        return self._read_object_at(entry[1])
+
+    # Returns the decoded data of the stream object `num`
+    def get_stream(self, num):
+        obj, stream = self.get_object(num)
+        if stream is None:
+            raise ValueError(f'object {num} is not a stream')
+        return _decode_pdf_stream(obj, stream)
+
+    def _find_entry(self, num):
+        for section in self.sections:
+            if section[0] == 'table':
+                _, entries_offset, first, count = section
+                if first <= num < first + count:
+                    self.f.seek(entries_offset + (num - first) * 20)
+                    match = re.match(rb'(\d{10}) \d{5} ([nf])', self.f.read(20))
+                    if match is None:
+                        raise ValueError(f'invalid xref entry for the object {num}')
+                    return ('offset', int(match.group(1))) if match.group(2) == b'n' else None
+            elif num in section[1]:
+                return section[1][num]
+        return None
+
+    def _get_compressed_object(self, stream_num, index):
+        obj, stream = self.get_object(stream_num)
+        data = _decode_pdf_stream(obj, stream)
+        num_objects = _get_pdf_int(obj, b'N')
+        first = _get_pdf_int(obj, b'First')
+        if num_objects is None or first is None or index >= num_objects:
+            raise ValueError(f'invalid object stream {stream_num}')
+        offsets = [int(value) for value in data[:first].split()[1:2 * num_objects:2]]
+        end = offsets[index + 1] if index + 1 < len(offsets) else len(data) - first
+        return data[first + offsets[index]:first + end]
+
+    # Returns the dictionary (or other value) and the raw stream (None if not a
+    # stream) of the object defined at `offset`
+    def _read_object_at(self, offset):
+        self.f.seek(offset)
+        data = b''
+        while len(data) < _METADATA_MAX_READ_SIZE:
+            chunk = self.f.read(4096)
+            data += chunk
+            match = re.search(rb'endobj|(?<!end)stream(\r\n|\n|\r)', data)
+            if match or not chunk:
+                break
+        else:
+            raise ValueError(f'object at {offset} too big')
+        start = re.match(rb'\s*\d+\s+\d+\s+obj', data)
+        if start is None or match is None:
+            raise ValueError(f'no object at {offset}')
+        obj = data[start.end():match.start()]
+        if match.group() == b'endobj':
+            return obj, None
+        length = _get_pdf_int(obj, b'Length')
+        if length is None:
+            length_ref = _get_pdf_ref(obj, b'Length')
+            if length_ref is None:
+                raise ValueError(f'no stream length at {offset}')
+            length = int(self.get_object(length_ref)[0])
+        if length > _METADATA_MAX_READ_SIZE * 16:
+            raise ValueError(f'stream at {offset} too big')
+        self.f.seek(offset + match.end())
+        return obj, self.f.read(length)
+
+    # Records the subsections of the table and returns the trailer dictionary
+    def _read_xref_table(self, offset):
+        while True:
+            self.f.seek(offset)
+            data = self.f.read(64)
+            match = re.match(rb'\s*(\d+)\s+(\d+)[ \t]*(?:\r\n|\r|\n)', data)
+            if match is None:
+                break
+            first, count = int(match.group(1)), int(match.group(2))
+            self.sections.append(('table', offset + match.end(), first, count))
+            # The entries are 20 bytes long
+            offset += match.end() + count * 20
+        if not re.match(rb'\s*trailer', data):
+            raise ValueError(f'trailer not found at {offset}')
+        self.f.seek(offset)
+        trailer = self.f.read(4096)
+        return trailer[:trailer.find(b'startxref')] if b'startxref' in trailer else trailer
+
+    # Records the entries of the stream and returns its dictionary (also the
+    # trailer)
+    def _read_xref_stream(self, offset):
+        obj, stream = self._read_object_at(offset)
+        if stream is None:
+            raise ValueError(f'no xref stream at {offset}')
+        data = _decode_pdf_stream(obj, stream)
+        widths = re.search(rb'/W\s*\[\s*(\d+)\s+(\d+)\s+(\d+)\s*\]', obj)
+        if widths is None:
+            raise ValueError(f'invalid xref stream at {offset}')
+        widths = [int(width) for width in widths.groups()]
+        index = re.search(rb'/Index\s*\[([\d\s]*)\]', obj)
+        index = [int(value) for value in index.group(1).split()] if index \
+            else [0, _get_pdf_int(obj, b'Size') or 0]
+        entries = {}
+        pos = 0
+        for first, count in zip(index[::2], index[1::2]):
+            for num in range(first, first + count):
+                fields = []
+                for width in widths:
+                    fields.append(int.from_bytes(data[pos:pos + width], 'big'))
+                    pos += width
+                # The type is 1 if its width is 0
+                type_ = fields[0] if widths[0] else 1
+                if type_ == 1:
+                    entries[num] = ('offset', fields[1])
+                elif type_ == 2:
+                    entries[num] = ('compressed', fields[1], fields[2])
+                else:
+                    entries[num] = None
+        self.sections.append(('stream', entries))
+        return obj
+
+
+# Returns the data of a pdf stream decoded with its /Filter (only FlateDecode
+# is supported) and PNG predictors (/DecodeParms)
+def _decode_pdf_stream(obj, stream):
+    filters = re.search(rb'/Filter\s*(\[[^\]]*\]|/\w+)', obj)
+    filters = re.findall(rb'/(\w+)', filters.group(1)) if filters else []
+    if filters not in ([], [b'FlateDecode']):
+        raise ValueError(f'unsupported stream filter {filters}')
+    data = zlib.decompress(stream) if filters else stream
+    predictor = _get_pdf_int(obj, b'Predictor') or 1
+    if predictor >= 10:
+        data = _undo_png_predictor(data, _get_pdf_int(obj, b'Columns') or 1)
+    elif predictor != 1:
+        raise ValueError(f'unsupported predictor {predictor}')
+    return data
+
+
+# Returns the integer value of `key` in a pdf dictionary (None if missing or if
+# it is an indirect reference)
+def _get_pdf_int(obj, key):
+    match = re.search(rb'/' + key + rb'(?![\w.])\s*(\d+)(?!\s+\d+\s+R)\b', obj)
+    return int(match.group(1)) if match else None
+
+
+# Returns the object number of the indirect reference `key` in a pdf dictionary
+def _get_pdf_ref(obj, key):
+    match = re.search(rb'/' + key + rb'(?![\w.])\s*(\d+)\s+\d+\s+R', obj)
+    return int(match.group(1)) if match else None
+
+
+# Returns the texts of the identifier-like fields (see _XMP_FIELDS) of an XMP
+# packet, as elements or attributes
+def _get_xmp_fields(xmp):
+    from xml.etree import ElementTree
+    try:
+        root = ElementTree.fromstring(xmp)
+    except ElementTree.ParseError:
+        # e.g. a truncated packet, its text is searched as is
+        return [re.sub(r'<[^>]*>', ' ', xmp.decode('utf-8', errors='replace'))]
+    fields = []
+    for element in root.iter():
+        if not isinstance(element.tag, str):
+            continue
+        # e.g. dc:description but not the rdf:Description containers
+        if element.tag.rsplit('}', 1)[-1].lower() in _XMP_FIELDS \
+                and not element.tag.startswith('{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'):
+            fields.append(' '.join(text.strip() for text in element.itertext()))
+        fields.extend(value for name, value in element.attrib.items()
+                      if name.rsplit('}', 1)[-1].lower() in _XMP_FIELDS)
+    return fields
+
+
+# Iterates over the (decoded) literal and hexadecimal strings of a pdf object
+def _iter_pdf_strings(obj):
+    escapes = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'\b', b'f': b'\f'}
+    pos = 0
+    while pos < len(obj):
+        if obj.startswith(b'<<', pos) or obj.startswith(b'>>', pos):
+            pos += 2
+        elif obj.startswith(b'<', pos):
+            end = obj.find(b'>', pos)
+            end = len(obj) if end == -1 else end
+            hex_string = re.sub(rb'[^0-9A-Fa-f]', b'', obj[pos + 1:end])
+            yield _decode_pdf_string(bytes.fromhex(
+                (hex_string + b'0' * (len(hex_string) % 2)).decode()))
+            pos = end + 1
+        elif obj.startswith(b'(', pos):
+            string = bytearray()
+            depth = 1
+            pos += 1
+            while pos < len(obj) and depth:
+                char = obj[pos:pos + 1]
+                pos += 1
+                if char == b'\\':
+                    octal = re.match(rb'[0-7]{1,3}', obj[pos:pos + 3])
+                    if octal:
+                        string.append(int(octal.group(), 8) & 0xFF)
+                        pos += octal.end()
+                    else:
+                        char = obj[pos:pos + 1]
+                        pos += 1
+                        if char == b'\r' and obj.startswith(b'\n', pos):
+                            pos += 1
+                        if char not in b'\r\n':
+                            string += escapes.get(char, char)
+                    continue
+                depth += {b'(': 1, b')': -1}.get(char, 0)
+                if depth:
+                    string += char
+            yield _decode_pdf_string(bytes(string))
+        else:
+            pos += 1
+
+
+# The pdf text strings are in UTF-16BE (with a BOM) or in PDFDocEncoding (about
+# Latin-1)
+def _decode_pdf_string(string):
+    if string.startswith(b'\xfe\xff'):
+        return string[2:].decode('utf-16-be', errors='replace')
+    return string.decode('latin-1')
+
+
+# Undoes the PNG predictors (one filter type byte by row) of a pdf stream
+def _undo_png_predictor(data, columns):
+    rows = []
+    prior = bytearray(columns)
+    for pos in range(0, len(data), columns + 1):
+        filter_type = data[pos]
+        row = bytearray(data[pos + 1:pos + 1 + columns])
+        for i in range(len(row)):
+            left = row[i - 1] if i else 0
+            up = prior[i]
+            if filter_type == 1:
+                row[i] = (row[i] + left) & 0xFF
+            elif filter_type == 2:
+                row[i] = (row[i] + up) & 0xFF
+            elif filter_type == 3:
+                row[i] = (row[i] + (left + up) // 2) & 0xFF
+            elif filter_type == 4:
+                up_left = prior[i - 1] if i else 0
+                estimate = left + up - up_left
+                distances = (abs(estimate - left), abs(estimate - up), abs(estimate - up_left))
+                row[i] = (row[i] + (left, up, up_left)[distances.index(min(distances))]) & 0xFF
+            elif filter_type != 0:
+                raise ValueError(f'invalid PNG filter type {filter_type}')
+        rows.append(bytes(row))
+        prior = row
+    return b''.join(rows)
+
+
 # ------
 # Colors
 # ------
@@ -138,134 +1292,165 @@ def yellow(msg):
     return color(msg)
 
 
-def catdoc(input_file, output_file):
-    cmd = f'catdoc "{input_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    # Everything on the stdout must be copied to the output file
-    if result.returncode == 0:
-        with open(output_file, 'w') as f:
-            f.write(result.stdout)
-    return convert_result_from_shell_cmd(result)
+# Same as is_isbn_valid() but for a list of ISBNs (without whitespaces and '-')
+# and returns a list of booleans. Above `min_batch_size` ISBNs, the checksums
+# are computed with NumPy (if installed) over a matrix of digits.
+def are_isbns_valid(isbns, min_batch_size=ISBN_BATCH_MIN_SIZE):
+    np = _get_numpy() if len(isbns) >= min_batch_size else None
+    if np is None:
+        return [is_isbn_valid(isbn) for isbn in isbns]
+    # NOTE: the non-ASCII ISBNs (e.g. other digits with a custom regex) are
+    # validated one at a time
+    valid = [not isbn.isascii() and is_isbn_valid(isbn) for isbn in isbns]
+    for length in (10, 13):
+        indexes = [i for i, isbn in enumerate(isbns)
+                   if len(isbn) == length and isbn.isascii()]
+        if not indexes:
+            continue
+        data = ''.join(isbns[i] for i in indexes).upper().encode('ascii')
+        chars = np.frombuffer(data, dtype=np.uint8).reshape(len(indexes), length)
+        digits = chars.astype(np.int16) - ord('0')
+        is_digit = (digits >= 0) & (digits <= 9)
+        if length == 10:
+            # Case 1: ISBN-10 (the check digit can be 'X')
+            is_x = chars[:, 9] == ord('X')
+            digits[:, 9] = np.where(is_x, 10, digits[:, 9])
+            is_digit[:, 9] |= is_x
+            checksum_ok = digits @ np.arange(10, 0, -1) % 11 == 0
+            prefix_ok = True
+        else:
+            # Case 2: ISBN-13 (978 or 979 prefix)
+            checksum_ok = digits @ np.array([1, 3] * 6 + [1]) % 10 == 0
+            prefix_ok = (chars[:, 0] == ord('9')) & (chars[:, 1] == ord('7')) & \
+                        ((chars[:, 2] == ord('8')) | (chars[:, 2] == ord('9')))
+        results = is_digit.all(axis=1) & prefix_ok & checksum_ok
+        for i, result in zip(indexes, results.tolist()):
+            valid[i] = result
+    return valid
 
 
-# Ref.: https://stackoverflow.com/a/28909933
-def command_exists(cmd):
-    return shutil.which(cmd) is not None
+# Returns the numpy module or None if it isn't installed (optional dependency)
+@lru_cache(maxsize=None)
+def _get_numpy():
+    try:
+        import numpy
+    except ImportError:
+        logger.debug('numpy is not installed, ISBNs are validated one at a time')
+        return None
+    return numpy
 
 
-def convert_result_from_shell_cmd(old_result):
-    new_result = Result()
+def catdoc(input_file, output_file, run=None):
+    # Everything on the stdout must be copied to the output file
+    return (run or run_cmd)(['catdoc', input_file],
+                            stdout_file=None if output_file == '-' else output_file)
 
-    for attr_name, new_val in new_result.__dict__.items():
-        old_val = getattr(old_result, attr_name)
-        if old_val is None:
-            shell_args = getattr(old_result, 'args', None)
-            # logger.debug(f'result.{attr_name} is None. Shell args: {shell_args}')
-        else:
-            if isinstance(new_val, str):
-                try:
-                    new_val = old_val.decode('UTF-8')
-                except (AttributeError, UnicodeDecodeError) as e:
-                    if type(e) == UnicodeDecodeError:
-                        # old_val = b'...'
-                        new_val = old_val.decode('unicode_escape')
-                    else:
-                        # `old_val` already a string
-                        # logger.debug('Error decoding old value: {}'.format(old_val))
-                        # logger.debug(e.__repr__())
-                        # logger.debug('Value already a string. No decoding necessary')
-                        new_val = old_val
-                try:
-                    new_val = ast.literal_eval(new_val)
-                except (SyntaxError, ValueError) as e:
-                    # NOTE: ValueError might happen if value consists of [A-Za-z]
-                    # logger.debug('Error evaluating the value: {}'.format(old_val))
-                    # logger.debug(e.__repr__())
-                    # logger.debug('Aborting evaluation of string. Will consider
-                    # the string as it is')
-                    pass
-            else:
-                new_val = old_val
-        setattr(new_result, attr_name, new_val)
-    return new_result
+
+# Returns the optional module `name` (e.g. 'pypdf') or None if it isn't
+# installed, see the in-process converter backends
+@lru_cache(maxsize=None)
+def _import_optional(name):
+    import importlib
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+# Ref.: https://stackoverflow.com/a/28909933
+def command_exists(cmd):
+    return get_tool_path(cmd) is not None
 
 
-# Tries to convert the supplied ebook file into .txt. It uses calibre's
-# ebook-convert tool. For optimization, if present, it will use pdftotext
-# for pdfs, catdoc for word files and djvutxt for djvu files.
+# Tries to convert the supplied ebook file into .txt with the converter
+# backend chosen for its MIME type (see get_converter()): by default the
+# cheapest available one, e.g. epubtxt for epubs, pdftotext (or an in-process
+# backend) for pdfs, catdoc for word files and djvutxt for djvu files, else
+# calibre's ebook-convert.
 # Ref.: https://bit.ly/2HXdf2I
 def convert_to_txt(input_file, output_file, mime_type,
                    djvu_convert_method=DJVU_CONVERT_METHOD,
                    epub_convert_method=EPUB_CONVERT_METHOD,
                    msword_convert_method=MSWORD_CONVERT_METHOD,
-                   pdf_convert_method=PDF_CONVERT_METHOD, **kwargs):
-    if mime_type.startswith('image/vnd.djvu') \
-         and djvu_convert_method == 'djvutxt' and command_exists('djvutxt'):
-        logger.debug('The file looks like a djvu, using djvutxt to extract the text')
-        result = djvutxt(input_file, output_file)
-    elif mime_type.startswith('application/epub+zip') \
-            and epub_convert_method == 'epubtxt' and command_exists('unzip'):
-        logger.debug('The file looks like an epub, using epubtxt to extract the text')
-        result = epubtxt(input_file, output_file)
-    elif mime_type == 'application/msword' \
-            and msword_convert_method in ['catdoc', 'textutil'] \
-            and (command_exists('catdoc') or command_exists('textutil')):
-        msg = 'The file looks like a doc, using {} to extract the text'
-        if command_exists('catdoc'):
-            logger.debug(msg.format('catdoc'))
-            result = catdoc(input_file, output_file)
+                   pdf_convert_method=PDF_CONVERT_METHOD, run=None, **kwargs):
+    converter = get_converter(mime_type, get_convert_method(
+        mime_type, djvu_convert_method, epub_convert_method, msword_convert_method,
+        pdf_convert_method))
+    if converter is None:
+        if mime_type.startswith('image/') and not mime_type.startswith('image/vnd.djvu'):
+            msg = f'The file looks like a normal image ({mime_type}), skipping ' \
+                  'ebook-convert usage!'
         else:
-            logger.debug(msg.format('textutil'))
-            result = textutil(input_file, output_file)
-    elif mime_type == 'application/pdf' and pdf_convert_method == 'pdftotext' \
-            and command_exists('pdftotext'):
-        logger.debug('The file looks like a pdf, using pdftotext to extract the text')
-        result = pdftotext(input_file, output_file)
-    elif (not mime_type.startswith('image/vnd.djvu')) \
-            and mime_type.startswith('image/'):
-        msg = f'The file looks like a normal image ({mime_type}), skipping ' \
-              'ebook-convert usage!'
+            msg = f'No converter available for the {mime_type} file'
         logger.debug(msg)
-        return convert_result_from_shell_cmd(Result(stderr=msg, returncode=1))
-    else:
-        logger.debug(f"Trying to use calibre's ebook-convert to convert the {mime_type} file to .txt")
-        result = ebook_convert(input_file, output_file)
-    return result
+        return Result(stderr=msg, returncode=1)
+    logger.debug(f'Converting the {mime_type} file to .txt with {converter.name}')
+    return converter.convert(input_file, output_file, run=run)
+
 
+# Same as convert_to_txt() but with asyncio: the command-line backends are run
+# with `run` (see run_cmd_async()) and the in-process ones in the default
+# executor of the event loop (with the time limit of `run`, see
+# get_timeout_checker())
+async def convert_to_txt_async(input_file, output_file, mime_type, run, first_page=None,
+                               last_page=None, converter=None, **kwargs):
+    import asyncio
+    converter = converter or get_converter(mime_type, get_convert_method(mime_type, **kwargs))
+    if converter is None:
+        # The same "no converter" result as convert_to_txt()
+        return convert_to_txt(input_file, output_file, mime_type, **kwargs)
+    if not converter.in_process:
+        if first_page or last_page:
+            return await converter.convert(input_file, output_file, first_page,
+                                           last_page, run=run)
+        result = convert_to_txt(input_file, output_file, mime_type, run=run, **kwargs)
+        return await result if asyncio.iscoroutine(result) else result
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, partial(
+        converter.convert, input_file, output_file, first_page, last_page, run=run))
 
-def djvutxt(input_file, output_file, pages=None):
-    pages = f'--page={pages}' if pages else ''
-    cmd = f'djvutxt "{input_file}" "{output_file}" {pages}'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return convert_result_from_shell_cmd(result)
 
+# The text is written on the stdout if `output_file` is '-'
+def djvutxt(input_file, output_file, pages=None, run=None):
+    args = ['djvutxt', input_file]
+    if output_file != '-':
+        args.append(output_file)
+    if pages:
+        args.append(f'--page={pages}')
+    return (run or run_cmd)(args)
 
-def ebook_convert(input_file, output_file):
-    cmd = f'ebook-convert "{input_file}" "{output_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return convert_result_from_shell_cmd(result)
 
+def ebook_convert(input_file, output_file, run=None):
+    return (run or run_cmd)(['ebook-convert', input_file, output_file])
 
-def epubtxt(input_file, output_file):
-    cmd = f'unzip -c "{input_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    if not result.stderr:
-        text = str(result.stdout)
+
+# Converts the pages `first_page` to `last_page` (all by default) of a djvu
+# document to text, see djvutxt()
+def _djvutxt_pages(input_file, output_file, first_page=None, last_page=None,
+                   run=None):
+    pages = f'{first_page}-{last_page}' if first_page or last_page else None
+    return djvutxt(input_file, output_file, pages, run=run)
+
+
+# Extracts the text of all the (non-binary) files of an epub, i.e. the
+# equivalent of `unzip -c` but without a subprocess. The epub is read member
+# by member with zipfile, see iter_epub_texts().
+def epubtxt(input_file, output_file, check_timeout=None):
+    import zipfile
+    try:
         with open(output_file, 'w') as f:
-            f.write(text)
-        result.stdout = text
-    return convert_result_from_shell_cmd(result)
+            for name, text in iter_epub_texts(input_file, priority_order=False):
+                if check_timeout:
+                    check_timeout()
+                f.write(text)
+                f.write('\n')
+    except (OSError, zipfile.BadZipFile) as e:
+        return Result(stderr=str(e), returncode=1, args=['epubtxt', input_file])
+    return Result(returncode=0, args=['epubtxt', input_file])
 
 
-def extract_archive(input_file, output_file):
-    cmd = f'7z x -o"{output_file}" "{input_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return convert_result_from_shell_cmd(result)
+def extract_archive(input_file, output_file, run=None):
+    return (run or run_cmd)(['7z', 'x', f'-o{output_file}', input_file])
 
 
 def find(input_data, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
@@ -280,6 +1465,22 @@ def find(input_data, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
          ocr_command=OCR_COMMAND,
          ocr_enabled=OCR_ENABLED,
          ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES,
+         ocr_jobs=OCR_JOBS,
+         ocr_early_exit=OCR_EARLY_EXIT,
+         ocr_raster_pages=OCR_RASTER_PAGES,
+         convert_progressive=CONVERT_PROGRESSIVE,
+         convert_progressive_pages=CONVERT_PROGRESSIVE_PAGES,
+         convert_stream=CONVERT_STREAM,
+         archive_max_member_size=ARCHIVE_MAX_MEMBER_SIZE,
+         archive_max_total_size=ARCHIVE_MAX_TOTAL_SIZE,
+         cache_dir=None, cache_max_entries=CACHE_MAX_ENTRIES,
+         scratch_dir=SCRATCH_DIR, ocr_scratch_dir=OCR_SCRATCH_DIR,
+         ebook_meta_timeout=EBOOK_META_TIMEOUT,
+         archive_timeout=ARCHIVE_TIMEOUT,
+         convert_timeout=CONVERT_TIMEOUT,
+         ocr_page_timeout=OCR_PAGE_TIMEOUT,
+         file_timeout=FILE_TIMEOUT,
+         profile=None,
          **kwargs):
     if input_data is None:
         logger.warning(yellow('`input_data` is None!'))
@@ -287,7 +1488,7 @@ def find(input_data, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
     func_params = locals().copy()
     # Check if input data is a file path or a string
     try:
-        if Path(input_data).is_file():
+        if os.path.isfile(input_data):
             logger.debug(f'The input data is a file path')
             isbns = search_file_for_isbns(input_data, **func_params)
         else:
@@ -308,6 +1509,104 @@ def find(input_data, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
         return None
 
 
+# Same as find() but with asyncio, see search_file_for_isbns_async()
+async def find_async(input_data, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+                     isbn_regex=ISBN_REGEX, isbn_ret_separator=ISBN_RET_SEPARATOR,
+                     **kwargs):
+    if input_data is None:
+        logger.warning(yellow('`input_data` is None!'))
+        return 1
+    func_params = dict(kwargs, isbn_blacklist_regex=isbn_blacklist_regex,
+                       isbn_regex=isbn_regex, isbn_ret_separator=isbn_ret_separator)
+    if os.path.isfile(input_data):
+        logger.debug('The input data is a file path')
+        isbns = await search_file_for_isbns_async(input_data, **func_params)
+    else:
+        logger.debug('The input data might be a string')
+        isbns = find_isbns(input_data, **func_params)
+    if isbns:
+        logger.info(f"Extracted ISBNs:\n{isbns}")
+        return isbns
+    else:
+        logger.info("No ISBNs could be found!")
+        return None
+
+
+# Searches many files for ISBNs by fanning search_file_for_isbns() out over a
+# pool of `jobs` worker processes. `inputs` can contain file paths,
+# directories (scanned recursively), glob patterns or `@filelist` files (one
+# path per line), see get_input_files().
+# This is a generator: the results are yielded as `(file_path, isbns)` tuples
+# as soon as each file is done, i.e. not necessarily in the input order.
+def find_batch(inputs, jobs=JOBS, **kwargs):
+    kwargs.pop('input_data', None)
+    file_paths = get_input_files(inputs)
+    jobs = max(1, min(jobs or JOBS, len(file_paths) or 1))
+    logger.debug(f'Searching {len(file_paths)} files for ISBNs with {jobs} '
+                 f'job{"s" if jobs > 1 else ""}')
+    kwargs['ocr_jobs'] = _get_worker_ocr_jobs(jobs, kwargs.get('ocr_jobs'))
+    yield from _imap_processes(partial(_search_file_for_isbns_worker, kwargs=kwargs),
+                               file_paths, jobs)
+
+
+# Returns the number of pages OCRed at the same time by each of the `jobs`
+# worker processes searching files: `ocr_jobs` if given, else the cores are
+# shared between the workers, see OCR_JOBS
+def _get_worker_ocr_jobs(jobs, ocr_jobs=None):
+    if ocr_jobs is not None:
+        return ocr_jobs
+    return max(1, OCR_JOBS // jobs)
+
+
+def _search_file_for_isbns_worker(file_path, kwargs):
+    try:
+        isbns = search_file_for_isbns(file_path, **kwargs)
+    except Exception as e:
+        logger.error(red(f"Error while searching '{file_path}': {e}"))
+        isbns = ''
+    return file_path, isbns
+
+
+# Searches a stream of inputs for ISBNs, e.g. the lines read from stdin by the
+# `--stdin-jsonl` option of the script. Each input is a file path or else a
+# string. The inputs are consumed lazily by a pool of `jobs` worker processes
+# and at most `max_pending` inputs (by default 4 by job) are buffered at once.
+# This is a generator: a dict is yielded for each input as soon as it is done
+# or, with `ordered`, in the order of the inputs:
+#   {'input': ..., 'isbns': [...], 'stage': ..., 'elapsed_ms': ...}
+# where 'stage' is the step of search_file_for_isbns() that found the ISBNs
+# ('string' for a string, None if no ISBN was found). 'timed_out_stage' or
+# 'error' are added if the search was cut off or failed.
+def find_stream(inputs, jobs=JOBS, ordered=False, max_pending=None, **kwargs):
+    kwargs.pop('input_data', None)
+    jobs = max(1, jobs or JOBS)
+    kwargs['ocr_jobs'] = _get_worker_ocr_jobs(jobs, kwargs.get('ocr_jobs'))
+    yield from _imap_processes(partial(_find_stream_worker, kwargs=kwargs),
+                               inputs, jobs, ordered, max_pending)
+
+
+def _find_stream_worker(input_data, kwargs):
+    start = time.perf_counter()
+    result = {'input': input_data}
+    report = {}
+    try:
+        if os.path.isfile(input_data):
+            isbns = search_file_for_isbns(input_data, report=report, **kwargs)
+        else:
+            isbns = _report_stage(report, 'string', find_isbns(input_data, **kwargs))
+    except Exception as e:
+        logger.error(red(f"Error while searching '{input_data}': {e}"))
+        isbns = ''
+        result['error'] = str(e)
+    isbn_ret_separator = kwargs.get('isbn_ret_separator', ISBN_RET_SEPARATOR)
+    result['isbns'] = isbns.split(isbn_ret_separator) if isbns else []
+    result['stage'] = report.get('stage')
+    if 'timed_out_stage' in report:
+        result['timed_out_stage'] = report['timed_out_stage']
+    result['elapsed_ms'] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+
 # Searches the input string for ISBN-like sequences and removes duplicates and
 # finally validates them using is_isbn_valid() and returns them separated by
 # `isbn_ret_separator`
@@ -315,198 +1614,958 @@ def find(input_data, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
 def find_isbns(input_str, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
                isbn_regex=ISBN_REGEX, isbn_ret_separator=ISBN_RET_SEPARATOR,
                **kwargs):
-    isbns = []
     # TODO: they are using grep -oP
     # Ref.: https://bit.ly/2HUbnIs
     # Remove spaces
     # input_str = input_str.replace(' ', '')
-    matches = re.finditer(isbn_regex, input_str)
-    for i, match in enumerate(matches):
-        match = match.group()
-        # Remove everything except numbers [0-9], 'x', and 'X'
-        # NOTE: equivalent to UNIX command `tr -c -d '0-9xX'`
-        # TODO 1: they don't remove \n in their code
-        # TODO 2: put the following in a function
-        del_tab = string.printable[10:].replace('x', '').replace('X', '')
-        tran_tab = str.maketrans('', '', del_tab)
-        match = match.translate(tran_tab)
-        # Only keep unique ISBNs
-        if match not in isbns:
-            # Validate ISBN
-            if is_isbn_valid(match):
-                if re.match(isbn_blacklist_regex, match):
-                    logger.debug(f'Wrong ISBN (blacklisted): {match}')
-                else:
-                    logger.debug(f'Valid ISBN found: {match}')
-                    isbns.append(match)
-            else:
-                logger.debug(f'Invalid ISBN found: {match}')
-        else:
-            logger.debug(f'Non-unique ISBN found: {match}')
+    # TODO: they don't remove \n in their code
+    isbns = get_isbn_matcher(isbn_regex, isbn_blacklist_regex).findall(input_str)
     if not isbns:
         msg = f'"{input_str}"' if len(input_str) < 100 else ''
         logger.debug(f'No ISBN found in the input string {msg}')
     return isbn_ret_separator.join(isbns)
 
 
+# Same as find_isbns() but for the content of a file which is read by chunks
+# of bounded size with iter_file_content(), i.e. the whole file is never loaded
+# in memory.
+def find_isbns_in_file(file_path, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+                       isbn_regex=ISBN_REGEX,
+                       isbn_ret_separator=ISBN_RET_SEPARATOR,
+                       isbn_reorder_files=ISBN_REORDER_FILES, **kwargs):
+    matcher = get_isbn_matcher(isbn_regex, isbn_blacklist_regex)
+    seen = set()
+    isbns = []
+    for chunk in iter_file_content(file_path, isbn_reorder_files):
+        isbns.extend(matcher.findall(chunk, seen))
+    if not isbns:
+        logger.debug(f"No ISBN found in the file '{file_path}'")
+    return isbn_ret_separator.join(isbns)
+
+
+# Same as find_isbns_in_file() but the file is memory-mapped and searched
+# with the bytes version of the ISBN regex, i.e. its content is neither copied
+# nor decoded (only the matches). The first lines, the last lines in reverse
+# and the middle (see reorder_file_content()) are searched as slices of the
+# map. Used for big text files like text dumps and html mirrors.
+def find_isbns_in_mmap(file_path, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+                       isbn_regex=ISBN_REGEX,
+                       isbn_ret_separator=ISBN_RET_SEPARATOR,
+                       isbn_reorder_files=ISBN_REORDER_FILES, **kwargs):
+    matcher = get_isbn_matcher(isbn_regex, isbn_blacklist_regex)
+    seen = set()
+    isbns = []
+    try:
+        with open(file_path, 'rb') as f:
+            if matcher.isbn_bytes_regex is None or not os.fstat(f.fileno()).st_size:
+                raise ValueError('nothing to map')
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                for start, end in _get_mmap_regions(mm, isbn_reorder_files):
+                    isbns.extend(matcher.findall(mm, seen, start, end))
+    except (OSError, ValueError) as e:
+        logger.debug(f"Couldn't memory-map the file '{file_path}': {e}")
+        return find_isbns_in_file(
+            file_path, isbn_blacklist_regex, isbn_regex, isbn_ret_separator,
+            isbn_reorder_files)
+    if not isbns:
+        logger.debug(f"No ISBN found in the file '{file_path}'")
+    return isbn_ret_separator.join(isbns)
+
+
+# Returns the (start, end) offsets of the regions of `mm` in the search order
+# given by `isbn_reorder_files`: the first lines, the last lines (one region
+# per line, in reverse) and the middle
+def _get_mmap_regions(mm, isbn_reorder_files):
+    size = len(mm)
+    if not isbn_reorder_files:
+        return [(0, size)]
+    scan_first, reverse_last = [int(i) for i in isbn_reorder_files]
+    head_end = 0
+    for _ in range(scan_first):
+        i = mm.find(b'\n', head_end)
+        if i == -1:
+            head_end = size
+            break
+        head_end = i + 1
+    regions = [(0, head_end)]
+    # NOTE: the newline at the end of the last line doesn't start a line
+    line_end = size
+    pos = size - 1
+    tail_start = size
+    for _ in range(reverse_last):
+        i = mm.rfind(b'\n', head_end, pos) if pos > head_end else -1
+        tail_start = i + 1 if i != -1 else head_end
+        if tail_start >= line_end:
+            break
+        regions.append((tail_start, line_end))
+        line_end = tail_start
+        pos = i
+        if i == -1:
+            break
+    regions.append((head_end, tail_start))
+    return regions
+
+
+# Returns the summary table of profile reports (see Profiler): for each step,
+# the number of files that went through it, the total wall time (and its share
+# of the total), the CPU times, the bytes read and written and the peak memory
+def format_profile_summary(reports):
+    columns = [('wall_time', 'wall (s)', 1), ('cpu_time', 'cpu (s)', 1),
+               ('children_cpu_time', 'children cpu (s)', 1),
+               ('read_bytes', 'read (MiB)', 1 << 20),
+               ('write_bytes', 'written (MiB)', 1 << 20),
+               ('peak_rss', 'peak RSS (MiB)', 1 << 20),
+               ('children_peak_rss', 'children peak RSS (MiB)', 1 << 20)]
+    steps = list(PROFILE_STEPS)
+    for report in reports:
+        steps += [step for step in report['steps'] if step not in steps]
+    total_wall_time = sum(report['total']['wall_time'] for report in reports)
+    rows = [['step', 'files'] + [title for _, title, _ in columns] + ['share']]
+    for step in steps + ['total']:
+        usages = [report['total'] if step == 'total' else report['steps'][step]
+                  for report in reports if step == 'total' or step in report['steps']]
+        if not usages:
+            continue
+        row = [step, str(len(usages))]
+        for key, _, unit in columns:
+            values = [usage[key] for usage in usages if usage.get(key) is not None]
+            if not values:
+                row.append('-')
+            elif key.endswith('peak_rss'):
+                row.append(f'{max(values) / unit:.1f}')
+            else:
+                row.append(f'{sum(values) / unit:.{3 if unit == 1 else 1}f}')
+        wall_time = sum(usage['wall_time'] for usage in usages)
+        row.append(f'{100 * wall_time / total_wall_time:.1f}%'
+                   if total_wall_time else '-')
+        rows.append(row)
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    return '\n'.join('  '.join(value.ljust(width) if i == 0 else value.rjust(width)
+                               for i, (value, width) in enumerate(zip(row, widths)))
+                     for row in rows)
+
+
 def get_all_isbns_from_archive(
         file_path, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
         isbn_direct_files=ISBN_DIRECT_FILES,
-        isbn_reorder_files=ISBN_DIRECT_FILES,
+        isbn_reorder_files=ISBN_REORDER_FILES,
         isbn_ignored_files=ISBN_IGNORED_FILES, isbn_regex=ISBN_REGEX,
         isbn_ret_separator=ISBN_RET_SEPARATOR, ocr_command=OCR_COMMAND,
         ocr_enabled=OCR_ENABLED,
-        ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES, **kwargs):
+        ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES,
+        archive_max_member_size=ARCHIVE_MAX_MEMBER_SIZE,
+        archive_max_total_size=ARCHIVE_MAX_TOTAL_SIZE,
+        archive_timeout=ARCHIVE_TIMEOUT, deadline=None, **kwargs):
+    import tarfile
+    import zipfile
     func_params = locals().copy()
     func_params.pop('file_path')
-    all_isbns = []
-    tmpdir = tempfile.mkdtemp()
-    logger.debug(f"Trying to decompress '{os.path.basename(file_path)}' and "
-                 "recursively scan the contents")
-    logger.debug(f"Decompressing '{file_path}' into tmp folder '{tmpdir}'")
-    result = extract_archive(file_path, tmpdir)
-    if result.stderr:
-        logger.debug('Error extracting the file (probably not an archive)! '
-                     'Removing tmp dir...')
-        logger.debug(result.stderr)
-        remove_tree(tmpdir)
+    # Forward the options of the calling search_file_for_isbns() to the
+    # searches of the members
+    while 'kwargs' in func_params:
+        func_params.update(func_params.pop('kwargs'))
+    # zip and tar archives are scanned in-process, 7z is only used for the
+    # other formats (e.g. rar, 7z)
+    if zipfile.is_zipfile(file_path) or tarfile.is_tarfile(file_path):
+        return get_all_isbns_from_python_archive(file_path, **func_params)
+    if not command_exists('7z'):
+        logger.debug('`7z` is not found! Skipping the extraction of the file')
         return ''
-    logger.debug(f"Archive extracted successfully in '{tmpdir}', scanning "
-                 f"contents recursively...")
-    # TODO: Ref.: https://stackoverflow.com/a/2759553
-    # TODO: ignore .DS_Store
-    for path, dirs, files in os.walk(tmpdir, topdown=False):
-        # TODO: they use flag options for sorting the directory contents
-        # see https://github.com/na--/ebook-tools#miscellaneous-options [FILE_SORT_FLAGS]
-        for file_to_check in files:
-            # TODO: add debug_prefixer
-            file_to_check = os.path.join(path, file_to_check)
-            isbns = search_file_for_isbns(file_to_check, **func_params)
-            if isbns:
-                logger.debug(f"Found ISBNs\n{isbns}")
-                # TODO: two prints, one for stderror and the other for stdout
-                logger.debug(isbns.replace(isbn_ret_separator, '\n'))
-                for isbn in isbns.split(isbn_ret_separator):
-                    if isbn not in all_isbns:
-                        all_isbns.append(isbn)
-            logger.debug(f'Removing {file_to_check}...')
-            remove_file(file_to_check)
-        if len(os.listdir(path)) == 0 and path != tmpdir:
-            os.rmdir(path)
-        elif path == tmpdir:
-            if len(os.listdir(tmpdir)) == 1 and '.DS_Store' in tmpdir:
-                remove_file(os.path.join(tmpdir, '.DS_Store'))
-    logger.debug(f"Removing temporary folder '{tmpdir}' (should be empty)...")
-    if is_dir_empty(tmpdir):
-        remove_tree(tmpdir)
+    all_isbns = []
+    with _scratch_workspace(**func_params) as workspace:
+        # The files of the archive are searched within the same workspace
+        func_params['workspace'] = workspace
+        tmpdir = workspace.mkdir()
+        logger.debug(f"Trying to decompress '{os.path.basename(file_path)}' and "
+                     "recursively scan the contents")
+        logger.debug(f"Decompressing '{file_path}' into tmp folder '{tmpdir}'")
+        try:
+            result = extract_archive(
+                file_path, tmpdir,
+                run=get_stage_runner('archive', archive_timeout, deadline))
+            if result.stderr:
+                logger.debug('Error extracting the file (probably not an archive)!')
+                logger.debug(result.stderr)
+                return ''
+            workspace.account()
+            logger.debug(f"Archive extracted successfully in '{tmpdir}', scanning "
+                         f"contents recursively...")
+            # TODO: Ref.: https://stackoverflow.com/a/2759553
+            for path, dirs, files in os.walk(tmpdir, topdown=False):
+                # TODO: they use flag options for sorting the directory contents
+                # see https://github.com/na--/ebook-tools#miscellaneous-options [FILE_SORT_FLAGS]
+                for file_to_check in files:
+                    # TODO: add debug_prefixer
+                    file_to_check = os.path.join(path, file_to_check)
+                    isbns = search_file_for_isbns(file_to_check, **func_params)
+                    if isbns:
+                        logger.debug(f"Found ISBNs\n{isbns}")
+                        # TODO: two prints, one for stderror and the other for stdout
+                        logger.debug(isbns.replace(isbn_ret_separator, '\n'))
+                        for isbn in isbns.split(isbn_ret_separator):
+                            if isbn not in all_isbns:
+                                all_isbns.append(isbn)
+                    logger.debug(f'Removing {file_to_check}...')
+                    remove_file(file_to_check)
+        finally:
+            # Also after a timeout, e.g. with the files that weren't searched
+            logger.debug(f"Removing temporary folder '{tmpdir}'...")
+            remove_tree(tmpdir)
     return isbn_ret_separator.join(all_isbns)
 
 
-def get_ebook_metadata(file_path):
-    # TODO: add `ebook-meta` in PATH, right now it is only working for mac
-    cmd = f'ebook-meta "{file_path}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return convert_result_from_shell_cmd(result)
+# Scans a zip or tar (also .tar.gz/.bz2/.xz) archive member by member without
+# extracting it all to disk first:
+# - the member names are searched for ISBNs
+# - text members (`isbn_direct_files`) are searched from memory
+# - members with `isbn_ignored_files` MIME types are skipped
+# - the other members (e.g. pdf, nested archives) are written one at a time
+#   to a temp file and searched with search_file_for_isbns()
+# Members bigger than `archive_max_member_size` are skipped and the scan stops
+# once `archive_max_total_size` bytes (uncompressed) were read.
+def get_all_isbns_from_python_archive(
+        file_path, isbn_direct_files=ISBN_DIRECT_FILES,
+        isbn_reorder_files=ISBN_REORDER_FILES,
+        isbn_ignored_files=ISBN_IGNORED_FILES,
+        isbn_ret_separator=ISBN_RET_SEPARATOR,
+        archive_max_member_size=ARCHIVE_MAX_MEMBER_SIZE,
+        archive_max_total_size=ARCHIVE_MAX_TOTAL_SIZE, deadline=None, **kwargs):
+    import mimetypes
+    import shutil
+    import tarfile
+    import zipfile
+    func_params = locals().copy()
+    func_params.pop('file_path')
+    # Forward the options of the calling search_file_for_isbns(), e.g. the
+    # convert methods, to the searches of the members
+    while 'kwargs' in func_params:
+        func_params.update(func_params.pop('kwargs'))
+    logger.debug(f"Scanning the archive '{os.path.basename(file_path)}' in-process")
+    all_isbns = []
+    total_size = 0
+    tmpdir = None
+    with _scratch_workspace(**func_params) as workspace:
+        # The members are searched within the same workspace
+        func_params['workspace'] = workspace
+        try:
+            for name, size, open_member in iter_archive_members(file_path):
+                basename = posixpath.basename(name)
+                if not basename:
+                    continue
+                # The members are read in-process, the time budget of the file is
+                # checked between them
+                get_stage_timeout('archive', deadline=deadline)
+                if size > archive_max_member_size:
+                    logger.debug(f"Skipping '{name}' ({size} bytes): bigger than "
+                                 f"the member size budget")
+                    continue
+                total_size += size
+                if total_size > archive_max_total_size:
+                    logger.debug('The total size budget of the archive is reached, '
+                                 'the remaining members are skipped')
+                    break
+                # Step 1 of search_file_for_isbns(): check the member name
+                isbns = find_isbns(basename, **func_params)
+                # From the name only, the members are sniffed if written to disk
+                mime_type = mimetypes.guess_type(basename)[0] or ''
+                if isbns or re.match(isbn_ignored_files, mime_type):
+                    pass
+                elif re.match(isbn_direct_files, mime_type) \
+                        and size <= ARCHIVE_MAX_IN_MEMORY_SIZE:
+                    with open_member() as f:
+                        data = f.read().decode('utf-8', errors='ignore')
+                    isbns = find_isbns(reorder_text(data, isbn_reorder_files),
+                                       **func_params)
+                else:
+                    # The rest of the pipeline needs a file, e.g. for ebook-meta
+                    if tmpdir is None:
+                        tmpdir = workspace.mkdir()
+                    file_to_check = os.path.join(tmpdir, basename)
+                    with open_member() as src, open(file_to_check, 'wb') as dst:
+                        shutil.copyfileobj(src, dst)
+                    workspace.account()
+                    try:
+                        isbns = search_file_for_isbns(file_to_check, **func_params)
+                    finally:
+                        remove_file(file_to_check)
+                if isbns:
+                    logger.debug(f"Found ISBNs in '{name}':\n{isbns}")
+                    for isbn in isbns.split(isbn_ret_separator):
+                        if isbn not in all_isbns:
+                            all_isbns.append(isbn)
+        except (EOFError, OSError, RuntimeError, tarfile.TarError,
+                zipfile.BadZipFile, zlib.error) as e:
+            # e.g. truncated archive or encrypted member
+            logger.debug(f'Error while scanning the archive: {e}')
+        finally:
+            if tmpdir:
+                remove_tree(tmpdir)
+    return isbn_ret_separator.join(all_isbns)
 
 
-# Using Python built-in module mimetypes
-def get_mime_type(file_path):
-    return mimetypes.guess_type(file_path)[0]
+# Returns the semaphore that limits to `max_processes` the number of child
+# processes run at the same time by the asyncio API in the running event loop
+def get_async_semaphore(max_processes=ASYNC_MAX_PROCESSES):
+    import asyncio
+    semaphores = _ASYNC_SEMAPHORES.setdefault(asyncio.get_running_loop(), {})
+    if max_processes not in semaphores:
+        semaphores[max_processes] = asyncio.Semaphore(max_processes)
+    return semaphores[max_processes]
 
 
-# Return number of pages in a djvu document
-def get_pages_in_djvu(file_path):
-    cmd = f'djvused -e "n" "{file_path}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return convert_result_from_shell_cmd(result)
+# Returns the convert method option (e.g. `pdf_convert_method`) that applies to
+# the MIME type: a converter backend name or 'auto'
+def get_convert_method(mime_type, djvu_convert_method=DJVU_CONVERT_METHOD,
+                       epub_convert_method=EPUB_CONVERT_METHOD,
+                       msword_convert_method=MSWORD_CONVERT_METHOD,
+                       pdf_convert_method=PDF_CONVERT_METHOD, **kwargs):
+    if mime_type.startswith('image/vnd.djvu'):
+        return djvu_convert_method
+    elif mime_type.startswith('application/epub+zip'):
+        return epub_convert_method
+    elif mime_type == 'application/msword':
+        return msword_convert_method
+    elif mime_type == 'application/pdf':
+        return pdf_convert_method
+    return 'auto'
 
 
-# Return number of pages in a pdf document
-def get_pages_in_pdf(file_path, cmd='mdls'):
-    assert cmd in ['mdls', 'pdfinfo']
-    if command_exists(cmd) and cmd == 'mdls':
-        cmd = f'mdls -raw -name kMDItemNumberOfPages "{file_path}"'
-        args = shlex.split(cmd)
-        result = subprocess.run(args, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        if '(null)' in str(result.stdout):
-            return get_pages_in_pdf(file_path, cmd='pdfinfo')
-    else:
-        cmd = f'pdfinfo "{file_path}"'
-        args = shlex.split(cmd)
-        result = subprocess.run(args, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        if result.returncode == 0:
-            result = convert_result_from_shell_cmd(result)
-            result.stdout = int(re.findall('^Pages:\s+([0-9]+)',
-                                           result.stdout,
-                                           flags=re.MULTILINE)[0])
-            return result
-    return convert_result_from_shell_cmd(result)
+# Returns the converter backend used for files of type `mime_type`: the one
+# named `method` if it is available, else the cheapest available one. With
+# `pages`, only the backends that can convert a range of pages are considered.
+# Returns None if no backend can convert the file (e.g. an image).
+def get_converter(mime_type, method='auto', pages=False):
+    _load_converter_plugins()
+    if method != 'auto' and method not in _CONVERTERS:
+        logger.warning(yellow(f"Unknown converter '{method}', using the cheapest "
+                              "available one"))
+    backends = [backend for backend in _CONVERTERS.values()
+                if backend.handles(mime_type) and (backend.pages or not pages)]
+    for backend in sorted(backends, key=lambda b: (b.name != method, b.cost)):
+        if backend.available():
+            return backend
+    return None
 
 
-# Checks if directory is empty
-# Ref.: https://stackoverflow.com/a/47363995
-def is_dir_empty(path):
-    return next(os.scandir(path), None) is None
+# Returns the names of the registered converter backends that can convert files
+# of type `mime_type`, the cheapest first
+# NOTE: the plugins are only loaded by get_converter() since scanning the entry
+# points is slow (tens of ms), i.e. they aren't included before a conversion
+def get_converter_names(mime_type):
+    return [backend.name for backend in sorted(_CONVERTERS.values(), key=lambda b: b.cost)
+            if backend.handles(mime_type)]
 
 
-# Validates ISBN-10 and ISBN-13 numbers
-# Ref.: https://bit.ly/2HO2lMD
-def is_isbn_valid(isbn):
-    # TODO: there is also a Python package for validating ISBNs (but dependency)
-    # Remove whitespaces (space, tab, newline, and so on), '-', and capitalize all
-    # characters (ISBNs can consist of numbers [0-9] and the letters [xX])
-    isbn = ''.join(isbn.split())
-    isbn = isbn.replace('-', '')
-    isbn = isbn.upper()
+# NOTE: calibre's `ebook-meta` is slow to start, it is only used for the formats
+# that read_ebook_metadata() can't read in-process
+def get_ebook_metadata(file_path, run=None):
+    # TODO: add `ebook-meta` in PATH, right now it is only working for mac
+    return (run or run_cmd)(['ebook-meta', file_path])
 
-    sum = 0
-    # Case 1: ISBN-10
-    if len(isbn) == 10:
-        for i in range(len(isbn)):
-            if i == 9 and isbn[i] == 'X':
-                number = 10
+
+# Returns the hexadecimal digest of the file content. The file is read in chunks
+# so that big files don't end up all in memory.
+def get_file_hash(file_path, chunk_size=1 << 20):
+    import hashlib
+    file_hash = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+# Expands the supplied inputs into a list of file paths. Each input can be:
+# - a file path
+# - a directory, in which case all its files are added recursively
+# - a glob pattern, e.g. '~/ebooks/**/*.pdf'
+# - `@filelist`, i.e. a text file that contains one input per line
+def get_input_files(inputs):
+    from pathlib import Path
+    if isinstance(inputs, str):
+        inputs = [inputs]
+    file_paths = []
+    for input_ in inputs:
+        input_ = os.path.expanduser(input_)
+        if input_.startswith('@') and Path(input_[1:]).is_file():
+            with open(input_[1:], 'r') as f:
+                lines = [line.rstrip('\r\n') for line in f]
+            file_paths.extend(get_input_files([line for line in lines if line.strip()]))
+        elif Path(input_).is_dir():
+            for path, dirs, files in os.walk(input_):
+                dirs.sort()
+                for filename in sorted(files):
+                    file_paths.append(os.path.join(path, filename))
+        elif Path(input_).is_file():
+            file_paths.append(input_)
+        else:
+            matches = sorted(glob.glob(input_, recursive=True))
+            if matches:
+                file_paths.extend(get_input_files(matches))
             else:
-                number = int(isbn[i])
-            sum += (number * (10 - i))
-        if sum % 11 == 0:
-            return True
-    # Case 2: ISBN-13
-    elif len(isbn) == 13:
-        if isbn[0:3] in ['978', '979']:
-            for i in range(0, len(isbn), 2):
-                sum += int(isbn[i])
-            for i in range(1, len(isbn), 2):
-                sum += (int(isbn[i])*3)
-            if sum % 10 == 0:
-                return True
-    return False
+                logger.warning(yellow(f"No files found for the input '{input_}'"))
+    return file_paths
 
 
-def isalnum_in_file(file_path):
-    with open(file_path, 'r', encoding="utf8", errors='ignore') as f:
-        isalnum = False
-        for line in f:
-            for ch in line:
-                if ch.isalnum():
-                    isalnum = True
-                    break
-            if isalnum:
-                break
-    return isalnum
+# Returns the IsbnMatcher for the given regexes. The matchers are cached so
+# that the regexes are only compiled once.
+@lru_cache(maxsize=32)
+def get_isbn_matcher(isbn_regex=ISBN_REGEX,
+                     isbn_blacklist_regex=ISBN_BLACKLIST_REGEX):
+    return IsbnMatcher(isbn_regex, isbn_blacklist_regex)
 
 
-def namespace_to_dict(ns):
-    namspace_classes = [Namespace, SimpleNamespace]
-    # TODO: check why not working anymore
-    # if isinstance(ns, SimpleNamespace):
-    if type(ns) in namspace_classes:
-        adict = vars(ns)
-    else:
-        adict = ns
+# Returns the MIME type of a file from its first bytes (see sniff_mime_type())
+# and its extension (with the built-in module mimetypes): the extension is only
+# used if the content is unknown or to refine a generic type (e.g. a zip that
+# is a docx or an epub). 'application/octet-stream' is returned if both are
+# unknown.
+def get_mime_type(file_path):
+    import mimetypes
+    guessed = mimetypes.guess_type(file_path)[0]
+    try:
+        sniffed = sniff_mime_type(file_path)
+    except OSError as e:
+        logger.debug(f"Couldn't read '{file_path}' to find its type: {e}")
+        sniffed = None
+    if sniffed is None or (sniffed in _GENERIC_MIME_TYPES and guessed
+                           and (guessed not in _SNIFFED_MIME_TYPES
+                                or (sniffed, guessed) in _REFINED_SNIFFED_MIME_TYPES)):
+        return guessed or 'application/octet-stream'
+    return sniffed
+
+
+# Returns the MIME type of a file from its first bytes: the signatures of
+# _MAGIC_SIGNATURES (e.g. pdf, djvu, archives, images), epubs (zips whose first
+# member is 'mimetype') and 'text/plain' if they decode as UTF-8. Returns None
+# if the type is unknown.
+def sniff_mime_type(file_path):
+    with open(file_path, 'rb') as f:
+        head = f.read(_SNIFF_SIZE)
+    for offset, signature, mime_type in _MAGIC_SIGNATURES:
+        if head.startswith(signature, offset):
+            if mime_type == 'application/zip' \
+                    and head.startswith(b'mimetypeapplication/epub+zip', 30):
+                return 'application/epub+zip'
+            return mime_type
+    if not head or b'\x00' in head:
+        return None
+    try:
+        head.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of `head` is fine
+        if e.start < len(head) - 3 or len(head) < _SNIFF_SIZE:
+            return None
+    return 'text/plain'
+
+
+# Same as get_pages_in_pdf() or get_pages_in_djvu() (depending on the MIME
+# type) but with asyncio, see run_cmd_async()
+async def get_num_pages_async(file_path, mime_type, run=None):
+    run = run or run_cmd_async
+    if mime_type.startswith('image/vnd.djvu'):
+        result = await run(['djvused', '-e', 'n', file_path])
+        if result.returncode == 0:
+            result.stdout = result.parse_stdout(int)
+        return result
+    if command_exists('mdls'):
+        result = await run(['mdls', '-raw', '-name', 'kMDItemNumberOfPages', file_path])
+        if '(null)' not in result.stdout:
+            if result.returncode == 0:
+                result.stdout = result.parse_stdout(int)
+            return result
+    result = await run(['pdfinfo', file_path])
+    if result.returncode == 0:
+        pages = re.findall(r'^Pages:\s+([0-9]+)', result.stdout, flags=re.MULTILINE)
+        result.stdout = int(pages[0]) if pages else None
+    return result
+
+
+# Returns a fingerprint of the options that affect the results of
+# search_file_for_isbns(). Results cached with other options (or with another
+# version of the package) are thus not reused. The tools found in PATH and the
+# available converter backends are also part of it, e.g. a file searched
+# without `pdftotext` is searched again once it is installed.
+def get_options_fingerprint(**kwargs):
+    import hashlib
+    import json
+    options = {'version': __version__}
+    for name, default in _CACHE_KEY_OPTIONS.items():
+        value = kwargs.get(name, default)
+        options[name] = list(value) if isinstance(value, tuple) else value
+    options['tools'] = {cmd: get_tool_path(cmd) for cmd in _SERVER_TOOLS}
+    options['converters'] = sorted(backend.name for backend in _CONVERTERS.values()
+                                   if backend.available())
+    options = json.dumps(options, sort_keys=True)
+    return hashlib.sha1(options.encode('utf-8')).hexdigest()
+
+
+# Returns the list of pages of a document to OCR based on
+# `ocr_only_first_last_pages`: in the page order or, with `ocr_early_exit`, by
+# priority (first pages, last pages in reverse and then the rest)
+def get_ocr_pages(num_pages, ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES,
+                  ocr_early_exit=OCR_EARLY_EXIT):
+    if ocr_only_first_last_pages:
+        if isinstance(ocr_only_first_last_pages, str):
+            ocr_only_first_last_pages = ocr_only_first_last_pages.split(',')
+        ocr_first_pages, ocr_last_pages = [int(i) for i in ocr_only_first_last_pages]
+        # The middle pages are not processed
+        windows = get_page_windows(num_pages, ocr_first_pages, ocr_last_pages)[:2]
+    else:
+        # ocr_only_first_last_pages is False
+        logger.debug('ocr_only_first_last_pages is False')
+        logger.warning(f"{yellow(f'OCR will be applied to all ({num_pages}) pages of the document')}")
+        windows = get_page_windows(num_pages, *OCR_ONLY_FIRST_LAST_PAGES)
+    if ocr_early_exit:
+        # By priority
+        pages_to_process = []
+        for first_page, last_page, reverse in windows:
+            pages = list(range(first_page, last_page + 1))
+            pages_to_process.extend(reversed(pages) if reverse else pages)
+    else:
+        pages_to_process = sorted(page for first_page, last_page, _ in windows
+                                  for page in range(first_page, last_page + 1))
+    return pages_to_process
+
+
+# Splits the list of pages into chunks of up to `chunk_size` consecutive pages
+# (ascending or descending), e.g. [1, 2, 3, 10, 9] --> [[1, 2], [3], [10, 9]]
+# with `chunk_size=2`. The order of the pages is kept.
+def get_page_chunks(pages, chunk_size):
+    chunks = []
+    for page in pages:
+        chunk = chunks[-1] if chunks else None
+        if chunk and len(chunk) < chunk_size and abs(page - chunk[-1]) == 1 \
+                and (len(chunk) == 1 or page - chunk[-1] == chunk[-1] - chunk[-2]):
+            chunk.append(page)
+        else:
+            chunks.append([page])
+    return chunks
+
+
+# Splits the pages of a document into windows to search in order: the first
+# `first_pages` pages, the last `last_pages` pages (to be read in reverse) and
+# the pages in the middle. Returns a list of (first_page, last_page, reverse)
+# tuples where no page is in two windows.
+def get_page_windows(num_pages, first_pages, last_pages):
+    windows = []
+    first_end = min(first_pages, num_pages)
+    if first_end >= 1:
+        windows.append((1, first_end, False))
+    last_start = max(first_end + 1, num_pages - last_pages + 1)
+    if last_pages > 0 and last_start <= num_pages:
+        windows.append((last_start, num_pages, True))
+    else:
+        last_start = num_pages + 1
+    if first_end + 1 <= last_start - 1:
+        windows.append((first_end + 1, last_start - 1, False))
+    return windows
+
+
+# Return number of pages in a djvu document
+def get_pages_in_djvu(file_path, run=None):
+    result = (run or run_cmd)(['djvused', '-e', 'n', file_path])
+    if result.returncode == 0:
+        result.stdout = result.parse_stdout(int)
+    return result
+
+
+# Return number of pages in a pdf document
+def get_pages_in_pdf(file_path, cmd='mdls', run=None):
+    assert cmd in ['mdls', 'pdfinfo']
+    run = run or run_cmd
+    if command_exists(cmd) and cmd == 'mdls':
+        result = run(['mdls', '-raw', '-name', 'kMDItemNumberOfPages', file_path])
+        if '(null)' in result.stdout:
+            return get_pages_in_pdf(file_path, cmd='pdfinfo', run=run)
+        if result.returncode == 0:
+            result.stdout = result.parse_stdout(int)
+    else:
+        result = run(['pdfinfo', file_path])
+        if result.returncode == 0:
+            pages = re.findall(r'^Pages:\s+([0-9]+)', result.stdout, flags=re.MULTILINE)
+            result.stdout = int(pages[0]) if pages else None
+    return result
+
+
+# Returns the result cache of the current process for `cache_dir`. SQLite
+# connections can't be shared between processes (e.g. the workers of
+# find_batch()), hence one instance per process.
+def get_result_cache(cache_dir=CACHE_DIR, max_entries=CACHE_MAX_ENTRIES):
+    key = (os.getpid(), os.path.abspath(cache_dir))
+    if key not in _RESULT_CACHES:
+        _RESULT_CACHES[key] = ResultCache(cache_dir, max_entries)
+    return _RESULT_CACHES[key]
+
+
+# Returns a runner (see run_cmd()) for the commands of the stage `stage` of
+# search_file_for_isbns(): a command is killed after `timeout` seconds or when
+# the `deadline` (time.monotonic()) of the file is reached and then
+# StageTimeoutError is raised. The limits are also kept as attributes of the
+# runner for the in-process steps, see get_timeout_checker().
+def get_stage_runner(stage, timeout=None, deadline=None):
+    import subprocess
+    def run(args, timeout=timeout, **kwargs):
+        timeout = get_stage_timeout(stage, timeout, deadline)
+        try:
+            return run_cmd(args, timeout=timeout, **kwargs)
+        except subprocess.TimeoutExpired:
+            raise StageTimeoutError(stage, timeout)
+    run.stage, run.timeout, run.deadline = stage, timeout, deadline
+    return run
+
+
+# Same as get_stage_runner() but for the asyncio API, see run_cmd_async()
+def get_stage_runner_async(stage, timeout=None, deadline=None, semaphore=None):
+    import subprocess
+    async def run(args, timeout=timeout, **kwargs):
+        timeout = get_stage_timeout(stage, timeout, deadline)
+        try:
+            return await run_cmd_async(args, timeout=timeout, semaphore=semaphore,
+                                       **kwargs)
+        except subprocess.TimeoutExpired:
+            raise StageTimeoutError(stage, timeout)
+    run.stage, run.timeout, run.deadline = stage, timeout, deadline
+    return run
+
+
+# Returns the timeout of a command of the stage `stage`: `timeout` or less if
+# the `deadline` of the file is closer. Raises StageTimeoutError if the
+# deadline is already passed.
+def get_stage_timeout(stage, timeout=None, deadline=None):
+    if deadline is None or deadline == math.inf:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise StageTimeoutError(stage, 0)
+    return remaining if timeout is None else min(timeout, remaining)
+
+
+# Returns a function that raises StageTimeoutError once an in-process step
+# started now (e.g. an in-process converter backend, see ConverterBackend) has
+# used the time limit of a command of the stage runner `run` (see
+# get_stage_runner()). The function does nothing if `run` has no time limit.
+def get_timeout_checker(run=None):
+    stage = getattr(run, 'stage', None)
+    timeout = stage and get_stage_timeout(stage, run.timeout, run.deadline)
+    if not timeout:
+        return lambda: None
+    deadline = time.monotonic() + timeout
+
+    def check_timeout():
+        if time.monotonic() > deadline:
+            raise StageTimeoutError(stage, timeout)
+    return check_timeout
+
+
+# Returns the full path of the command-line tool `cmd` or None if it isn't
+# found in PATH. The paths are resolved once per process and PATH value.
+def get_tool_path(cmd):
+    return _which(cmd, os.environ.get('PATH', os.defpath))
+
+
+@lru_cache(maxsize=128)
+def _which(cmd, path):
+    import shutil
+    return shutil.which(cmd, path=path)
+
+
+# Checks if directory is empty
+# Ref.: https://stackoverflow.com/a/47363995
+def is_dir_empty(path):
+    return next(os.scandir(path), None) is None
+
+
+# Validates ISBN-10 and ISBN-13 numbers
+# Ref.: https://bit.ly/2HO2lMD
+def is_isbn_valid(isbn):
+    # TODO: there is also a Python package for validating ISBNs (but dependency)
+    # Remove whitespaces (space, tab, newline, and so on), '-', and capitalize all
+    # characters (ISBNs can consist of numbers [0-9] and the letters [xX])
+    isbn = ''.join(isbn.split())
+    isbn = isbn.replace('-', '')
+    isbn = isbn.upper()
+
+    sum = 0
+    try:
+        # Case 1: ISBN-10
+        if len(isbn) == 10:
+            for i in range(len(isbn)):
+                if i == 9 and isbn[i] == 'X':
+                    number = 10
+                else:
+                    number = int(isbn[i])
+                sum += (number * (10 - i))
+            if sum % 11 == 0:
+                return True
+        # Case 2: ISBN-13
+        elif len(isbn) == 13:
+            if isbn[0:3] in ['978', '979']:
+                for i in range(0, len(isbn), 2):
+                    sum += int(isbn[i])
+                for i in range(1, len(isbn), 2):
+                    sum += (int(isbn[i])*3)
+                if sum % 10 == 0:
+                    return True
+    except ValueError:
+        # e.g. 'X' in an ISBN-13
+        pass
+    return False
+
+
+def isalnum_in_file(file_path):
+    with open(file_path, 'r', encoding="utf8", errors='ignore') as f:
+        isalnum = False
+        for line in f:
+            for ch in line:
+                if ch.isalnum():
+                    isalnum = True
+                    break
+            if isalnum:
+                break
+    return isalnum
+
+
+# Iterates over the file members of a zip or tar archive as
+# (name, size, open_member) tuples where open_member() returns a file object
+# to read the member. The members are read one at a time, in archive order.
+def iter_archive_members(file_path):
+    import tarfile
+    import zipfile
+    if zipfile.is_zipfile(file_path):
+        with zipfile.ZipFile(file_path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir():
+                    yield info.filename, info.file_size, \
+                          lambda info=info: zf.open(info)
+    else:
+        with tarfile.open(file_path, 'r:*') as tf:
+            for member in tf:
+                if member.isfile():
+                    yield member.name, member.size, \
+                          lambda member=member: tf.extractfile(member)
+
+
+# Iterates over the texts of an epub as (name, text) tuples, one zip member
+# at a time. With `priority_order`, the texts where ISBNs are the most likely
+# to be found come first:
+# 1. the `dc:identifier` values from the OPF package document
+# 2. the first and last documents of the spine (reading order)
+# 3. the rest of the spine
+# 4. all the other non-binary members (e.g. the OPF itself, the toc)
+# Otherwise the members are in the zip order.
+def iter_epub_texts(input_file, priority_order=True):
+    import zipfile
+    def read(name):
+        return zf.read(name).decode('utf-8', errors='ignore')
+
+    with zipfile.ZipFile(input_file) as zf:
+        names = [info.filename for info in zf.infolist() if not info.is_dir()]
+        names = [name for name in names if not _is_epub_binary_member(name)]
+        if not priority_order:
+            for name in names:
+                yield name, read(name)
+            return
+        done = set()
+        opf_path = _get_epub_opf_path(zf, names)
+        if opf_path:
+            identifiers, spine = _parse_epub_opf(read(opf_path), opf_path)
+            yield f'{opf_path}:dc:identifier', '\n'.join(identifiers)
+            spine = [name for name in spine if name in names]
+            if len(spine) > 1:
+                # First and last documents first, then the middle
+                spine = [spine[0], spine[-1]] + spine[1:-1]
+            for name in spine:
+                if name not in done:
+                    done.add(name)
+                    yield name, read(name)
+        for name in names:
+            if name not in done:
+                yield name, read(name)
+
+
+def _get_epub_opf_path(zf, names):
+    # The path of the OPF file is given in META-INF/container.xml
+    from xml.etree import ElementTree
+    try:
+        root = ElementTree.fromstring(zf.read('META-INF/container.xml'))
+        for rootfile in _iter_xml_elements(root, 'rootfile'):
+            if rootfile.get('full-path') in names:
+                return rootfile.get('full-path')
+    except (KeyError, ElementTree.ParseError):
+        pass
+    opf_paths = [name for name in names if name.lower().endswith('.opf')]
+    return opf_paths[0] if opf_paths else None
+
+
+def _is_epub_binary_member(name):
+    import mimetypes
+    mime_type = mimetypes.guess_type(name)[0] or ''
+    return mime_type.startswith(('image/', 'audio/', 'video/', 'font/')) \
+        or name.lower().endswith(('.otf', '.ttf', '.woff', '.woff2'))
+
+
+# Iterates over the XML elements with the given tag, whatever their namespace
+# NOTE: the '{*}tag' syntax is only supported from Python 3.8
+def _iter_xml_elements(root, tag):
+    for element in root.iter():
+        if isinstance(element.tag, str) and element.tag.rsplit('}', 1)[-1] == tag:
+            yield element
+
+
+# Returns the `dc:identifier` values and the zip paths of the spine documents
+# from the OPF package document
+def _parse_epub_opf(opf_text, opf_path):
+    from urllib.parse import unquote
+    from xml.etree import ElementTree
+    try:
+        root = ElementTree.fromstring(opf_text.encode('utf-8'))
+    except ElementTree.ParseError as e:
+        logger.debug(f"Couldn't parse '{opf_path}': {e}")
+        return [], []
+    identifiers = [el.text.strip() for el in _iter_xml_elements(root, 'identifier')
+                   if el.text]
+    opf_dir = posixpath.dirname(opf_path)
+    hrefs = {item.get('id'): item.get('href')
+             for item in _iter_xml_elements(root, 'item')}
+    spine = []
+    for itemref in _iter_xml_elements(root, 'itemref'):
+        href = hrefs.get(itemref.get('idref'))
+        if href:
+            spine.append(posixpath.normpath(posixpath.join(opf_dir, unquote(href))))
+    return identifiers, spine
+
+
+# Iterates over the text of a file by chunks of about `chunk_size` bytes in
+# the order given by `isbn_reorder_files` (see reorder_file_content()): the
+# first lines, then the last lines in reverse (found by reading the file
+# backwards from its end) and finally the middle. The chunks are split at line
+# boundaries or, if a line is too long (e.g. minified html), after a character
+# that can't be part of an ISBN, thus they can be searched one at a time. The
+# memory used doesn't depend on the size of the file.
+def iter_file_content(file_path, isbn_reorder_files=ISBN_REORDER_FILES,
+                      chunk_size=1 << 20):
+    with open(file_path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if not isbn_reorder_files:
+            yield from _iter_text_windows(f, 0, size, chunk_size)
+            return
+        scan_first, reverse_last = [int(i) for i in isbn_reorder_files]
+        # The first lines
+        head_end = _find_line_offset(f, 0, size, scan_first, chunk_size)
+        yield from _iter_text_windows(f, 0, head_end, chunk_size)
+        # The last lines in reverse
+        line_starts = _find_last_line_starts(f, head_end, size, reverse_last,
+                                             chunk_size)
+        line_ends = line_starts[1:] + [size]
+        for start, end in zip(reversed(line_starts), reversed(line_ends)):
+            yield from _iter_text_windows(f, start, end, chunk_size)
+        # The middle
+        tail_start = line_starts[0] if line_starts else size
+        yield from _iter_text_windows(f, head_end, tail_start, chunk_size)
+
+
+# Returns the offset right after the first `num_lines` lines that start at
+# `start` or `end` if there are less lines
+def _find_line_offset(f, start, end, num_lines, chunk_size):
+    pos = start
+    f.seek(pos)
+    while num_lines > 0 and pos < end:
+        block = f.read(min(chunk_size, end - pos))
+        if not block:
+            break
+        i = -1
+        while num_lines > 0:
+            i = block.find(b'\n', i + 1)
+            if i == -1:
+                break
+            num_lines -= 1
+        if num_lines == 0:
+            return pos + i + 1
+        pos += len(block)
+    return min(pos, end)
+
+
+# Returns the (increasing) offsets of the start of the last `num_lines` lines
+# between `start` and `end` by reading the file backwards
+def _find_last_line_starts(f, start, end, num_lines, chunk_size):
+    line_starts = []
+    pos = end
+    while len(line_starts) < num_lines and pos > start:
+        block_start = max(start, pos - chunk_size)
+        f.seek(block_start)
+        block = f.read(pos - block_start)
+        i = len(block)
+        while len(line_starts) < num_lines:
+            i = block.rfind(b'\n', 0, i)
+            if i == -1:
+                break
+            # The newline at the end of the last line doesn't start a line
+            if block_start + i + 1 < end:
+                line_starts.append(block_start + i + 1)
+        pos = block_start
+    if len(line_starts) < num_lines and start < end:
+        line_starts.append(start)
+    line_starts.reverse()
+    return line_starts
+
+
+# Iterates over the decoded text between the offsets `start` and `end` by
+# windows of about `chunk_size` bytes split at line boundaries if possible
+def _iter_text_windows(f, start, end, chunk_size):
+    decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+    f.seek(start)
+    pos = start
+    carry = b''
+    while pos < end:
+        block = f.read(min(chunk_size, end - pos))
+        if not block:
+            break
+        pos += len(block)
+        block = carry + block
+        carry = b''
+        if pos < end:
+            block, carry = _split_text_block(block, chunk_size)
+        text = decoder.decode(block)
+        if text:
+            yield text
+    text = decoder.decode(carry, final=True)
+    if text:
+        yield text
+
+
+# Splits the block of bytes read by chunks of `chunk_size` into the complete
+# lines and the incomplete line (or the trailing ISBN-like characters of a long
+# line) which is kept for the next block. A block with only ISBN-like
+# characters is split anyway once it is twice the chunk size.
+def _split_text_block(block, chunk_size):
+    i = block.rfind(b'\n') + 1
+    if not i:
+        for i in range(len(block) - 1, -1, -1):
+            if _NON_ISBN_BYTES_REGEX.match(block, i):
+                i += 1
+                break
+        else:
+            i = 0 if len(block) < 2 * chunk_size else len(block)
+    return block[:i], block[i:]
+
+
+# Loads the profile reports appended as JSON lines to `report_file`, see
+# Profiler
+def load_profile_reports(report_file):
+    import json
+    with open(report_file, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def namespace_to_dict(ns):
+    from argparse import Namespace
+    namspace_classes = [Namespace, SimpleNamespace]
+    # TODO: check why not working anymore
+    # if isinstance(ns, SimpleNamespace):
+    if type(ns) in namspace_classes:
+        adict = vars(ns)
+    else:
+        adict = ns
     for k, v in adict.items():
         # if isinstance(v, SimpleNamespace):
         if type(v) in namspace_classes:
@@ -519,41 +2578,43 @@ def namespace_to_dict(ns):
 
 # OCR on a pdf, djvu document or image
 # NOTE: If pdf or djvu document, then first needs to be converted to image and then OCR
+# The pages are processed by chunks of up to `ocr_raster_pages` consecutive
+# pages: each chunk is rasterized by a single gs/ddjvu call into a scratch dir
+# (RAM-backed if possible) and the page images are piped to the OCR. The chunks
+# are processed by a pool of `ocr_jobs` threads and the text is saved in the
+# page order.
+# With `ocr_early_exit`, the pages are OCRed by priority (first pages, last
+# pages in reverse and then the rest) and their text is searched for ISBNs as
+# soon as it is recognized. OCR stops at the first page that contains valid
+# ISBNs and the text of the processed pages is saved in that priority order.
 def ocr_file(file_path, output_file, mime_type,
              ocr_command=OCR_COMMAND,
-             ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES, **kwargs):
-    # Convert pdf to png image
-    def convert_pdf_page(page, input_file, output_file):
-        cmd = f'gs -dSAFER -q -r300 -dFirstPage={page} -dLastPage={page} ' \
-              '-dNOPAUSE -dINTERPOLATE -sDEVICE=png16m ' \
-              f'-sOutputFile="{output_file}" "{input_file}" -c quit'
-        args = shlex.split(cmd)
-        result = subprocess.run(args, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        return convert_result_from_shell_cmd(result)
-
-    # Convert djvu to tif image
-    def convert_djvu_page(page, input_file, output_file):
-        cmd = f'ddjvu -page={page} -format=tif "{input_file}" "{output_file}"'
-        args = shlex.split(cmd)
-        result = subprocess.run(args, stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE)
-        return convert_result_from_shell_cmd(result)
-
+             ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES,
+             ocr_jobs=OCR_JOBS, ocr_early_exit=OCR_EARLY_EXIT,
+             ocr_raster_pages=OCR_RASTER_PAGES,
+             isbn_blacklist_regex=ISBN_BLACKLIST_REGEX, isbn_regex=ISBN_REGEX,
+             ocr_page_timeout=OCR_PAGE_TIMEOUT, ocr_scratch_dir=OCR_SCRATCH_DIR,
+             workspace=None, deadline=None, **kwargs):
+    # Each command has `ocr_page_timeout` seconds by page
+    run = get_stage_runner('ocr', ocr_page_timeout, deadline)
     if mime_type.startswith('application/pdf'):
-        result = get_pages_in_pdf(file_path)
+        result = get_pages_in_pdf(file_path, run=run)
         num_pages = result.stdout
         logger.debug(f"Result of '{get_pages_in_pdf.__name__}()' on '{file_path}':\n{result}")
-        page_convert_cmd = convert_pdf_page
+        rasterize_cmd = rasterize_pdf_pages
     elif mime_type.startswith('image/vnd.djvu'):
-        result = get_pages_in_djvu(file_path)
+        result = get_pages_in_djvu(file_path, run=run)
         num_pages = result.stdout
         logger.debug(f"Result of '{get_pages_in_djvu.__name__}()' on '{file_path}':\n{result}")
-        page_convert_cmd = convert_djvu_page
+        rasterize_cmd = rasterize_djvu_pages
     elif mime_type.startswith('image/'):
         logger.debug(f"Running OCR on file '{file_path}' and with mime type '{mime_type}'...")
-        if ocr_command in globals():
-            result = eval(f'{ocr_command}("{file_path}", "{output_file}")')
+        if ocr_command == 'tesseract_wrapper':
+            result = tesseract_wrapper(file_path, output_file, run=run)
+            logger.debug(f"Result of '{ocr_command}':\n{result}")
+            return 0
+        elif ocr_command in globals():
+            result = globals()[ocr_command](file_path, output_file)
             logger.debug(f"Result of '{ocr_command}':\n{result}")
             return 0
         else:
@@ -564,7 +2625,7 @@ def ocr_file(file_path, output_file, mime_type,
         logger.error(f"{red('Unsupported mime type')} '{mime_type}'!")
         return 1
 
-    if result.returncode == 1:
+    if result.returncode != 0 or not num_pages:
         err_msg = result.stdout if result.stdout else result.stderr
         msg = "Couldn't get number of pages:"
         logger.error(f"{red(msg)} '{str(err_msg).strip()}'")
@@ -578,66 +2639,547 @@ def ocr_file(file_path, output_file, mime_type,
     logger.debug(f"The file '{file_path}' has {num_pages} page{'s' if num_pages > 1 else ''}")
     logger.debug(f'mime type: {mime_type}')
 
-    # Pre-compute the list of pages to process based on ocr_only_first_last_pages
-    if ocr_only_first_last_pages:
-        ocr_first_pages, ocr_last_pages = [int(i) for i in ocr_only_first_last_pages.split(',')]
-        pages_to_process = [i for i in range(1, ocr_first_pages + 1)]
-        pages_to_process.extend([i for i in range(num_pages + 1 - ocr_last_pages, num_pages + 1)])
-    else:
-        # ocr_only_first_last_pages is False
-        logger.debug('ocr_only_first_last_pages is False')
-        logger.warning(f"{yellow('OCR will be applied to all ({pages}) pages of the document')}")
-        pages_to_process = [i for i in range(1, num_pages+1)]
+    pages_to_process = get_ocr_pages(num_pages, ocr_only_first_last_pages,
+                                     ocr_early_exit)
     logger.debug(f'Pages to process: {pages_to_process}')
 
-    text = ''
-    for i, page in enumerate(pages_to_process, start=1):
-        logger.debug(f'Processing page {i} of {len(pages_to_process)}')
-        # Make temporary files
-        tmp_file = tempfile.mkstemp()[1]
-        tmp_file_txt = tempfile.mkstemp(suffix='.txt')[1]
-        logger.debug(f'Running OCR of page {page}...')
-        logger.debug(f'Using tmp files {tmp_file} and {tmp_file_txt}')
-        # doc(pdf, djvu) --> image(png, tiff)
-        result = page_convert_cmd(page, file_path, tmp_file)
-        if result.returncode == 0:
-            logger.debug(f"Result of {page_convert_cmd.__name__}():\n{result}")
-            # image --> text
-            logger.debug(f"Running the '{ocr_command}'...")
-            result = eval(f'{ocr_command}("{tmp_file}", "{tmp_file_txt}")')
-            if result.returncode == 0:
-                logger.debug(f"Result of '{ocr_command}':\n{result}")
-                with open(tmp_file_txt, 'r') as f:
-                    data = f.read()
-                    # logger.debug(f"Text content of page {page}:\n{data}")
-                text += data
-            else:
-                msg = red(f"Image couldn't be converted to text: {result}")
+    # Split the pages in chunks of consecutive pages, at least one per job
+    ocr_jobs = max(1, min(OCR_JOBS if ocr_jobs is None else ocr_jobs,
+                          len(pages_to_process)))
+    chunk_size = min(ocr_raster_pages or 1,
+                     math.ceil(len(pages_to_process) / ocr_jobs))
+    chunks = get_page_chunks(pages_to_process, chunk_size)
+    logger.debug(f'Processing {len(pages_to_process)} pages in {len(chunks)} '
+                 f'chunks with {ocr_jobs} job{"s" if ocr_jobs > 1 else ""}')
+    ocr_func = globals()[ocr_command]
+    ocr_pipe_func = _OCR_PIPE_COMMANDS.get(ocr_command)
+    matcher = get_isbn_matcher(isbn_regex, isbn_blacklist_regex)
+
+    def ocr_pages(pages):
+        texts = []
+        tmpdir = workspace.mkdir(images=True)
+        logger.debug(f'Running OCR of pages {pages}...')
+        try:
+            # doc(pdf, djvu) --> images(png, tiff)
+            result, image_files = rasterize_cmd(
+                file_path, min(pages), max(pages), tmpdir,
+                run=partial(run, timeout=ocr_page_timeout and ocr_page_timeout * len(pages)))
+            workspace.account()
+            if result.returncode != 0:
+                msg = red(f"Document couldn't be converted to images: {result}")
                 logger.error(f'{msg}')
-                logger.error(f'Skipping current page ({page})')
-        else:
-            msg = red(f"Document couldn't be converted to image: {result}")
-            logger.error(f'{msg}')
-            logger.error(f'Skipping current page ({page})')
-        # Remove temporary files
-        logger.debug('Cleaning up tmp files')
-        remove_file(tmp_file)
-        remove_file(tmp_file_txt)
+                logger.error(f'Skipping the pages {pages}')
+                return ['' for _ in pages]
+            logger.debug(f"Result of {rasterize_cmd.__name__}():\n{result}")
+            for page in pages:
+                # image --> text
+                image_file = image_files[page]
+                if ocr_pipe_func:
+                    with open(image_file, 'rb') as f:
+                        image_data = f.read()
+                    remove_file(image_file)
+                    result = ocr_pipe_func(image_data, run=run)
+                    data = result.stdout
+                else:
+                    tmp_file_txt = os.path.join(tmpdir, f'page-{page}.txt')
+                    result = ocr_func(image_file, tmp_file_txt)
+                    data = ''
+                    if result.returncode == 0:
+                        with open(tmp_file_txt, 'r') as f:
+                            data = f.read()
+                if result.returncode == 0:
+                    logger.debug(f"Result of '{ocr_command}' on page {page}:\n{result.returncode}")
+                    texts.append(data)
+                    # The next pages of the chunk are not needed
+                    if ocr_early_exit and matcher.findall(data):
+                        break
+                else:
+                    msg = red(f"Image couldn't be converted to text: {result}")
+                    logger.error(f'{msg}')
+                    logger.error(f'Skipping current page ({page})')
+                    texts.append('')
+            return texts
+        finally:
+            # Remove temporary files
+            logger.debug('Cleaning up tmp files')
+            remove_tree(tmpdir)
+
+    seen = set()
+    texts = []
+    # NOTE: the threads are done before the workspace is removed
+    with _scratch_workspace(workspace, ocr_scratch_dir=ocr_scratch_dir) as workspace, \
+            closing(_imap_threads(ocr_pages, chunks, ocr_jobs)) as results:
+        for pages, chunk_texts in zip(chunks, results):
+            texts.extend(chunk_texts)
+            if ocr_early_exit and matcher.findall(''.join(chunk_texts), seen):
+                logger.debug(f'Found ISBNs in the pages {pages}, the remaining '
+                             'pages are skipped')
+                break
     # Everything on the stdout must be copied to the output file
     logger.debug('Saving the text content')
     with open(output_file, 'w') as f:
-        f.write(text)
+        f.write(''.join(texts))
+    return 0
+
+
+# Same as ocr_file() but with asyncio: the chunks of pages are processed by up
+# to `ocr_jobs` tasks and the cancelled tasks kill their child processes, see
+# run_cmd_async()
+async def ocr_file_async(file_path, output_file, mime_type, run=None,
+                         ocr_command=OCR_COMMAND,
+                         ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES,
+                         ocr_jobs=OCR_JOBS, ocr_early_exit=OCR_EARLY_EXIT,
+                         ocr_raster_pages=OCR_RASTER_PAGES,
+                         isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+                         isbn_regex=ISBN_REGEX,
+                         ocr_page_timeout=OCR_PAGE_TIMEOUT,
+                         ocr_scratch_dir=OCR_SCRATCH_DIR, workspace=None, **kwargs):
+    import asyncio
+    run = run or run_cmd_async
+    loop = asyncio.get_running_loop()
+    if ocr_command not in globals():
+        msg = red(f"Function '{ocr_command}' doesn't exit.")
+        logger.error(f'{msg}')
+        return 1
+    ocr_func = globals()[ocr_command]
+    ocr_pipe_func = _OCR_PIPE_COMMANDS.get(ocr_command)
+    if mime_type.startswith('application/pdf'):
+        rasterize_cmd = rasterize_pdf_pages
+    elif mime_type.startswith('image/vnd.djvu'):
+        rasterize_cmd = rasterize_djvu_pages
+    elif mime_type.startswith('image/'):
+        logger.debug(f"Running OCR on file '{file_path}' and with mime type '{mime_type}'...")
+        if ocr_command == 'tesseract_wrapper':
+            result = await tesseract_wrapper(file_path, output_file, run=partial(
+                run, timeout=ocr_page_timeout))
+        else:
+            result = await loop.run_in_executor(None, ocr_func, file_path, output_file)
+        logger.debug(f"Result of '{ocr_command}':\n{result}")
+        return 0
+    else:
+        logger.error(f"{red('Unsupported mime type')} '{mime_type}'!")
+        return 1
+
+    result = await get_num_pages_async(file_path, mime_type, run)
+    num_pages = result.stdout
+    if result.returncode != 0 or not num_pages:
+        msg = "Couldn't get number of pages:"
+        logger.error(f"{red(msg)} '{str(result.stderr).strip()}'")
+        return 1
+    pages_to_process = get_ocr_pages(num_pages, ocr_only_first_last_pages,
+                                     ocr_early_exit)
+    ocr_jobs = max(1, min(OCR_JOBS if ocr_jobs is None else ocr_jobs,
+                          len(pages_to_process)))
+    chunk_size = min(ocr_raster_pages or 1,
+                     math.ceil(len(pages_to_process) / ocr_jobs))
+    chunks = get_page_chunks(pages_to_process, chunk_size)
+    matcher = get_isbn_matcher(isbn_regex, isbn_blacklist_regex)
+    semaphore = asyncio.Semaphore(ocr_jobs)
+
+    async def ocr_pages(pages):
+        texts = []
+        async with semaphore:
+            tmpdir = workspace.mkdir(images=True)
+            try:
+                result, image_files = rasterize_cmd(
+                    file_path, min(pages), max(pages), tmpdir,
+                    run=partial(run, timeout=ocr_page_timeout and ocr_page_timeout * len(pages)))
+                result = await result
+                workspace.account()
+                if result.returncode != 0:
+                    msg = red(f"Document couldn't be converted to images: {result}")
+                    logger.error(f'{msg}')
+                    return ['' for _ in pages]
+                for page in pages:
+                    image_file = image_files[page]
+                    if ocr_pipe_func:
+                        with open(image_file, 'rb') as f:
+                            image_data = f.read()
+                        remove_file(image_file)
+                        result = await ocr_pipe_func(image_data, run=run)
+                        data = result.stdout
+                    else:
+                        tmp_file_txt = os.path.join(tmpdir, f'page-{page}.txt')
+                        result = await loop.run_in_executor(
+                            None, ocr_func, image_file, tmp_file_txt)
+                        data = ''
+                        if result.returncode == 0:
+                            with open(tmp_file_txt, 'r') as f:
+                                data = f.read()
+                    if result.returncode != 0:
+                        msg = red(f"Image couldn't be converted to text: {result}")
+                        logger.error(f'{msg}')
+                        data = ''
+                    texts.append(data)
+                    if ocr_early_exit and matcher.findall(data):
+                        break
+                return texts
+            finally:
+                remove_tree(tmpdir)
+
+    seen = set()
+    texts = []
+    with _scratch_workspace(workspace, ocr_scratch_dir=ocr_scratch_dir) as workspace:
+        tasks = [asyncio.ensure_future(ocr_pages(pages)) for pages in chunks]
+        try:
+            for pages, task in zip(chunks, tasks):
+                chunk_texts = await task
+                texts.extend(chunk_texts)
+                if ocr_early_exit and matcher.findall(''.join(chunk_texts), seen):
+                    logger.debug(f'Found ISBNs in the pages {pages}, the remaining '
+                                 'pages are skipped')
+                    break
+        finally:
+            # The pending chunks are not needed (early exit or cancellation)
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+    with open(output_file, 'w') as f:
+        f.write(''.join(texts))
     return 0
 
 
-def pdftotext(input_file, output_file, first_page_to_convert=None, last_page_to_convert=None):
-    first_page = f'-f {first_page_to_convert}' if first_page_to_convert else ''
-    last_page = f'-l {last_page_to_convert}' if last_page_to_convert else ''
-    pages = f'{first_page} {last_page}'.strip()
-    cmd = f'pdftotext "{input_file}" "{output_file}" {pages}'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return convert_result_from_shell_cmd(result)
+# Same as `map(func, items)` but with up to `max_workers` items processed at the
+# same time by threads. The results are yielded in the order of the items and
+# no more than `max_workers` items are started ahead of the consumer, thus the
+# items that are still pending are cancelled when the generator is closed.
+def _imap_threads(func, items, max_workers):
+    from concurrent.futures import ThreadPoolExecutor
+    items = iter(items)
+    futures = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for item in itertools.islice(items, max_workers):
+                futures.append(executor.submit(func, item))
+            while futures:
+                result = futures.popleft().result()
+                for item in itertools.islice(items, 1):
+                    futures.append(executor.submit(func, item))
+                yield result
+        finally:
+            for future in futures:
+                future.cancel()
+
+
+# Same as _imap_threads() but with worker processes and the results are
+# yielded as soon as each item is done unless `ordered`. The items are consumed
+# lazily (e.g. from stdin) and at most `max_pending` (by default 4 by worker)
+# are submitted or buffered at once, so that huge inputs don't end up all
+# queued in memory.
+def _imap_processes(func, items, max_workers, ordered=False, max_pending=None):
+    from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+    if max_workers == 1:
+        # No need to pay for the process pool
+        yield from map(func, items)
+        return
+    max_pending = max_pending or max_workers * 4
+    items = iter(items)
+    # The submitted items by index, also the done ones waiting for their turn
+    # with `ordered`
+    futures = {}
+    next_index = 0
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            for index, item in enumerate(itertools.chain(items, [None])):
+                if item is not None:
+                    futures[index] = executor.submit(func, item)
+                    if len(futures) < max_pending:
+                        continue
+                # Wait for some items to be done before submitting more
+                while futures and (len(futures) >= max_pending or item is None):
+                    if ordered:
+                        yield futures.pop(next_index).result()
+                        next_index += 1
+                    else:
+                        done, _ = wait(futures.values(), return_when=FIRST_COMPLETED)
+                        for index_, future in list(futures.items()):
+                            if future in done:
+                                del futures[index_]
+                                yield future.result()
+        finally:
+            # e.g. KeyboardInterrupt or the caller stopped iterating
+            for future in futures.values():
+                future.cancel()
+
+
+# In-process converter backend for pdfs with PyMuPDF (MuPDF bindings), the text
+# is written page by page
+def _pymupdf_to_txt(input_file, output_file, first_page=None, last_page=None,
+                    check_timeout=None):
+    pymupdf = _import_optional('pymupdf') or _import_optional('fitz')
+    try:
+        with pymupdf.open(input_file) as doc, open(output_file, 'w') as f:
+            for page_index in range((first_page or 1) - 1,
+                                    min(last_page or doc.page_count, doc.page_count)):
+                if check_timeout:
+                    check_timeout()
+                f.write(doc[page_index].get_text())
+    except StageTimeoutError:
+        raise
+    except Exception as e:
+        # e.g. a damaged or encrypted document
+        return Result(stderr=str(e), returncode=1, args=['pymupdf', input_file])
+    return Result(returncode=0, args=['pymupdf', input_file])
+
+
+# Pure-Python converter backend for pdfs with pypdf, slower than pdftotext on
+# big documents but without a subprocess
+def _pypdf_to_txt(input_file, output_file, first_page=None, last_page=None,
+                  check_timeout=None):
+    pypdf = _import_optional('pypdf')
+    try:
+        reader = pypdf.PdfReader(input_file)
+        num_pages = len(reader.pages)
+        with open(output_file, 'w') as f:
+            for page_index in range((first_page or 1) - 1,
+                                    min(last_page or num_pages, num_pages)):
+                if check_timeout:
+                    check_timeout()
+                f.write(reader.pages[page_index].extract_text() or '')
+                f.write('\n')
+    except StageTimeoutError:
+        raise
+    except Exception as e:
+        # e.g. a damaged or encrypted document
+        return Result(stderr=str(e), returncode=1, args=['pypdf', input_file])
+    return Result(returncode=0, args=['pypdf', input_file])
+
+
+def pdftotext(input_file, output_file, first_page_to_convert=None,
+              last_page_to_convert=None, run=None):
+    args = ['pdftotext', input_file, output_file]
+    if first_page_to_convert:
+        args += ['-f', str(first_page_to_convert)]
+    if last_page_to_convert:
+        args += ['-l', str(last_page_to_convert)]
+    return (run or run_cmd)(args)
+
+
+# Sends `input_data` (a path or a string) to the server listening on the Unix
+# socket `socket_path` (see IsbnServer) and returns its response, e.g.
+#   {'input': 'book.pdf', 'isbns': ['9780306406157'], 'stage': 'text', ...}
+def query_server(socket_path, input_data, timeout=None):
+    import json
+    import socket
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(socket_path)
+        sock.sendall(json.dumps({'input': input_data}).encode() + b'\n')
+        with sock.makefile('rb') as f:
+            line = f.readline()
+    if not line:
+        raise ConnectionError(f'No response from the server on {socket_path}')
+    return json.loads(line)
+
+
+# Converts the pages `first_page` to `last_page` of a djvu document to tif
+# images in `output_dir` with a single ddjvu call. Returns the result and the
+# image file of each page.
+def rasterize_djvu_pages(input_file, first_page, last_page, output_dir, run=None):
+    # NOTE: with -eachpage, %d is replaced by the page number
+    output_file = os.path.join(output_dir, 'page-%d.tif')
+    result = (run or run_cmd)(['ddjvu', '-format=tif', f'-page={first_page}-{last_page}',
+                               '-eachpage', input_file, output_file])
+    image_files = {page: output_file % page
+                   for page in range(first_page, last_page + 1)}
+    return result, image_files
+
+
+# Converts the pages `first_page` to `last_page` of a pdf document to png
+# images in `output_dir` with a single gs call, i.e. the pdf is only parsed
+# once. Returns the result and the image file of each page.
+def rasterize_pdf_pages(input_file, first_page, last_page, output_dir, run=None):
+    # NOTE: %d is replaced by the output page number (starting at 1)
+    output_file = os.path.join(output_dir, 'page-%d.png')
+    result = (run or run_cmd)(['gs', '-dSAFER', '-q', '-r300', f'-dFirstPage={first_page}',
+                               f'-dLastPage={last_page}', '-dNOPAUSE', '-dINTERPOLATE',
+                               '-sDEVICE=png16m', f'-sOutputFile={output_file}',
+                               input_file, '-c', 'quit'])
+    image_files = {page: output_file % (page - first_page + 1)
+                   for page in range(first_page, last_page + 1)}
+    return result, image_files
+
+
+# Reads the metadata fields of an ebook that can contain ISBNs in-process,
+# without calibre's `ebook-meta`, and returns them as text (one field by
+# line, '' if none). Only the needed bytes of the file are read:
+# - pdf: the strings of the Info dictionary and the identifier-like fields of
+#   the XMP packet, found from the cross-reference table or stream
+# - epub: the `dc:identifier` values of the OPF package document
+# - mobi/azw3: the title and the EXTH records (e.g. ISBN, ASIN) of the header
+# - djvu: the metadata annotations (`djvused` is run for compressed ones)
+# Returns None if there is no reader for the MIME type or if the file can't be
+# parsed, then `ebook-meta` has to be used, see get_ebook_metadata().
+def read_ebook_metadata(file_path, mime_type, run=None):
+    import struct
+    import zipfile
+    try:
+        if mime_type == 'application/pdf':
+            return _read_pdf_metadata(file_path)
+        elif mime_type == 'application/epub+zip':
+            return _read_epub_metadata(file_path)
+        elif mime_type == 'application/x-mobipocket-ebook':
+            return _read_mobi_metadata(file_path)
+        elif mime_type.startswith('image/vnd.djvu'):
+            return _read_djvu_metadata(file_path, run)
+    except (KeyError, IndexError, OSError, ValueError, struct.error, zlib.error,
+            zipfile.BadZipFile) as e:
+        logger.debug(f"Couldn't read the metadata of '{file_path}': {e}")
+    return None
+
+
+def _read_djvu_metadata(file_path, run=None):
+    fields = []
+    compressed = False
+    with open(file_path, 'rb') as f:
+        if f.read(4) != b'AT&T':
+            raise ValueError('not a djvu file')
+        for chunk_id, data_offset, size in _iter_djvu_chunks(f, 4, os.fstat(f.fileno()).st_size):
+            if chunk_id == b'ANTa':
+                f.seek(data_offset)
+                data = f.read(min(size, _METADATA_MAX_READ_SIZE))
+                fields.extend(_parse_djvu_metadata(data.decode('utf-8', errors='replace')))
+            elif chunk_id == b'ANTz':
+                compressed = True
+    if not fields and compressed:
+        # The annotations are BZZ-compressed, they are decoded by djvulibre
+        logger.debug('The djvu annotations are compressed, using djvused to read them')
+        result = (run or run_cmd)(['djvused', '-e', 'print-meta', file_path])
+        return result.stdout if result.returncode == 0 else ''
+    return '\n'.join(fields)
+
+
+# Iterates over the chunks (chunk_id, data_offset, size) of the IFF structure of
+# a djvu file, nested FORM chunks included, from `start` to `end` (offsets).
+# Only the chunk headers are read and the iteration stops after the first
+# page, i.e. the shared annotations and the ones of the first page are found.
+def _iter_djvu_chunks(f, start, end):
+    import struct
+    pos = start
+    while pos + 8 <= end:
+        f.seek(pos)
+        header = f.read(12)
+        if len(header) < 8:
+            return
+        chunk_id = header[:4]
+        size = struct.unpack('>I', header[4:8])[0]
+        if chunk_id == b'FORM':
+            form_type = header[8:12]
+            yield from _iter_djvu_chunks(f, pos + 12, min(pos + 8 + size, end))
+            if form_type == b'DJVU':
+                return
+        else:
+            yield chunk_id, pos + 8, size
+        # The chunks are aligned on even offsets
+        pos += 8 + size + (size & 1)
+
+
+# Returns the fields (e.g. 'isbn\t9780306406157') of the `(metadata ...)`
+# s-expressions of djvu annotations
+def _parse_djvu_metadata(text):
+    fields = []
+    for match in re.finditer(r'\(\s*metadata\b', text):
+        # The end of the s-expression, the quoted strings can contain parentheses
+        depth, end = 0, len(text)
+        for token in re.finditer(r'"(?:[^"\\]|\\.)*"|[()]', text[match.start():]):
+            depth += {'(': 1, ')': -1}.get(token.group(), 0)
+            if depth == 0:
+                end = match.start() + token.end()
+                break
+        for key, value in re.findall(r'\(\s*([\w-]+)\s+"((?:[^"\\]|\\.)*)"\s*\)',
+                                     text[match.end():end]):
+            # The quotes and backslashes are escaped in the values
+            fields.append(f'{key}\t' + re.sub(r'\\(.)', r'\1', value))
+    return fields
+
+
+def _read_epub_metadata(file_path):
+    import zipfile
+    with zipfile.ZipFile(file_path) as zf:
+        names = zf.namelist()
+        opf_path = _get_epub_opf_path(zf, names)
+        if opf_path is None:
+            return ''
+        opf_text = zf.read(opf_path).decode('utf-8', errors='ignore')
+    return '\n'.join(_parse_epub_opf(opf_text, opf_path)[0])
+
+
+# The MOBI header is in the first record of the Palm database, after the
+# PalmDOC header, and is followed by the EXTH header (if any)
+# Ref.: https://wiki.mobileread.com/wiki/MOBI
+def _read_mobi_metadata(file_path):
+    import struct
+    with open(file_path, 'rb') as f:
+        # Palm database header and the offsets of the first two records
+        header = f.read(94)
+        num_records = struct.unpack_from('>H', header, 76)[0]
+        record0_offset = struct.unpack_from('>I', header, 78)[0]
+        record0_size = struct.unpack_from('>I', header, 86)[0] - record0_offset \
+            if num_records > 1 else _METADATA_MAX_READ_SIZE
+        f.seek(record0_offset)
+        record0 = f.read(min(max(record0_size, 0), _METADATA_MAX_READ_SIZE))
+    if record0[16:20] != b'MOBI':
+        raise ValueError('no MOBI header')
+    # The MOBI header: its length, the mobi type and then the text encoding
+    mobi_header_size, _, encoding = struct.unpack_from('>III', record0, 20)
+    encoding = 'utf-8' if encoding == 65001 else 'cp1252'
+    title_offset, title_size = struct.unpack_from('>II', record0, 0x54)
+    fields = [record0[title_offset:title_offset + title_size].decode(encoding, errors='replace')]
+    exth_flags = struct.unpack_from('>I', record0, 0x80)[0]
+    pos = 16 + mobi_header_size
+    if exth_flags & 0x40 and record0[pos:pos + 4] == b'EXTH':
+        num_exth_records = struct.unpack_from('>I', record0, pos + 8)[0]
+        pos += 12
+        for _ in range(num_exth_records):
+            exth_type, exth_size = struct.unpack_from('>II', record0, pos)
+            if exth_size < 8:
+                raise ValueError(f'invalid EXTH record at {pos}')
+            if exth_type in _MOBI_EXTH_FIELDS:
+                value = record0[pos + 8:pos + exth_size].decode(encoding, errors='replace')
+                fields.append(f'{_MOBI_EXTH_FIELDS[exth_type]}\t{value}')
+            pos += exth_size
+    return '\n'.join(fields)
+
+
+def _read_pdf_metadata(file_path):
+    with open(file_path, 'rb') as f:
+        pdf = _PdfObjects(f)
+        fields = []
+        info_ref = _get_pdf_ref(pdf.trailer, b'Info')
+        if info_ref is not None:
+            fields.extend(_iter_pdf_strings(pdf.get_object(info_ref)[0]))
+        root_ref = _get_pdf_ref(pdf.trailer, b'Root')
+        metadata_ref = None if root_ref is None \
+            else _get_pdf_ref(pdf.get_object(root_ref)[0], b'Metadata')
+        if metadata_ref is not None:
+            fields.extend(_get_xmp_fields(pdf.get_stream(metadata_ref)))
+    return '\n'.join(field for field in fields if field.strip())
+
+
+# Registers a converter backend (see ConverterBackend) used by convert_to_txt(),
+# a backend with the same name is replaced. Backends can also be provided by
+# installed packages, as ConverterBackend objects of entry points in the group
+# 'find_isbns.converters'.
+def register_converter(backend):
+    _CONVERTERS[backend.name] = backend
+
+
+# Registers the converter backends of the installed plugins, once per process
+@lru_cache(maxsize=None)
+def _load_converter_plugins():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # Python 3.7
+        return
+    eps = entry_points()
+    eps = eps.select(group='find_isbns.converters') if hasattr(eps, 'select') \
+        else eps.get('find_isbns.converters', [])
+    for ep in eps:
+        try:
+            register_converter(ep.load())
+        except Exception as e:
+            logger.warning(yellow(f"Couldn't load the converter plugin '{ep.name}': {e}"))
 
 
 def remove_file(file_path):
@@ -653,6 +3195,7 @@ def remove_file(file_path):
 # Recursively delete a directory tree, including the parent directory
 # Ref.: https://stackoverflow.com/a/186236
 def remove_tree(file_path):
+    import shutil
     try:
         shutil.rmtree(file_path)
         return 0
@@ -669,47 +3212,391 @@ def remove_tree(file_path):
 def reorder_file_content(
         file_path,
         isbn_reorder_files=ISBN_REORDER_FILES, **kwargs):
-    if isbn_reorder_files:
-        isbn_rf_scan_first = isbn_reorder_files[0]
-        isbn_rf_reverse_last = isbn_reorder_files[1]
-        logger.debug('Reordering input file (if possible), read first '
-                     f'{isbn_rf_scan_first} lines normally, then read '
-                     f'last {isbn_rf_reverse_last} lines in reverse and '
-                     'then read the rest')
-        # TODO: try out with big file, more than 800 pages (approx. 73k lines)
-        # TODO: see alternatives for reading big file @
-        # https://stackoverflow.com/a/4999741 (mmap),
-        # https://stackoverflow.com/a/24809292 (linecache),
-        # https://stackoverflow.com/a/42733235 (buffer)
-        with open(file_path, 'r') as f:
-            # Read whole file as a list of lines
-            # TODO: do we remove newlines? e.g. with f.read().rstrip("\n")
-            data = f.readlines()
-            # Read the first ISBN_GREP_RF_SCAN_FIRST lines of the file text
-            first_part = data[:isbn_rf_scan_first]
-            del data[:isbn_rf_scan_first]
-            # Read the last part and reverse it
-            last_part = data[-isbn_rf_reverse_last:]
-            if last_part:
-                last_part.reverse()
-                del data[-isbn_rf_reverse_last:]
-            # Read the middle part of the file text
-            middle_part = data
-            # TODO: try out with large lists, if efficiency is a concern then
-            # check itertools.chain
-            # ref.: https://stackoverflow.com/a/4344735
-            # Concatenate the three parts: first, last part (reversed), and
-            # middle part
-            data = first_part + last_part + middle_part
-            data = "".join(data)
-    else:
+    if not isbn_reorder_files:
         logger.debug('Since `isbn_reorder_file`s is False, input file will '
                      'not be reordered')
-        with open(file_path, 'r') as f:
-            # TODO: do we remove newlines? e.g. with f.read().rstrip("\n")
-            # Read whole content of file as a string
-            data = f.read()
-    return data
+    # NOTE: to search a big file, use find_isbns_in_file() which doesn't load
+    # the whole file in memory
+    return ''.join(iter_file_content(file_path, isbn_reorder_files))
+
+
+# Runs the command `args` (a list, no shell) and returns its Result with the
+# raw stdout and stderr (decoded only when accessed). The tool is looked up
+# with get_tool_path() and a missing tool gives the returncode 127 like in a
+# shell. With `stdout_file`, the output is saved directly in this file.
+# The command runs in its own process group which is killed (e.g. with the
+# workers of ebook-convert) if it takes longer than `timeout` seconds, then
+# subprocess.TimeoutExpired is raised.
+# With `stdout_callback`, the stdout is given by chunks (bytes) to this
+# function as the command writes it (not kept in the result) and the command is
+# killed as soon as the function returns True (`input` isn't supported).
+# The command helpers (e.g. pdftotext()) take the runner as `run` argument,
+# see get_stage_runner() and run_cmd_async() for the asyncio API.
+def run_cmd(args, input=None, stdout_file=None, timeout=None, stdout_callback=None):
+    import subprocess
+    args = [str(arg) for arg in args]
+    tool_path = get_tool_path(args[0])
+    if tool_path is None:
+        return Result(stderr=f'{args[0]}: command not found', returncode=127,
+                      args=args)
+    f = open(stdout_file, 'wb') if stdout_file else None
+    try:
+        with subprocess.Popen([tool_path] + args[1:],
+                              stdin=subprocess.PIPE if input is not None else None,
+                              stdout=f or subprocess.PIPE, stderr=subprocess.PIPE,
+                              start_new_session=True) as proc:
+            try:
+                if stdout_callback is None:
+                    stdout, stderr = proc.communicate(input, timeout=timeout)
+                else:
+                    stdout, stderr = _communicate_stream(proc, stdout_callback, timeout)
+            except BaseException:
+                # e.g. subprocess.TimeoutExpired or KeyboardInterrupt
+                _kill_process_group(proc)
+                raise
+    finally:
+        if f:
+            f.close()
+    return Result(stdout=stdout or b'', stderr=stderr,
+                  returncode=proc.returncode, args=args)
+
+
+# Same as run_cmd() but with asyncio: the coroutine doesn't block the event
+# loop and the child process is killed if the task is cancelled. With
+# `semaphore`, the number of child processes run at the same time is limited,
+# see get_async_semaphore(). See run_cmd() for `timeout`.
+async def run_cmd_async(args, input=None, stdout_file=None, timeout=None,
+                        semaphore=None, stdout_callback=None):
+    import asyncio
+    import subprocess
+    if semaphore is not None:
+        async with semaphore:
+            return await run_cmd_async(args, input, stdout_file, timeout,
+                                       stdout_callback=stdout_callback)
+    args = [str(arg) for arg in args]
+    tool_path = get_tool_path(args[0])
+    if tool_path is None:
+        return Result(stderr=f'{args[0]}: command not found', returncode=127,
+                      args=args)
+    f = open(stdout_file, 'wb') if stdout_file else None
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            tool_path, *args[1:],
+            stdin=subprocess.PIPE if input is not None else None,
+            stdout=f or subprocess.PIPE, stderr=subprocess.PIPE,
+            start_new_session=True)
+        try:
+            if stdout_callback is None:
+                stdout, stderr = await asyncio.wait_for(proc.communicate(input), timeout)
+            else:
+                stdout, stderr = await asyncio.wait_for(
+                    _communicate_stream_async(proc, stdout_callback), timeout)
+        except BaseException as e:
+            # e.g. asyncio.CancelledError
+            if proc.returncode is None:
+                logger.debug(f'Killing {args}')
+                _kill_process_group(proc)
+                await proc.wait()
+            if isinstance(e, asyncio.TimeoutError):
+                raise subprocess.TimeoutExpired(args, timeout) from e
+            raise
+    finally:
+        if f:
+            f.close()
+    return Result(stdout=stdout or b'', stderr=stderr,
+                  returncode=proc.returncode, args=args)
+
+
+# Reads the stdout of the process by chunks for `stdout_callback` (see
+# run_cmd()) and its stderr from a thread. The process is killed when the
+# callback returns True or after `timeout` seconds, then
+# subprocess.TimeoutExpired is raised. Returns the tuple (b'', stderr).
+def _communicate_stream(proc, stdout_callback, timeout=None):
+    import subprocess
+    stderr = []
+    stderr_thread = threading.Thread(target=lambda: stderr.append(proc.stderr.read()),
+                                     daemon=True)
+    stderr_thread.start()
+    timed_out = threading.Event()
+
+    def kill():
+        if proc.poll() is None:
+            timed_out.set()
+            _kill_process_group(proc)
+
+    timer = threading.Timer(timeout, kill) if timeout is not None else None
+    if timer:
+        timer.daemon = True
+        timer.start()
+    try:
+        while True:
+            chunk = proc.stdout.read1(_STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            if stdout_callback(chunk):
+                logger.debug(f'Stopping {proc.args}')
+                _kill_process_group(proc)
+                break
+        proc.wait()
+    finally:
+        if timer:
+            timer.cancel()
+    stderr_thread.join()
+    if timed_out.is_set():
+        raise subprocess.TimeoutExpired(proc.args, timeout)
+    return b'', stderr[0] if stderr else b''
+
+
+# Same as _communicate_stream() but for an asyncio subprocess, the timeout is
+# handled by run_cmd_async()
+async def _communicate_stream_async(proc, stdout_callback):
+    import asyncio
+    stderr_task = asyncio.ensure_future(proc.stderr.read())
+    try:
+        while True:
+            chunk = await proc.stdout.read(_STREAM_CHUNK_SIZE)
+            if not chunk:
+                break
+            if stdout_callback(chunk):
+                logger.debug(f'Stopping the process {proc.pid}')
+                _kill_process_group(proc)
+                break
+        stderr = await stderr_task
+    finally:
+        stderr_task.cancel()
+    await proc.wait()
+    return b'', stderr
+
+
+def _kill_process_group(proc):
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except AttributeError:
+        # No process groups (Windows)
+        proc.kill()
+    except (PermissionError, ProcessLookupError):
+        pass
+
+
+# Searches an epub for ISBNs without converting it to .txt first. Its texts are
+# searched in the order given by iter_epub_texts() and the search stops as
+# soon as a text contains valid ISBNs, e.g. the `dc:identifier` in the OPF or
+# the copyright page at the start of the book.
+def search_epub_for_isbns(file_path, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+                          isbn_regex=ISBN_REGEX,
+                          isbn_ret_separator=ISBN_RET_SEPARATOR, **kwargs):
+    matcher = get_isbn_matcher(isbn_regex, isbn_blacklist_regex)
+    seen = set()
+    for name, text in iter_epub_texts(file_path):
+        isbns = matcher.findall(text, seen)
+        if isbns:
+            logger.debug(f"Found ISBNs in the epub file '{name}'")
+            return isbn_ret_separator.join(isbns)
+    return ''
+
+
+# Same as reorder_file_content() but for a string
+def reorder_text(text, isbn_reorder_files=ISBN_REORDER_FILES, **kwargs):
+    if not isbn_reorder_files:
+        return text
+    return _reorder_lines(io.StringIO(text).readlines(), isbn_reorder_files)
+
+
+def _reorder_lines(data, isbn_reorder_files):
+    isbn_rf_scan_first = isbn_reorder_files[0]
+    isbn_rf_reverse_last = isbn_reorder_files[1]
+    logger.debug('Reordering input file (if possible), read first '
+                 f'{isbn_rf_scan_first} lines normally, then read '
+                 f'last {isbn_rf_reverse_last} lines in reverse and '
+                 'then read the rest')
+    # Read the first ISBN_GREP_RF_SCAN_FIRST lines of the file text
+    first_part = data[:isbn_rf_scan_first]
+    del data[:isbn_rf_scan_first]
+    # Read the last part and reverse it
+    last_part = data[-isbn_rf_reverse_last:]
+    if last_part:
+        last_part.reverse()
+        del data[-isbn_rf_reverse_last:]
+    # Read the middle part of the file text
+    middle_part = data
+    # TODO: try out with large lists, if efficiency is a concern then
+    # check itertools.chain
+    # ref.: https://stackoverflow.com/a/4344735
+    # Concatenate the three parts: first, last part (reversed), and
+    # middle part
+    data = first_part + last_part + middle_part
+    return "".join(data)
+
+
+# Converts a pdf (pdftotext) or djvu (djvutxt) document to text by windows of
+# pages and searches each window for ISBNs as soon as it is converted: first
+# the first pages, then the last pages (lines in reverse like with
+# `isbn_reorder_files`) and finally the middle. The conversion stops as soon
+# as a window contains valid ISBNs, thus most of the document is never
+# converted when the ISBNs are in the copyright page or on the back cover.
+# Returns the tuple (isbns, has_text) or None if the document can't be
+# converted this way (e.g. another convert method or unknown number of pages).
+def search_pages_for_isbns(
+        file_path, output_file, mime_type,
+        isbn_blacklist_regex=ISBN_BLACKLIST_REGEX, isbn_regex=ISBN_REGEX,
+        isbn_ret_separator=ISBN_RET_SEPARATOR,
+        djvu_convert_method=DJVU_CONVERT_METHOD,
+        pdf_convert_method=PDF_CONVERT_METHOD,
+        convert_progressive_pages=CONVERT_PROGRESSIVE_PAGES, run=None, **kwargs):
+    converter = _get_pages_converter(mime_type, djvu_convert_method, pdf_convert_method)
+    if converter is None:
+        return None
+    if mime_type.startswith('application/pdf'):
+        result = get_pages_in_pdf(file_path, run=run)
+    else:
+        result = get_pages_in_djvu(file_path, run=run)
+    windows = _get_progressive_windows(result, convert_progressive_pages)
+    if windows is None:
+        return None
+    matcher = get_isbn_matcher(isbn_regex, isbn_blacklist_regex)
+    seen = set()
+    has_text = False
+    for i, (first_page, last_page, reverse) in enumerate(windows):
+        logger.debug(f'Converting pages {first_page}-{last_page} to text...')
+        result = converter.convert(file_path, output_file, first_page, last_page, run)
+        if result.returncode != 0:
+            logger.debug(f"Couldn't convert the pages: {result.stderr}")
+            # Let convert_to_txt() deal with the whole document
+            return None if i == 0 else ('', has_text)
+        isbns, window_has_text = _search_page_window(output_file, reverse, matcher, seen)
+        has_text = has_text or window_has_text
+        if isbns:
+            logger.debug(f'Found ISBNs in pages {first_page}-{last_page}')
+            return isbn_ret_separator.join(isbns), has_text
+    return '', has_text
+
+
+# Same as search_pages_for_isbns() but with asyncio, see run_cmd_async()
+async def search_pages_for_isbns_async(
+        file_path, output_file, mime_type, run,
+        isbn_blacklist_regex=ISBN_BLACKLIST_REGEX, isbn_regex=ISBN_REGEX,
+        isbn_ret_separator=ISBN_RET_SEPARATOR,
+        djvu_convert_method=DJVU_CONVERT_METHOD,
+        pdf_convert_method=PDF_CONVERT_METHOD,
+        convert_progressive_pages=CONVERT_PROGRESSIVE_PAGES, **kwargs):
+    converter = _get_pages_converter(mime_type, djvu_convert_method, pdf_convert_method)
+    if converter is None:
+        return None
+    result = await get_num_pages_async(file_path, mime_type, run)
+    windows = _get_progressive_windows(result, convert_progressive_pages)
+    if windows is None:
+        return None
+    matcher = get_isbn_matcher(isbn_regex, isbn_blacklist_regex)
+    seen = set()
+    has_text = False
+    for i, (first_page, last_page, reverse) in enumerate(windows):
+        logger.debug(f'Converting pages {first_page}-{last_page} to text...')
+        result = await convert_to_txt_async(file_path, output_file, mime_type, run,
+                                            first_page, last_page, converter)
+        if result.returncode != 0:
+            logger.debug(f"Couldn't convert the pages: {result.stderr}")
+            return None if i == 0 else ('', has_text)
+        isbns, window_has_text = _search_page_window(output_file, reverse, matcher, seen)
+        has_text = has_text or window_has_text
+        if isbns:
+            logger.debug(f'Found ISBNs in pages {first_page}-{last_page}')
+            return isbn_ret_separator.join(isbns), has_text
+    return '', has_text
+
+
+# Returns the converter backend of the document if it can convert its pages by
+# windows (see search_pages_for_isbns()) and its number of pages can be found,
+# else None
+def _get_pages_converter(mime_type, djvu_convert_method, pdf_convert_method):
+    if mime_type.startswith('application/pdf'):
+        if not command_exists('mdls') and not command_exists('pdfinfo'):
+            return None
+    elif mime_type.startswith('image/vnd.djvu'):
+        if not command_exists('djvused'):
+            return None
+    else:
+        return None
+    converter = get_converter(mime_type, get_convert_method(
+        mime_type, djvu_convert_method=djvu_convert_method,
+        pdf_convert_method=pdf_convert_method))
+    return converter if converter is not None and converter.pages else None
+
+
+# Returns the page windows to convert given the result of get_pages_in_pdf()
+# or get_pages_in_djvu() or None if the number of pages is unknown
+def _get_progressive_windows(result, convert_progressive_pages):
+    num_pages = result.stdout
+    if result.returncode != 0 or not isinstance(num_pages, int) or num_pages < 1:
+        logger.debug(f"Couldn't get the number of pages: {result}")
+        return None
+    first_pages, last_pages = [int(i) for i in convert_progressive_pages]
+    return get_page_windows(num_pages, first_pages, last_pages)
+
+
+# Searches the text of a window of pages converted in `output_file`. Returns
+# the tuple (isbns, has_text)
+def _search_page_window(output_file, reverse, matcher, seen):
+    with open(output_file, 'r', encoding='utf-8', errors='ignore') as f:
+        data = f.read()
+    has_text = re.search('[A-Za-z0-9]+', data) is not None
+    if reverse:
+        data = ''.join(reversed(data.splitlines(keepends=True)))
+    return matcher.findall(data, seen), has_text
+
+
+# Converts a document with a converter that writes the text on its stdout
+# (see ConverterBackend) and searches the text for ISBNs as it is received,
+# without going through a .txt file. The converter is stopped as soon as the
+# first lines (see `isbn_reorder_files`) contain ISBNs, thus the rest of the
+# document isn't converted and its ISBNs aren't part of the result. Returns the
+# tuple (isbns, has_text) like search_pages_for_isbns() or None if the
+# document can't be converted this way (e.g. the converter failed).
+def search_converter_stream(
+        file_path, mime_type, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+        isbn_regex=ISBN_REGEX, isbn_ret_separator=ISBN_RET_SEPARATOR,
+        isbn_reorder_files=ISBN_REORDER_FILES, run=None, **kwargs):
+    converter = _get_stream_converter(mime_type, **kwargs)
+    if converter is None:
+        return None
+    search = _TextStreamSearch(get_isbn_matcher(isbn_regex, isbn_blacklist_regex),
+                               isbn_reorder_files)
+    logger.debug(f'Converting the {mime_type} file with {converter.name} and '
+                 'searching its stdout...')
+    result = converter.convert_stream(file_path, search.feed, run=run)
+    return _finish_stream_search(search, result, converter, isbn_ret_separator)
+
+
+# Same as search_converter_stream() but with asyncio, see run_cmd_async()
+async def search_converter_stream_async(
+        file_path, mime_type, run, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+        isbn_regex=ISBN_REGEX, isbn_ret_separator=ISBN_RET_SEPARATOR,
+        isbn_reorder_files=ISBN_REORDER_FILES, **kwargs):
+    converter = _get_stream_converter(mime_type, **kwargs)
+    if converter is None:
+        return None
+    search = _TextStreamSearch(get_isbn_matcher(isbn_regex, isbn_blacklist_regex),
+                               isbn_reorder_files)
+    result = await converter.convert_stream(file_path, search.feed, run=run)
+    return _finish_stream_search(search, result, converter, isbn_ret_separator)
+
+
+# Returns the converter backend of the document if it can write the text on its
+# stdout, else None
+def _get_stream_converter(mime_type, **kwargs):
+    converter = get_converter(mime_type, get_convert_method(mime_type, **kwargs))
+    if converter is None or not converter.stream:
+        return None
+    return converter
+
+
+def _finish_stream_search(search, result, converter, isbn_ret_separator):
+    if search.stopped:
+        logger.debug(f'Found ISBNs in the first lines, {converter.name} was stopped')
+    elif result.returncode != 0:
+        logger.debug(f"Couldn't convert the file with {converter.name}: {result.stderr}")
+        # Let convert_to_txt() deal with the document
+        return None
+    return isbn_ret_separator.join(search.close()), search.has_text
 
 
 # Tries to find ISBN numbers in the given ebook file by using progressively
@@ -728,6 +3615,11 @@ def reorder_file_content(
 # 7. If OCR is enabled and convert_to_txt() fails or its result is empty,
 #    try OCR-ing the file. If the result is non-empty but does not contain
 #    ISBNs and OCR_ENABLED is set to "always", run OCR as well.
+# The MIME type is sniffed from the first bytes of the file (see
+# get_mime_type()) and the steps that can't succeed are skipped: the archives
+# go straight to step 5 and the pdfs, djvus, epubs, mobis and images skip it.
+# With the `report` dict, the step that found the ISBNs is recorded as 'stage'
+# (see PROFILE_STEPS) and the stage that was cut off as 'timed_out_stage'.
 # Ref.: https://bit.ly/2r28US2
 def search_file_for_isbns(
         file_path, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
@@ -739,77 +3631,473 @@ def search_file_for_isbns(
         epub_convert_method=EPUB_CONVERT_METHOD,
         pdf_convert_method=PDF_CONVERT_METHOD,
         ocr_enabled=OCR_ENABLED,
-        ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES, **kwargs):
+        ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES,
+        ocr_jobs=OCR_JOBS,
+        ocr_early_exit=OCR_EARLY_EXIT,
+        ocr_raster_pages=OCR_RASTER_PAGES,
+        convert_progressive=CONVERT_PROGRESSIVE,
+        convert_progressive_pages=CONVERT_PROGRESSIVE_PAGES,
+        convert_stream=CONVERT_STREAM,
+        archive_max_member_size=ARCHIVE_MAX_MEMBER_SIZE,
+        archive_max_total_size=ARCHIVE_MAX_TOTAL_SIZE,
+        cache_dir=None, cache_max_entries=CACHE_MAX_ENTRIES,
+        scratch_dir=SCRATCH_DIR, ocr_scratch_dir=OCR_SCRATCH_DIR, workspace=None,
+        ebook_meta_timeout=EBOOK_META_TIMEOUT, archive_timeout=ARCHIVE_TIMEOUT,
+        convert_timeout=CONVERT_TIMEOUT, ocr_page_timeout=OCR_PAGE_TIMEOUT,
+        file_timeout=FILE_TIMEOUT, deadline=None, report=None, profile=None,
+        **kwargs):
     func_params = locals().copy()
     func_params.pop('file_path')
     basename = os.path.basename(file_path)
+    if deadline is None:
+        # Top-level call: the stages share the time budget and the scratch
+        # workspace of the file
+        func_params['deadline'] = time.monotonic() + file_timeout \
+            if file_timeout else math.inf
+        with profile.file(file_path) if profile else nullcontext() as file_report, \
+                _scratch_workspace(**func_params) as func_params['workspace']:
+            try:
+                isbns = search_file_for_isbns(file_path, **func_params)
+            except StageTimeoutError as e:
+                isbns = _skip_timed_out_file(file_path, e, report)
+                if file_report is not None:
+                    file_report['timed_out_stage'] = e.stage
+            if file_report is not None:
+                file_report['isbns'] = isbns.split(isbn_ret_separator) if isbns else []
+                file_report['scratch_peak_size'] = func_params['workspace'].peak_size
+        return isbns
+    if workspace is None:
+        # e.g. called with a `deadline` but no workspace
+        with ScratchWorkspace(scratch_dir, ocr_scratch_dir) as func_params['workspace']:
+            return search_file_for_isbns(file_path, **func_params)
     logger.info(f"Searching file '{basename}' for ISBN numbers...")
     # Step 1: check the filename for ISBNs
     # TODO: make sure that we return an empty string when we can't find ISBNs
     logger.debug('check the filename for ISBNs')
-    isbns = find_isbns(basename, **func_params)
+    with _profile_step(profile, 'filename'):
+        isbns = find_isbns(basename, **func_params)
     if isbns:
         logger.debug("Extracted ISBNs '{}' from the file name!".format(
             isbns.replace('\n', '; ')))
-        return isbns
+        return _report_stage(report, 'filename', isbns)
 
+    # The next steps only depend on the file content, thus their result can be
+    # cached (the file name is not part of the cache key)
+    if cache_dir:
+        return _search_file_with_cache(file_path, **func_params)
+    return _search_file_content(file_path, **func_params)
+
+
+# Steps 2-7 of search_file_for_isbns(), i.e. the ones that only depend on the
+# file content. With the `report` dict, the stage whose failure (not its
+# timeout) may be the cause of no ISBNs found is recorded as 'failed_stage',
+# e.g. the conversion to text when OCR is disabled.
+def _search_file_content(
+        file_path, isbn_direct_files=ISBN_DIRECT_FILES,
+        isbn_ignored_files=ISBN_IGNORED_FILES,
+        epub_convert_method=EPUB_CONVERT_METHOD, ocr_enabled=OCR_ENABLED,
+        ocr_early_exit=OCR_EARLY_EXIT, convert_progressive=CONVERT_PROGRESSIVE,
+        convert_stream=CONVERT_STREAM, workspace=None,
+        ebook_meta_timeout=EBOOK_META_TIMEOUT, convert_timeout=CONVERT_TIMEOUT,
+        deadline=None, report=None, profile=None, **kwargs):
+    import zipfile
+    func_params = locals().copy()
+    func_params.pop('file_path')
+    func_params.update(func_params.pop('kwargs'))
     # Steps 2-3: (2) if valid MIME type, search file contents for ISBNs and
     # (3) if invalid MIME type, exit without results
     mime_type = get_mime_type(file_path)
     if re.match(isbn_direct_files, mime_type):
         logger.debug('Ebook is in text format, trying to find ISBN directly')
-        data = reorder_file_content(file_path, **func_params)
-        isbns = find_isbns(data, **func_params)
+        get_stage_timeout('direct', deadline=deadline)
+        with _profile_step(profile, 'text'):
+            isbns = find_isbns_in_mmap(file_path, **func_params)
         if isbns:
             logger.debug(f"Extracted ISBNs from the text file contents:\n{isbns}")
         else:
             logger.debug('Did not find any ISBNs')
-        return isbns
+        return _report_stage(report, 'text', isbns)
     elif re.match(isbn_ignored_files, mime_type):
         logger.info('The file type is in the blacklist, ignoring...')
-        return isbns
+        return ''
 
     # Step 4: check the file metadata from calibre's `ebook-meta` for ISBNs
+    # NOTE: the steps that can't find ISBNs in the file type are skipped, e.g. the
+    # archives are only extracted and the pdfs are not given to 7z
+    is_archive = re.match(_ARCHIVE_MIME_TYPES_REGEX, mime_type)
     logger.debug("check the file metadata from calibre's `ebook-meta` for ISBNs")
-    if command_exists('ebook-meta'):
-        ebookmeta = get_ebook_metadata(file_path)
-        logger.debug(f'Ebook metadata:\n{ebookmeta.stdout}')
-        isbns = find_isbns(ebookmeta.stdout, **func_params)
-        if isbns:
-            logger.debug(f"Extracted ISBNs from calibre ebook metadata:\n{isbns}'")
-            return isbns
+    if is_archive or re.match(_NO_METADATA_MIME_TYPES_REGEX, mime_type):
+        logger.debug(f'Skipping `ebook-meta` for the {mime_type} file')
     else:
-        logger.debug("`ebook-meta` is not found!")
+        with _profile_step(profile, 'ebook-meta'):
+            run = get_stage_runner('ebook-meta', ebook_meta_timeout, deadline)
+            get_stage_timeout('ebook-meta', deadline=deadline)
+            metadata = read_ebook_metadata(file_path, mime_type, run=run)
+            if metadata is None and command_exists('ebook-meta'):
+                metadata = get_ebook_metadata(file_path, run=run).stdout
+            elif metadata is None:
+                logger.debug("`ebook-meta` is not found!")
+            logger.debug(f'Ebook metadata:\n{metadata}')
+            isbns = find_isbns(metadata or '', **func_params)
+        if isbns:
+            logger.debug(f"Extracted ISBNs from the ebook metadata:\n{isbns}'")
+            return _report_stage(report, 'ebook-meta', isbns)
 
-    # Step 5: decompress with 7z
-    logger.debug('decompress with 7z')
-    if not mime_type.startswith('application/epub+zip'):
-        isbns = get_all_isbns_from_archive(file_path, **func_params)
+    # Step 5: decompress the archive (in-process for zip/tar, else with 7z)
+    logger.debug('decompress the archive')
+    if not re.match(_NOT_ARCHIVE_MIME_TYPES_REGEX, mime_type):
+        with _profile_step(profile, 'archive'):
+            isbns = get_all_isbns_from_archive(file_path, **func_params)
         if isbns:
             logger.debug(f"Extracted ISBNs from the archive file:\n{isbns}")
+            return _report_stage(report, 'archive', isbns)
+        if is_archive:
+            logger.debug(f'Could not find any ISBNs in {file_path} :(')
             return isbns
+    else:
+        logger.debug(f'Skipping the extraction of the {mime_type} file')
 
     # Step 6: convert file to .txt
-    try_ocr = False
-    tmp_file_txt = tempfile.mkstemp(suffix='.txt')[1]
+    # The epubs are directly searched member by member
+    if mime_type.startswith('application/epub+zip') and epub_convert_method in ('auto', 'epubtxt'):
+        logger.debug('The file looks like an epub, searching its content directly')
+        get_stage_timeout('epub', deadline=deadline)
+        try:
+            with _profile_step(profile, 'convert'):
+                isbns = search_epub_for_isbns(file_path, **func_params)
+            if isbns:
+                logger.debug(f"Extracted ISBNs from the epub content:\n{isbns}")
+            else:
+                logger.debug(f'Could not find any ISBNs in {file_path} :(')
+            return _report_stage(report, 'convert', isbns)
+        except zipfile.BadZipFile as e:
+            logger.debug(f"Couldn't read the epub ({e}), trying to convert it to .txt")
+            func_params['epub_convert_method'] = 'ebook-convert'
+
+    tmp_file_txt = workspace.new_path('.txt')
     logger.debug(f"Converting ebook to text format...")
     logger.debug(f"Temp file: {tmp_file_txt}")
 
-    # TODO: important, takes a long time for pdfs (not djvu)
-    result = convert_to_txt(file_path, tmp_file_txt, mime_type, **func_params)
-    if result.returncode == 0:
+    try:
+        with _profile_step(profile, 'convert'):
+            run = get_stage_runner('convert', convert_timeout, deadline)
+            progressive_result = None
+            if convert_progressive:
+                progressive_result = search_pages_for_isbns(
+                    file_path, tmp_file_txt, mime_type, run=run, **func_params)
+            if progressive_result is None and convert_stream:
+                progressive_result = search_converter_stream(
+                    file_path, mime_type, run=run, **func_params)
+            result = None
+            if progressive_result is None:
+                # TODO: important, takes a long time for pdfs (not djvu)
+                result = convert_to_txt(file_path, tmp_file_txt, mime_type, run=run,
+                                        **func_params)
+            isbns, try_ocr = _check_conversion(tmp_file_txt, result,
+                                               progressive_result, **func_params)
+            workspace.account()
+        _report_stage(report, 'convert', isbns)
+        failed_stage = 'convert' if result is not None and result.returncode != 0 else None
+
+        # Step 7: OCR the file
+        if not isbns and ocr_enabled != 'false' and try_ocr:
+            logger.debug('Trying to run OCR on the file...')
+            with _profile_step(profile, 'ocr'):
+                returncode = ocr_file(file_path, tmp_file_txt, mime_type, **func_params)
+                if returncode == 0:
+                    logger.debug('OCR was successful, checking the result...')
+                    if ocr_early_exit:
+                        # The OCRed text is already in the search order
+                        isbns = find_isbns_in_file(
+                            tmp_file_txt, **dict(func_params, isbn_reorder_files=False))
+                    else:
+                        isbns = find_isbns_in_file(tmp_file_txt, **func_params)
+            failed_stage = 'ocr' if returncode != 0 else None
+            if returncode != 0:
+                logger.info('There was an error while running OCR!')
+            elif isbns:
+                logger.debug(f"Text output contains ISBNs {isbns}!")
+                _report_stage(report, 'ocr', isbns)
+            else:
+                logger.debug('Did not find any ISBNs in the OCR output')
+    finally:
+        if os.path.exists(tmp_file_txt):
+            logger.debug(f'Removing {tmp_file_txt}...')
+            remove_file(tmp_file_txt)
+    _report_failed_stage(report, failed_stage)
+
+    if isbns:
+        logger.debug(f"Returning the found ISBNs:\n{isbns}")
+    else:
+        logger.debug(f'Could not find any ISBNs in {file_path} :(')
+
+    return isbns
+
+
+# Searches the file content (see _search_file_content()) unless its result is
+# already in the cache of `cache_dir`, see ResultCache. The result is not
+# cached if a stage failed (e.g. a conversion error) or timed out (the
+# StageTimeoutError is raised through).
+def _search_file_with_cache(
+        file_path, cache_dir, cache_max_entries=CACHE_MAX_ENTRIES,
+        isbn_ret_separator=ISBN_RET_SEPARATOR, report=None, profile=None, **kwargs):
+    with _profile_step(profile, 'cache'):
+        cache = get_result_cache(cache_dir, cache_max_entries)
+        digest = cache.get_file_digest(file_path)
+        fingerprint = get_options_fingerprint(**kwargs)
+        cached_isbns = cache.get(digest, fingerprint)
+    if cached_isbns is not None:
+        logger.debug(f'Found the cached result for the file content '
+                     f'(digest: {digest})')
+        return _report_stage(report, 'cache', isbn_ret_separator.join(cached_isbns))
+    # NOTE: the members of an archive are not cached on their own
+    content_report = {}
+    isbns = _search_file_content(
+        file_path, cache_dir=None, isbn_ret_separator=isbn_ret_separator,
+        report=content_report, profile=profile, **kwargs)
+    if report is not None:
+        report.update(content_report)
+    if content_report.get('failed_stage'):
+        logger.debug(f"Not caching the result since the stage "
+                     f"'{content_report['failed_stage']}' failed")
+    else:
+        cache.set(digest, fingerprint,
+                  isbns.split(isbn_ret_separator) if isbns else [])
+    return isbns
+
+
+# Same as search_file_for_isbns() but with asyncio, e.g. to search many files
+# at the same time from an event loop:
+#   await asyncio.gather(*[search_file_for_isbns_async(f) for f in files])
+# The external tools are run with asyncio subprocesses (at most
+# `max_processes` at the same time in the event loop, see
+# get_async_semaphore()) and are killed if the task is cancelled. The steps
+# done in-process (text files, epubs, zip/tar archives and the cache) run in
+# the default executor of the event loop.
+async def search_file_for_isbns_async(
+        file_path, isbn_blacklist_regex=ISBN_BLACKLIST_REGEX,
+        isbn_direct_files=ISBN_DIRECT_FILES,
+        isbn_reorder_files=ISBN_REORDER_FILES,
+        isbn_ignored_files=ISBN_IGNORED_FILES, isbn_regex=ISBN_REGEX,
+        isbn_ret_separator=ISBN_RET_SEPARATOR, ocr_command=OCR_COMMAND,
+        djvu_convert_method=DJVU_CONVERT_METHOD,
+        epub_convert_method=EPUB_CONVERT_METHOD,
+        pdf_convert_method=PDF_CONVERT_METHOD,
+        ocr_enabled=OCR_ENABLED,
+        ocr_only_first_last_pages=OCR_ONLY_FIRST_LAST_PAGES,
+        ocr_jobs=OCR_JOBS,
+        ocr_early_exit=OCR_EARLY_EXIT,
+        ocr_raster_pages=OCR_RASTER_PAGES,
+        convert_progressive=CONVERT_PROGRESSIVE,
+        convert_progressive_pages=CONVERT_PROGRESSIVE_PAGES,
+        convert_stream=CONVERT_STREAM,
+        archive_max_member_size=ARCHIVE_MAX_MEMBER_SIZE,
+        archive_max_total_size=ARCHIVE_MAX_TOTAL_SIZE,
+        cache_dir=None, cache_max_entries=CACHE_MAX_ENTRIES,
+        scratch_dir=SCRATCH_DIR, ocr_scratch_dir=OCR_SCRATCH_DIR, workspace=None,
+        ebook_meta_timeout=EBOOK_META_TIMEOUT, archive_timeout=ARCHIVE_TIMEOUT,
+        convert_timeout=CONVERT_TIMEOUT, ocr_page_timeout=OCR_PAGE_TIMEOUT,
+        file_timeout=FILE_TIMEOUT, deadline=None, report=None,
+        max_processes=ASYNC_MAX_PROCESSES, **kwargs):
+    func_params = locals().copy()
+    func_params.pop('file_path')
+    if deadline is None:
+        func_params['deadline'] = time.monotonic() + file_timeout \
+            if file_timeout else math.inf
+        # NOTE: the scratch workspace is also removed if the task is cancelled
+        with _scratch_workspace(**func_params) as func_params['workspace']:
+            try:
+                return await search_file_for_isbns_async(file_path, **func_params)
+            except StageTimeoutError as e:
+                return _skip_timed_out_file(file_path, e, report)
+    if workspace is None:
+        with ScratchWorkspace(scratch_dir, ocr_scratch_dir) as func_params['workspace']:
+            return await search_file_for_isbns_async(file_path, **func_params)
+    basename = os.path.basename(file_path)
+    logger.info(f"Searching file '{basename}' for ISBN numbers...")
+    # Step 1: check the filename for ISBNs
+    isbns = find_isbns(basename, **func_params)
+    if isbns:
+        return _report_stage(report, 'filename', isbns)
+
+    if cache_dir:
+        return await _search_file_with_cache_async(file_path, **func_params)
+    return await _search_file_content_async(file_path, **func_params)
+
+
+# Same as _search_file_content() but with asyncio, see search_file_for_isbns_async()
+async def _search_file_content_async(
+        file_path, isbn_direct_files=ISBN_DIRECT_FILES,
+        isbn_ignored_files=ISBN_IGNORED_FILES,
+        epub_convert_method=EPUB_CONVERT_METHOD, ocr_enabled=OCR_ENABLED,
+        ocr_early_exit=OCR_EARLY_EXIT, convert_progressive=CONVERT_PROGRESSIVE,
+        convert_stream=CONVERT_STREAM, workspace=None,
+        ebook_meta_timeout=EBOOK_META_TIMEOUT, convert_timeout=CONVERT_TIMEOUT,
+        ocr_page_timeout=OCR_PAGE_TIMEOUT, deadline=None, report=None,
+        max_processes=ASYNC_MAX_PROCESSES, **kwargs):
+    import asyncio
+    import zipfile
+    func_params = locals().copy()
+    func_params.pop('file_path')
+    func_params.update(func_params.pop('kwargs'))
+    loop = asyncio.get_running_loop()
+    semaphore = get_async_semaphore(max_processes)
+
+    def get_run(stage, timeout):
+        return get_stage_runner_async(stage, timeout, deadline, semaphore)
+
+    def in_executor(func, *args, **kwargs):
+        return loop.run_in_executor(None, partial(func, *args, **kwargs))
+
+    # Steps 2-3: text files and ignored files
+    mime_type = get_mime_type(file_path)
+    if re.match(isbn_direct_files, mime_type):
+        get_stage_timeout('direct', deadline=deadline)
+        isbns = await in_executor(find_isbns_in_mmap, file_path, **func_params)
+        return _report_stage(report, 'text', isbns)
+    elif re.match(isbn_ignored_files, mime_type):
+        logger.info('The file type is in the blacklist, ignoring...')
+        return ''
+
+    # Step 4: check the file metadata from calibre's `ebook-meta` for ISBNs
+    is_archive = re.match(_ARCHIVE_MIME_TYPES_REGEX, mime_type)
+    if not is_archive and not re.match(_NO_METADATA_MIME_TYPES_REGEX, mime_type):
+        get_stage_timeout('ebook-meta', deadline=deadline)
+        # NOTE: `djvused` (compressed djvu annotations) is run from the executor
+        metadata = await in_executor(
+            read_ebook_metadata, file_path, mime_type,
+            run=get_stage_runner('ebook-meta', ebook_meta_timeout, deadline))
+        if metadata is None and command_exists('ebook-meta'):
+            metadata = (await get_ebook_metadata(
+                file_path, run=get_run('ebook-meta', ebook_meta_timeout))).stdout
+        isbns = find_isbns(metadata or '', **func_params)
+        if isbns:
+            return _report_stage(report, 'ebook-meta', isbns)
+
+    # Step 5: archives
+    if not re.match(_NOT_ARCHIVE_MIME_TYPES_REGEX, mime_type):
+        isbns = await in_executor(get_all_isbns_from_archive, file_path, **func_params)
+        if isbns or is_archive:
+            return _report_stage(report, 'archive', isbns)
+
+    # Step 6: convert file to .txt
+    if mime_type.startswith('application/epub+zip') and epub_convert_method in ('auto', 'epubtxt'):
+        get_stage_timeout('epub', deadline=deadline)
+        try:
+            isbns = await in_executor(search_epub_for_isbns, file_path, **func_params)
+            return _report_stage(report, 'convert', isbns)
+        except zipfile.BadZipFile as e:
+            logger.debug(f"Couldn't read the epub ({e}), trying to convert it to .txt")
+            func_params['epub_convert_method'] = 'ebook-convert'
+
+    tmp_file_txt = workspace.new_path('.txt')
+    try:
+        run = get_run('convert', convert_timeout)
+        progressive_result = None
+        if convert_progressive:
+            progressive_result = await search_pages_for_isbns_async(
+                file_path, tmp_file_txt, mime_type, run, **func_params)
+        if progressive_result is None and convert_stream:
+            progressive_result = await search_converter_stream_async(
+                file_path, mime_type, run, **func_params)
+        result = None
+        if progressive_result is None:
+            result = await convert_to_txt_async(file_path, tmp_file_txt, mime_type, run,
+                                                **func_params)
+        isbns, try_ocr = await in_executor(
+            _check_conversion, tmp_file_txt, result, progressive_result, **func_params)
+        workspace.account()
+        _report_stage(report, 'convert', isbns)
+        failed_stage = 'convert' if result is not None and result.returncode != 0 else None
+
+        # Step 7: OCR the file
+        if not isbns and ocr_enabled != 'false' and try_ocr:
+            run = get_run('ocr', ocr_page_timeout)
+            returncode = await ocr_file_async(file_path, tmp_file_txt, mime_type, run,
+                                              **func_params)
+            failed_stage = 'ocr' if returncode != 0 else None
+            if returncode == 0:
+                if ocr_early_exit:
+                    func_params['isbn_reorder_files'] = False
+                isbns = await in_executor(find_isbns_in_file, tmp_file_txt, **func_params)
+                _report_stage(report, 'ocr', isbns)
+            else:
+                logger.info('There was an error while running OCR!')
+    finally:
+        if os.path.exists(tmp_file_txt):
+            remove_file(tmp_file_txt)
+    _report_failed_stage(report, failed_stage)
+    return isbns
+
+
+# Same as _search_file_with_cache() but with asyncio
+# NOTE: the cache is always used from the same thread (SQLite)
+async def _search_file_with_cache_async(
+        file_path, cache_dir, cache_max_entries=CACHE_MAX_ENTRIES,
+        isbn_ret_separator=ISBN_RET_SEPARATOR, report=None, **kwargs):
+    import asyncio
+    loop = asyncio.get_running_loop()
+    executor = _get_async_cache_executor()
+    cache = await loop.run_in_executor(executor, get_result_cache, cache_dir,
+                                       cache_max_entries)
+    digest = await loop.run_in_executor(executor, cache.get_file_digest, file_path)
+    fingerprint = get_options_fingerprint(**kwargs)
+    cached_isbns = await loop.run_in_executor(executor, cache.get, digest, fingerprint)
+    if cached_isbns is not None:
+        return _report_stage(report, 'cache', isbn_ret_separator.join(cached_isbns))
+    content_report = {}
+    isbns = await _search_file_content_async(
+        file_path, cache_dir=None, isbn_ret_separator=isbn_ret_separator,
+        report=content_report, **kwargs)
+    if report is not None:
+        report.update(content_report)
+    if not content_report.get('failed_stage'):
+        await loop.run_in_executor(
+            executor, cache.set, digest, fingerprint,
+            isbns.split(isbn_ret_separator) if isbns else [])
+    return isbns
+
+
+@lru_cache(maxsize=None)
+def _get_async_cache_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=1)
+
+
+# Checks the result of the conversion of a file to text (see
+# search_file_for_isbns()) and searches the text for ISBNs, unless it was
+# already searched while converted (`progressive_result`, see
+# search_pages_for_isbns() and search_converter_stream()). Returns the tuple
+# (isbns, try_ocr) where `try_ocr` tells if OCR should be tried on the file.
+def _check_conversion(tmp_file_txt, result, progressive_result,
+                      ocr_enabled=OCR_ENABLED, **kwargs):
+    isbns = ''
+    try_ocr = False
+    if progressive_result is not None:
+        isbns, has_text = progressive_result
+        if isbns:
+            logger.debug(f"Text output contains ISBNs:\n{isbns}")
+        elif not has_text:
+            logger.debug('The converted pages do not seem to contain text')
+            try_ocr = True
+        elif ocr_enabled == 'always':
+            logger.debug('We will try OCR because the successfully converted '
+                         'text did not have any ISBNs')
+            try_ocr = True
+        else:
+            logger.debug('Did not find any ISBNs and will NOT try OCR')
+    elif result.returncode == 0:
         logger.debug('Conversion to text was successful, checking the result...')
-        with open(tmp_file_txt, 'r') as f:
-            data = f.read()
-        if not re.search('[A-Za-z0-9]+', data):
+        if not any(re.search('[A-Za-z0-9]', chunk) for chunk in
+                   iter_file_content(tmp_file_txt, isbn_reorder_files=False)):
             logger.debug('The converted txt with size '
                          f'{os.stat(tmp_file_txt).st_size} bytes does not seem '
                          'to contain text')
-            logger.debug(f'First 1000 characters:\n{data[:1000]}')
+            with open(tmp_file_txt, 'r', errors='ignore') as f:
+                logger.debug(f'First 1000 characters:\n{f.read(1000)}')
             try_ocr = True
         else:
-            data = reorder_file_content(tmp_file_txt, **func_params)
-            isbns = find_isbns(data, **func_params)
+            isbns = find_isbns_in_file(tmp_file_txt, **kwargs)
             if isbns:
                 logger.debug(f"Text output contains ISBNs:\n{isbns}")
             elif ocr_enabled == 'always':
@@ -822,30 +4110,139 @@ def search_file_for_isbns(
         logger.warning(yellow('There was an error converting the book to txt format:'))
         logger.warning(yellow(result.stderr))
         try_ocr = True
+    return isbns, try_ocr
 
-    # Step 7: OCR the file
-    if not isbns and ocr_enabled != 'false' and try_ocr:
-        logger.debug('Trying to run OCR on the file...')
-        if ocr_file(file_path, tmp_file_txt, mime_type, **func_params) == 0:
-            logger.debug('OCR was successful, checking the result...')
-            data = reorder_file_content(tmp_file_txt, **func_params)
-            isbns = find_isbns(data, **func_params)
-            if isbns:
-                logger.debug(f"Text output contains ISBNs {isbns}!")
-            else:
-                logger.debug('Did not find any ISBNs in the OCR output')
-        else:
-            logger.info('There was an error while running OCR!')
 
-    logger.debug(f'Removing {tmp_file_txt}...')
-    remove_file(tmp_file_txt)
+# Records in the `report` dict (if given) the step of search_file_for_isbns()
+# that found the `isbns` (if any), see PROFILE_STEPS. Returns `isbns`.
+def _report_stage(report, stage, isbns):
+    if report is not None and isbns:
+        report['stage'] = stage
+    return isbns
 
-    if isbns:
-        logger.debug(f"Returning the found ISBNs:\n{isbns}")
-    else:
-        logger.debug(f'Could not find any ISBNs in {file_path} :(')
 
-    return isbns
+# Records in the `report` dict (if given) the stage of search_file_for_isbns()
+# that failed (if any), see _search_file_with_cache()
+def _report_failed_stage(report, stage):
+    if report is not None and stage:
+        report['failed_stage'] = stage
+
+
+# Logs that the search of the file was cut off by the timeout of a stage (see
+# StageTimeoutError) and records the stage in the `report` dict if given. The
+# file is skipped, i.e. no ISBNs are returned (nor cached).
+def _skip_timed_out_file(file_path, error, report=None):
+    logger.warning(yellow(f"Skipping '{file_path}': {error}"))
+    if report is not None:
+        report['timed_out_stage'] = error.stage
+    return ''
+
+
+# Returns the context manager that profiles the step `name` of
+# search_file_for_isbns() if `profile` (see Profiler) is given
+def _profile_step(profile, name):
+    return profile.step(name) if profile else nullcontext()
+
+
+# Returns the resource usage of this process and its children, see Profiler
+def _get_resource_usage():
+    usage = dict.fromkeys(['wall_time', 'cpu_time', 'children_cpu_time',
+                           'read_bytes', 'write_bytes', 'peak_rss',
+                           'children_peak_rss'])
+    usage['wall_time'] = time.perf_counter()
+    usage['cpu_time'] = time.process_time()
+    if resource is not None:
+        # ru_maxrss is in KiB on Linux but in bytes on macOS
+        rss_unit = 1 if sys.platform == 'darwin' else 1024
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        usage['children_cpu_time'] = children.ru_utime + children.ru_stime
+        usage['children_peak_rss'] = children.ru_maxrss * rss_unit
+        usage['peak_rss'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * rss_unit
+    try:
+        with open('/proc/self/io', 'r') as f:
+            io_counters = dict(line.split(': ') for line in f.read().splitlines())
+        usage['read_bytes'] = int(io_counters['rchar'])
+        usage['write_bytes'] = int(io_counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        pass
+    return usage
+
+
+# Returns the resource usage since `start` (see _get_resource_usage()): the
+# peaks are the current ones and the rest are differences
+def _get_resource_usage_delta(start):
+    usage = _get_resource_usage()
+    for key, value in start.items():
+        if value is not None and usage[key] is not None \
+                and not key.endswith('peak_rss'):
+            usage[key] -= value
+    return usage
+
+
+# Runs an IsbnServer on the Unix socket `socket_path` until SIGTERM or SIGINT,
+# then drains it. The other arguments are the ones of IsbnServer and find().
+def serve(socket_path, jobs=JOBS, max_in_flight=SERVER_MAX_IN_FLIGHT,
+          drain_timeout=SERVER_DRAIN_TIMEOUT, **kwargs):
+    server = IsbnServer(socket_path, jobs, max_in_flight, drain_timeout, **kwargs)
+    if threading.current_thread() is not threading.main_thread():
+        # Signal handlers can only be set in the main thread
+        server.serve_forever()
+        return
+    old_handlers = {signum: signal.signal(signum, lambda *_: server.drain())
+                    for signum in (signal.SIGINT, signal.SIGTERM)}
+    try:
+        server.serve_forever()
+    finally:
+        for signum, handler in old_handlers.items():
+            signal.signal(signum, handler)
+
+
+# The workers of the server compile the regexes and resolve the tool paths once,
+# see IsbnServer. They are stopped by the server, not by a Ctrl-C in its
+# terminal, and SIGTERM unwinds the search so that run_cmd() kills the tools.
+# Each worker sends its PID to the server through `pid_queue`.
+def _init_server_worker(kwargs, pid_queue):
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, _exit_server_worker)
+    pid_queue.put(os.getpid())
+    get_isbn_matcher(kwargs.get('isbn_regex', ISBN_REGEX),
+                     kwargs.get('isbn_blacklist_regex', ISBN_BLACKLIST_REGEX))
+    for cmd in _SERVER_TOOLS:
+        get_tool_path(cmd)
+    _get_numpy()
+
+
+def _exit_server_worker(signum, frame):
+    raise SystemExit(128 + signum)
+
+
+# Removes the socket file left by a server that wasn't stopped cleanly. Raises
+# OSError if a server is still listening on it or if it isn't a socket.
+def _remove_stale_socket(socket_path):
+    import socket
+    import stat
+    try:
+        mode = os.stat(socket_path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise OSError(f'{socket_path} exists and is not a socket')
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+    raise OSError(f'A server is already listening on {socket_path}')
+
+
+# Returns a context manager that gives `workspace` or, if None (e.g. a stage
+# function called on its own), a new ScratchWorkspace removed at its end
+def _scratch_workspace(workspace=None, scratch_dir=SCRATCH_DIR,
+                       ocr_scratch_dir=OCR_SCRATCH_DIR, **kwargs):
+    if workspace is not None:
+        return nullcontext(workspace)
+    return ScratchWorkspace(scratch_dir, ocr_scratch_dir)
 
 
 def setup_log(quiet=False, verbose=False, logging_level=LOGGING_LEVEL,
@@ -883,27 +4280,58 @@ def setup_log(quiet=False, verbose=False, logging_level=LOGGING_LEVEL,
 
 
 # OCR: convert image to text
-def tesseract_wrapper(input_file, output_file):
-    cmd = f'tesseract "{input_file}" stdout --psm 12'
-    args = shlex.split(cmd)
-    result = subprocess.run(args,
-                            stdout=open(output_file, 'w'),
-                            stderr=subprocess.PIPE,
-                            encoding='utf-8',
-                            bufsize=4096)
-    return convert_result_from_shell_cmd(result)
+def tesseract_wrapper(input_file, output_file, run=None):
+    return (run or run_cmd)(['tesseract', input_file, 'stdout', '--psm', '12'],
+                            stdout_file=output_file)
+
+
+# OCR: convert image data (e.g. a rasterized page) piped to tesseract to text,
+# i.e. without going through image and text files
+def tesseract_pipe(image_data, run=None):
+    return (run or run_cmd)(['tesseract', 'stdin', 'stdout', '--psm', '12'],
+                            input=image_data)
 
 
 # macOS equivalent for catdoc
 # See https://stackoverflow.com/a/44003923/14664104
-def textutil(input_file, output_file):
-    cmd = f'textutil -convert txt "{input_file}" -output "{output_file}"'
-    args = shlex.split(cmd)
-    result = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    return convert_result_from_shell_cmd(result)
+def textutil(input_file, output_file, run=None):
+    return (run or run_cmd)(['textutil', '-convert', 'txt', input_file,
+                             '-output', output_file])
 
 
 def touch(path, mode=0o666, exist_ok=True):
+    from pathlib import Path
     logger.debug(f"Creating file: '{path}'")
     Path(path).touch(mode, exist_ok)
     logger.debug("File created!")
+
+
+# OCR commands (see `ocr_command`) that can read the images from a pipe
+_OCR_PIPE_COMMANDS = {'tesseract_wrapper': tesseract_pipe}
+# Converter backends of convert_to_txt() by name, see register_converter()
+_CONVERTERS = {}
+for _backend in [
+    ConverterBackend('epubtxt', '^application/epub\\+zip$', epubtxt, cost=1,
+                     available=lambda: True, in_process=True, timeout=True),
+    ConverterBackend('pymupdf', '^application/pdf$', _pymupdf_to_txt, cost=1,
+                     available=lambda: (_import_optional('pymupdf')
+                                        or _import_optional('fitz')) is not None,
+                     in_process=True, pages=True, timeout=True),
+    ConverterBackend('pdftotext', '^application/pdf$', pdftotext, cost=10,
+                     available=partial(command_exists, 'pdftotext'), pages=True,
+                     stream=True),
+    ConverterBackend('pypdf', '^application/pdf$', _pypdf_to_txt, cost=20,
+                     available=lambda: _import_optional('pypdf') is not None,
+                     in_process=True, pages=True, timeout=True),
+    ConverterBackend('djvutxt', '^image/vnd\\.djvu', _djvutxt_pages, cost=10,
+                     available=partial(command_exists, 'djvutxt'), pages=True,
+                     stream=True),
+    ConverterBackend('catdoc', '^application/msword$', catdoc, cost=10,
+                     available=partial(command_exists, 'catdoc'), stream=True),
+    ConverterBackend('textutil', '^application/msword$', textutil, cost=10,
+                     available=partial(command_exists, 'textutil')),
+    # Anything but images (except djvu)
+    ConverterBackend('ebook-convert', '^(?!image/(?!vnd\\.djvu))', ebook_convert,
+                     cost=100, available=partial(command_exists, 'ebook-convert')),
+]:
+    register_converter(_backend)
@@ -12,15 +12,26 @@ Ref.: https://github.com/na--/ebook-tools
 """
 import argparse
 import codecs
+import glob
 import logging
 import os
+import sys
 
 from find_isbns import __version__
-from find_isbns.lib import (find, namespace_to_dict, setup_log, blue, green, red, yellow,
-                            DJVU_CONVERT_METHOD, EPUB_CONVERT_METHOD, PDF_CONVERT_METHOD,
+from find_isbns.lib import (find, find_batch, find_stream, get_converter_names,
+                            namespace_to_dict, serve, setup_log,
+                            format_profile_summary, load_profile_reports, Profiler,
+                            blue, green, red, yellow, CONVERT_PROGRESSIVE,
+                            CONVERT_PROGRESSIVE_PAGES, CONVERT_STREAM, DJVU_CONVERT_METHOD, EPUB_CONVERT_METHOD, PDF_CONVERT_METHOD,
                             ISBN_REGEX, ISBN_BLACKLIST_REGEX, ISBN_DIRECT_FILES,
                             ISBN_IGNORED_FILES, ISBN_REORDER_FILES, ISBN_RET_SEPARATOR,
-                            OCR_ENABLED, OCR_ONLY_FIRST_LAST_PAGES,
+                            OCR_EARLY_EXIT, OCR_ENABLED, OCR_JOBS,
+                            OCR_ONLY_FIRST_LAST_PAGES, OCR_RASTER_PAGES, OCR_SCRATCH_DIR,
+                            ARCHIVE_MAX_MEMBER_SIZE, ARCHIVE_MAX_TOTAL_SIZE,
+                            CACHE_DIR, CACHE_MAX_ENTRIES, JOBS, SCRATCH_DIR,
+                            SERVER_DRAIN_TIMEOUT, SERVER_MAX_IN_FLIGHT,
+                            ARCHIVE_TIMEOUT, CONVERT_TIMEOUT, EBOOK_META_TIMEOUT,
+                            FILE_TIMEOUT, OCR_PAGE_TIMEOUT,
                             LOGGING_FORMATTER, LOGGING_LEVEL)
 
 # import ipdb
@@ -173,12 +184,45 @@ def init_list(list_):
     return [] if list_ is None else list_
 
 
+# The input data is searched in batch mode if there are many inputs or if the
+# single input is a directory, a `@filelist` or a glob pattern matching files
+def is_batch_input(input_data):
+    if len(input_data) != 1:
+        return len(input_data) > 1
+    input_ = os.path.expanduser(input_data[0])
+    if os.path.isdir(input_) or \
+            (input_.startswith('@') and os.path.isfile(input_[1:])):
+        return True
+    return not os.path.exists(input_) and glob.has_magic(input_) \
+        and bool(glob.glob(input_, recursive=True))
+
+
 def print_(msg):
     global QUIET
     if not QUIET:
         print(msg)
 
 
+# Converts a size given in MiB (e.g. '512' or '0.5') to bytes
+def mib_to_bytes(value):
+    try:
+        return int(float(value) * 1024 * 1024)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid size in MiB: '{value}'")
+
+
+# Converts a timeout given in seconds (e.g. '60' or '0.5') to float, 0 means
+# no timeout (None)
+def seconds(value):
+    try:
+        value = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid timeout in seconds: '{value}'")
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"invalid timeout in seconds: '{value}'")
+    return value or None
+
+
 # Ref.: https://stackoverflow.com/a/4195302/14664104
 def required_length(nmin, nmax, is_list=True):
     class RequiredLength(argparse.Action):
@@ -199,8 +243,14 @@ def required_length(nmin, nmax, is_list=True):
     return RequiredLength
 
 
+# Returns the width of the help, i.e. of the terminal or, if there is none
+# (e.g. the output is piped), $COLUMNS or 80 columns
+def get_help_width():
+    import shutil
+    return shutil.get_terminal_size().columns - 5
+
+
 def setup_argparser():
-    width = os.get_terminal_size().columns - 5
     name_input = 'input_data'
     usage_msg = blue(f'%(prog)s [OPTIONS] {{{name_input}}}')
     desc_msg = 'Find valid ISBNs inside a file or in a string if no file was ' \
@@ -212,8 +262,9 @@ def setup_argparser():
         description="",
         usage=f"{usage_msg}\n\n{desc_msg}",
         add_help=False,
+        # Only called when the help or usage is formatted
         formatter_class=lambda prog: MyFormatter(
-            prog, max_help_position=50, width=width))
+            prog, max_help_position=50, width=get_help_width()))
     general_group = add_general_options(
         parser,
         remove_opts=[],
@@ -225,19 +276,41 @@ def setup_argparser():
     convert_group = parser.add_argument_group(title=yellow('Convert-to-txt options'))
     convert_group.add_argument(
         '--djvu', dest='djvu_convert_method',
-        choices=['djvutxt', 'ebook-convert'], default=DJVU_CONVERT_METHOD,
+        choices=['auto'] + get_converter_names('image/vnd.djvu'), default=DJVU_CONVERT_METHOD,
         help='Set the conversion method for djvu documents.'
              + get_default_message(DJVU_CONVERT_METHOD))
     convert_group.add_argument(
         '--epub', dest='epub_convert_method',
-        choices=['epubtxt', 'ebook-convert'], default=EPUB_CONVERT_METHOD,
+        choices=['auto'] + get_converter_names('application/epub+zip'), default=EPUB_CONVERT_METHOD,
         help='Set the conversion method for epub documents.'
              + get_default_message(EPUB_CONVERT_METHOD))
     convert_group.add_argument(
         '--pdf', dest='pdf_convert_method',
-        choices=['pdftotext', 'ebook-convert'], default=PDF_CONVERT_METHOD,
-        help='Set the conversion method for pdf documents.'
-             + get_default_message(PDF_CONVERT_METHOD))
+        choices=['auto'] + get_converter_names('application/pdf'), default=PDF_CONVERT_METHOD,
+        help='''Set the conversion method for pdf documents, 'auto' uses the
+             cheapest available one (e.g. pymupdf if it is installed, else
+             pdftotext).''' + get_default_message(PDF_CONVERT_METHOD))
+    convert_group.add_argument(
+        '--progressive', dest='convert_progressive', action='store_true',
+        default=CONVERT_PROGRESSIVE,
+        help='''Convert pdf and djvu documents by windows of pages (the first
+             pages, then the last pages and finally the middle) and stop as soon
+             as a window contains ISBNs, instead of converting whole documents.
+             Only for the conversion methods that can convert a range of pages
+             (djvutxt, pdftotext, pymupdf, pypdf).''')
+    convert_group.add_argument(
+        '--progressive-pages', dest='convert_progressive_pages', metavar='PAGES',
+        nargs=2, type=int, default=CONVERT_PROGRESSIVE_PAGES,
+        help='''Value 'n m' sets the number of pages in the first and last
+             windows of the progressive conversion.'''
+             + get_default_message(str(CONVERT_PROGRESSIVE_PAGES).strip('(|)').replace(',', '')))
+    convert_group.add_argument(
+        '--stream', dest='convert_stream', action='store_true',
+        default=CONVERT_STREAM,
+        help='''Search the text written on the stdout of the conversion methods
+             that support it (pdftotext, djvutxt) as it is converted, instead of
+             going through a .txt file, and stop the conversion as soon as the
+             first lines contain ISBNs.''')
     # ==================
     # Find ISBNs options
     # ==================
@@ -302,21 +375,202 @@ def setup_argparser():
              'disabled by default.' + get_default_message(OCR_ENABLED))
     ocr_group.add_argument(
         "--ocrop", "--ocr-only-first-last-pages",
-        dest='ocr_only_first_last_pages', metavar='PAGES', nargs=2,
-        default=OCR_ONLY_FIRST_LAST_PAGES,
+        dest='ocr_only_first_last_pages', metavar='PAGES', nargs='+',
+        action=required_length(1, 2), default=OCR_ONLY_FIRST_LAST_PAGES,
         help='''Value 'n m' instructs the script to convert only the
-             first n and last m pages when OCR-ing ebooks.'''
+             first n and last m pages when OCR-ing ebooks. Set it to `False`
+             to OCR all the pages.'''
              + get_default_message(str(OCR_ONLY_FIRST_LAST_PAGES).strip('(|)').replace(',', '')))
+    ocr_group.add_argument(
+        "--ocr-jobs", dest='ocr_jobs', metavar='N', type=int,
+        help='''Number of pages that are converted to images and OCRed at the
+             same time. In batch mode, by each of the `--jobs` workers: by
+             default the cores are shared between them (number of cores //
+             jobs, at least 1).'''
+             + get_default_message(f'{OCR_JOBS} (number of cores)'))
+    ocr_group.add_argument(
+        "--ocr-early-exit", dest='ocr_early_exit', action='store_true',
+        default=OCR_EARLY_EXIT,
+        help='''OCR the pages by priority (the first pages, then the last pages
+             in reverse and finally the rest) and stop at the first page that
+             contains ISBNs. Useful with `--ocrop False` since the ISBNs are
+             usually in the first pages.''')
+    ocr_group.add_argument(
+        "--ocr-raster-pages", dest='ocr_raster_pages', metavar='N', type=int,
+        default=OCR_RASTER_PAGES,
+        help='''Maximum number of consecutive pages that are converted to images
+             by a single gs/ddjvu call.''' + get_default_message(OCR_RASTER_PAGES))
+    # ===============
+    # Archive options
+    # ===============
+    archive_group = parser.add_argument_group(title=yellow('Archive options'))
+    archive_group.add_argument(
+        "--archive-max-member-size", dest='archive_max_member_size',
+        metavar='MiB', type=mib_to_bytes, default=ARCHIVE_MAX_MEMBER_SIZE,
+        help='''Files bigger than this size (uncompressed) are skipped when
+             scanning zip and tar archives.'''
+             + get_default_message(ARCHIVE_MAX_MEMBER_SIZE // 1024 // 1024))
+    archive_group.add_argument(
+        "--archive-max-total-size", dest='archive_max_total_size',
+        metavar='MiB', type=mib_to_bytes, default=ARCHIVE_MAX_TOTAL_SIZE,
+        help='''The scan of a zip or tar archive stops once this size
+             (uncompressed) was read.'''
+             + get_default_message(ARCHIVE_MAX_TOTAL_SIZE // 1024 // 1024))
+    # =============
+    # Batch options
+    # =============
+    batch_group = parser.add_argument_group(title=yellow('Batch options'))
+    batch_group.add_argument(
+        "-j", "--jobs", dest='jobs', metavar='N', type=int, default=JOBS,
+        help='''Number of worker processes used when many files are searched
+             at once (batch mode), i.e. when more than one input is given or
+             when the input is a directory (scanned recursively), a glob
+             pattern or `@filelist` (a file with one path per line). The
+             results are printed as soon as each file is done, one
+             `file_path<TAB>isbn` line by ISBN found (with an empty ISBN if
+             none was found in the file).'''
+             + get_default_message(f'{JOBS} (number of cores)'))
+    batch_group.add_argument(
+        "--stdin-jsonl", dest='stdin_jsonl', action='store_true',
+        help='''Streaming mode: read the inputs (paths or strings) from stdin,
+             one per line, and write a JSON object per input to stdout, e.g.
+             {"input": "book.pdf", "isbns": ["9780306406157"], "stage": "text",
+             "elapsed_ms": 52.1}. "stage" is the step that found the ISBNs.
+             The inputs are searched by the `--jobs` worker processes and
+             read only as the workers become free.''')
+    batch_group.add_argument(
+        "--jsonl-order", dest='jsonl_order', choices=['completion', 'input'],
+        default='completion',
+        help='''Order of the JSON objects written by `--stdin-jsonl`: as soon
+             as each input is done or in the order of the inputs.'''
+             + get_default_message('completion'))
+    # ===============
+    # Timeout options
+    # ===============
+    timeout_group = parser.add_argument_group(
+        title=yellow('Timeout options (in seconds, 0 for no timeout)'))
+    timeout_group.add_argument(
+        "--meta-timeout", dest='ebook_meta_timeout', metavar='SECONDS',
+        type=seconds, default=EBOOK_META_TIMEOUT,
+        help='''Maximum time of `ebook-meta` on a file.'''
+             + get_default_message(EBOOK_META_TIMEOUT))
+    timeout_group.add_argument(
+        "--archive-timeout", dest='archive_timeout', metavar='SECONDS',
+        type=seconds, default=ARCHIVE_TIMEOUT,
+        help='''Maximum time of the extraction of an archive with `7z`.'''
+             + get_default_message(ARCHIVE_TIMEOUT))
+    timeout_group.add_argument(
+        "--convert-timeout", dest='convert_timeout', metavar='SECONDS',
+        type=seconds, default=CONVERT_TIMEOUT,
+        help='''Maximum time of each command that converts a file to text
+             (e.g. pdftotext, ebook-convert), also of the built-in in-process
+             converters (checked between the pages).'''
+             + get_default_message(CONVERT_TIMEOUT))
+    timeout_group.add_argument(
+        "--ocr-page-timeout", dest='ocr_page_timeout', metavar='SECONDS',
+        type=seconds, default=OCR_PAGE_TIMEOUT,
+        help='''Maximum time of the OCR of a page (its conversion to an image
+             and the OCR of the image).'''
+             + get_default_message(OCR_PAGE_TIMEOUT))
+    timeout_group.add_argument(
+        "--file-timeout", dest='file_timeout', metavar='SECONDS',
+        type=seconds, default=FILE_TIMEOUT,
+        help='''Maximum total time of the search of a file, all stages
+             included. The commands that take longer are killed (with their
+             process group), a warning names the stage that was cut off and
+             the file is skipped.''' + get_default_message(FILE_TIMEOUT))
+    # =============
+    # Cache options
+    # =============
+    cache_group = parser.add_argument_group(title=yellow('Cache options'))
+    cache_group.add_argument(
+        "--cache-dir", dest='cache_dir', metavar='DIR',
+        help=f'''Cache the results of searching files in this directory, e.g.
+             {CACHE_DIR}. A file whose content
+             didn't change is not searched again with the same options (e.g.
+             no conversion or OCR), even if it was renamed or moved. The
+             results of a search with a failed or timed out stage are not
+             cached.''' + get_default_message('no cache'))
+    cache_group.add_argument(
+        "--cache-max-entries", dest='cache_max_entries', metavar='N', type=int,
+        default=CACHE_MAX_ENTRIES,
+        help='''Maximum number of results in the cache. The least recently
+             used results are evicted first.'''
+             + get_default_message(CACHE_MAX_ENTRIES))
+    cache_group.add_argument(
+        "--no-cache", dest='no_cache', action='store_true',
+        help='''Don't use the cache, i.e. files are always searched
+             (overrides `--cache-dir`).''')
+    # ===============
+    # Scratch options
+    # ===============
+    scratch_group = parser.add_argument_group(title=yellow('Scratch options'))
+    scratch_group.add_argument(
+        "--scratch-dir", dest='scratch_dir', metavar='DIR', default=SCRATCH_DIR,
+        help='''Directory where a scratch workspace is created for each searched
+             file, e.g. for its conversion to .txt and its extracted archives
+             (/dev/shm to keep them in RAM). The workspace is removed once the
+             file is searched, also after an error or a timeout.'''
+             + get_default_message(SCRATCH_DIR or 'the temp dir'))
+    scratch_group.add_argument(
+        "--ocr-scratch-dir", dest='ocr_scratch_dir', metavar='DIR',
+        default=OCR_SCRATCH_DIR,
+        help='''Directory where the pages are rasterized to images for the OCR.
+             An empty value puts the images in the scratch workspace of
+             `--scratch-dir`.''' + get_default_message(OCR_SCRATCH_DIR or "''"))
+    # =================
+    # Profiling options
+    # =================
+    profiling_group = parser.add_argument_group(title=yellow('Profiling options'))
+    profiling_group.add_argument(
+        "--profile", dest='profile', metavar='REPORT',
+        help='''Profile the steps of the search of each file (filename, cache,
+             text, ebook-meta, archive, convert, ocr): wall and CPU time (also
+             of the child processes), bytes read and written and peak memory.
+             A JSON report per file is written (one per line) to REPORT and a
+             summary table is shown at the end.''')
+    profiling_group.add_argument(
+        "--cprofile", dest='cprofile', metavar='STATS',
+        help='''Run the program under cProfile and dump the stats to STATS
+             (see the pstats module). In batch mode, only the main process is
+             profiled, use `-j 1` to profile the searches.''')
+    # ==============
+    # Server options
+    # ==============
+    server_group = parser.add_argument_group(title=yellow('Server options'))
+    server_group.add_argument(
+        "--serve", dest='serve', metavar='SOCKET',
+        help='''Run as a server listening on the Unix socket SOCKET (e.g.
+             /run/find_isbns.sock) until SIGTERM or Ctrl-C. The `--jobs`
+             worker processes are started once, thus a request is not slowed
+             down by the startup of Python. A client sends paths or strings
+             (or JSON objects {"input": ..., "id": ...}), one per line, and
+             gets a JSON object per request as with `--stdin-jsonl`. The
+             other options apply to all the requests.''')
+    server_group.add_argument(
+        "--max-in-flight", dest='max_in_flight', metavar='N', type=int,
+        default=SERVER_MAX_IN_FLIGHT,
+        help='''Maximum number of requests searched or waiting for a worker
+             at once, the requests beyond wait until some are done.'''
+             + get_default_message('4 by job'))
+    server_group.add_argument(
+        "--drain-timeout", dest='drain_timeout', metavar='SECONDS', type=seconds,
+        default=SERVER_DRAIN_TIMEOUT,
+        help='''When the server is stopped, no connection is accepted anymore
+             and the requests in flight are finished for at most SECONDS (0
+             for no limit), then the searches still running are killed.'''
+             + get_default_message(SERVER_DRAIN_TIMEOUT))
     # =====
     # Input
     # =====
     input_files_group = parser.add_argument_group(
         title=yellow('Input data'))
     input_files_group.add_argument(
-        name_input, nargs='?',
+        name_input, nargs='*',
         help='Can either be the path to a file or a string (enclose it within '
              'single or double quotes if it contains spaces). The input will be '
-             'searched for ISBNs.')
+             'searched for ISBNs. Many files can be searched at once by giving '
+             'several paths, directories, glob patterns or `@filelist`.')
     return parser
 
 
@@ -349,9 +603,65 @@ def main():
         else:
             args_dict['isbn_reorder_files'][0] = int(args_dict['isbn_reorder_files'][0])
             args_dict['isbn_reorder_files'][1] = int(args_dict['isbn_reorder_files'][1])
-        if not error:
+        if len(args.ocr_only_first_last_pages) == 1:
+            if args.ocr_only_first_last_pages[0] == 'False':
+                args_dict['ocr_only_first_last_pages'] = False
+            else:
+                logger.error(f"{red('error: invalid choice for ocr-only-first-last-pages: ')}"
+                             f"'{args.ocr_only_first_last_pages[0]}' (choose from 'False' or two integers)")
+                exit_code = 1
+                error = True
+        if args_dict.pop('no_cache'):
+            args_dict['cache_dir'] = None
+        report_file = args_dict.pop('profile')
+        if report_file:
+            # The reports of the previous run are replaced
+            open(report_file, 'w').close()
+            args_dict['profile'] = Profiler(report_file)
+        cprofile_stats = args_dict.pop('cprofile')
+        if cprofile_stats:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        stdin_jsonl = args_dict.pop('stdin_jsonl')
+        jsonl_order = args_dict.pop('jsonl_order')
+        socket_path = args_dict.pop('serve')
+        if not error and socket_path:
+            args_dict.pop('input_data')
+            serve(socket_path, **args_dict)
+            exit_code = 0
+        elif not error and stdin_jsonl:
+            import json
+            args_dict.pop('input_data')
+            inputs = (line.rstrip('\r\n') for line in sys.stdin)
+            for result in find_stream((input_ for input_ in inputs if input_.strip()),
+                                      ordered=jsonl_order == 'input', **args_dict):
+                # The logs are written to stderr
+                print(json.dumps(result), flush=True)
+            exit_code = 0
+        elif not error and is_batch_input(args.input_data):
+            inputs = args_dict.pop('input_data')
+            # One `file_path<TAB>isbn` line by ISBN, thus the separator of the
+            # ISBNs is ignored
+            args_dict['isbn_ret_separator'] = '\n'
+            for file_path, isbns in find_batch(inputs, **args_dict):
+                # On stdout (also with --quiet) so that the results can be piped.
+                # A file without ISBNs gets one line with an empty ISBN
+                for isbn in isbns.splitlines() or ['']:
+                    print(f'{file_path}\t{isbn}', flush=True)
+            exit_code = 0
+        elif not error:
+            args_dict['input_data'] = args.input_data[0] if args.input_data else None
             retval = find(**args_dict)
             exit_code = 0 if retval else retval
+        if cprofile_stats:
+            profiler.disable()
+            profiler.dump_stats(cprofile_stats)
+            logger.info(f'cProfile stats saved in {cprofile_stats}')
+        if report_file and not error:
+            # Also contains the reports written by the worker processes
+            logger.info('Profile summary:\n' + format_profile_summary(
+                load_profile_reports(report_file)))
     except KeyboardInterrupt:
         print_(yellow('\nProgram stopped!'))
         exit_code = 2
@@ -82,6 +82,13 @@ setup(name='find-isbns',
       cmdclass={'build_py': build_py},
       include_package_data=True,
       install_requires=REQUIREMENTS,
+      extras_require={
+        # Faster validation of many ISBN candidates at once
+        'numpy': ['numpy'],
+        # In-process conversion of pdfs to text
+        'pymupdf': ['pymupdf'],
+        'pypdf': ['pypdf']
+      },
       entry_points={
         'console_scripts': ['find_isbns=find_isbns.scripts.find_isbns:main']
       },
@@ -0,0 +1,41 @@
+"""Tests of the script ``find_isbns``, run as a subprocess."""
+import os
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_script(*args):
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR)
+    return subprocess.run([sys.executable, '-m', 'find_isbns.scripts.find_isbns']
+                          + list(args), capture_output=True, text=True,
+                          cwd=ROOT_DIR, env=env, timeout=120)
+
+
+def test_batch_output_one_line_by_isbn(tmp_path):
+    book = tmp_path / 'book.txt'
+    book.write_text('ISBN 978-0-306-40615-7\nISBN 0-306-40615-2\n')
+    empty = tmp_path / 'empty.txt'
+    empty.write_text('No ISBN in this file\n')
+    # The separator of the ISBNs mustn't leak into the batch output
+    result = run_script('-j', '2', '--irs', '\n', str(book), str(empty))
+    assert result.returncode == 0, result.stderr
+    lines = result.stdout.splitlines()
+    assert sorted(lines) == sorted([f'{book}\t9780306406157',
+                                    f'{book}\t0306406152',
+                                    f'{empty}\t'])
+    for line in lines:
+        assert len(line.split('\t')) == 2
+
+
+def test_batch_output_ignores_separator(tmp_path):
+    book = tmp_path / 'book.txt'
+    book.write_text('ISBN 978-0-306-40615-7 and ISBN 0-306-40615-2\n')
+    other = tmp_path / 'other.txt'
+    other.write_text('ISBN 9781594201721\n')
+    result = run_script('-j', '1', '--irs', ',', str(book), str(other))
+    assert result.returncode == 0, result.stderr
+    assert sorted(result.stdout.splitlines()) == sorted(
+        [f'{book}\t9780306406157', f'{book}\t0306406152',
+         f'{other}\t9781594201721'])
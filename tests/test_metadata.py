@@ -0,0 +1,92 @@
+"""Tests of the in-process metadata readers (see read_ebook_metadata()).
+
+The ebooks are made by the generators of the benchmark corpus: each of them
+returns the planted ISBNs, and decoy ISBNs (e.g. in a replaced Info dictionary
+or in the annotations of a second page) that must not be found.
+"""
+import random
+
+import pytest
+
+from benchmarks import corpus
+from find_isbns.lib import Result, find_isbns, get_mime_type, read_ebook_metadata
+
+SEEDS = range(5)
+
+
+def write_file(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def get_isbns(metadata):
+    isbns = find_isbns(metadata, isbn_ret_separator='\n')
+    return sorted(isbns.splitlines()) if isbns else []
+
+
+# Returns a runner (see run_cmd()) that records the commands in `calls` and
+# outputs `stdout`
+def get_run_stub(calls, stdout='', returncode=0):
+    def run(args, **kwargs):
+        calls.append(args)
+        return Result(stdout=stdout, returncode=returncode, args=args)
+    return run
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('make_file, name', [
+    (corpus.make_pdf_xref_table, 'xref_table.pdf'),
+    (corpus.make_pdf_xref_stream, 'xref_stream.pdf'),
+    (corpus.make_mobi, 'book.mobi'),
+    (corpus.make_djvu, 'book.djvu'),
+])
+def test_read_metadata(tmp_path, seed, make_file, name):
+    data, title, isbns = make_file(random.Random(seed))
+    path = write_file(tmp_path, name, data)
+    calls = []
+    metadata = read_ebook_metadata(path, get_mime_type(path), get_run_stub(calls))
+    assert metadata is not None
+    assert title in metadata
+    assert get_isbns(metadata) == sorted(isbns)
+    # The uncompressed djvu annotations are read without djvused
+    assert calls == []
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_read_epub_metadata(tmp_path, seed):
+    data, isbns = corpus.make_epub(random.Random(seed), 1, 'opf')
+    path = write_file(tmp_path, 'book.epub', data)
+    metadata = read_ebook_metadata(path, get_mime_type(path))
+    assert get_isbns(metadata) == isbns
+
+
+def test_read_djvu_compressed_annotations(tmp_path):
+    data, isbns, djvused_output = corpus.make_djvu_antz(random.Random(0))
+    path = write_file(tmp_path, 'antz.djvu', data)
+    calls = []
+    metadata = read_ebook_metadata(path, get_mime_type(path),
+                                   get_run_stub(calls, djvused_output))
+    assert get_isbns(metadata) == isbns
+    assert calls == [['djvused', '-e', 'print-meta', path]]
+    # djvused failed: no metadata but the reader did its job
+    metadata = read_ebook_metadata(path, get_mime_type(path),
+                                   get_run_stub([], 'error', returncode=1))
+    assert metadata == ''
+
+
+@pytest.mark.parametrize('make_file, name', [
+    (corpus.make_pdf_xref_table, 'book.pdf'),
+    (corpus.make_pdf_xref_stream, 'book.pdf'),
+    (corpus.make_mobi, 'book.mobi'),
+])
+def test_read_truncated_file(tmp_path, make_file, name):
+    data = make_file(random.Random(0))[0]
+    path = write_file(tmp_path, name, data[:len(data) // 3])
+    # Can't be parsed, thus `ebook-meta` has to be used
+    assert read_ebook_metadata(path, get_mime_type(path)) is None
+
+
+def test_read_metadata_unknown_type(tmp_path):
+    path = write_file(tmp_path, 'book.txt', b'ISBN 9780306406157')
+    assert read_ebook_metadata(path, 'text/plain') is None
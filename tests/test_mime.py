@@ -0,0 +1,61 @@
+"""Tests of the MIME types found from the content and the extension of the files."""
+import zipfile
+
+from find_isbns.lib import get_mime_type, search_file_for_isbns, sniff_mime_type
+
+CONTAINER_XML = """<?xml version="1.0"?>
+<container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">
+  <rootfiles>
+    <rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/>
+  </rootfiles>
+</container>
+"""
+CHAPTER = '<html><body><p>Copyright. ISBN 978-0-306-40615-7</p></body></html>'
+
+
+def make_epub(path, mimetype_first=True):
+    members = [('mimetype', 'application/epub+zip'),
+               ('META-INF/container.xml', CONTAINER_XML),
+               ('OEBPS/chapter1.xhtml', CHAPTER)]
+    if not mimetype_first:
+        members.append(members.pop(0))
+    with zipfile.ZipFile(path, 'w') as zf:
+        for name, data in members:
+            compress_type = zipfile.ZIP_STORED if name == 'mimetype' \
+                else zipfile.ZIP_DEFLATED
+            zf.writestr(name, data, compress_type=compress_type)
+    return path
+
+
+def test_epub_is_sniffed(tmp_path):
+    epub = make_epub(tmp_path / 'book.bin')
+    assert sniff_mime_type(epub) == 'application/epub+zip'
+    assert get_mime_type(str(epub)) == 'application/epub+zip'
+
+
+def test_epub_without_mimetype_first(tmp_path):
+    epub = make_epub(tmp_path / 'book.epub', mimetype_first=False)
+    assert sniff_mime_type(epub) == 'application/zip'
+    assert get_mime_type(str(epub)) == 'application/epub+zip'
+    # Thus converted as an epub, not extracted as an archive
+    assert search_file_for_isbns(str(epub)) == '9780306406157'
+
+
+def test_extension_does_not_override_content(tmp_path):
+    # A zip named as a pdf is still a zip...
+    fake_pdf = tmp_path / 'book.pdf'
+    with zipfile.ZipFile(fake_pdf, 'w') as zf:
+        zf.writestr('book.txt', 'ISBN 978-0-306-40615-7')
+    assert get_mime_type(str(fake_pdf)) == 'application/zip'
+    # ... and a text file named as an epub is text
+    fake_epub = tmp_path / 'book2.epub'
+    fake_epub.write_text('ISBN 978-0-306-40615-7')
+    assert get_mime_type(str(fake_epub)) == 'text/plain'
+
+
+def test_zip_is_refined_by_extension(tmp_path):
+    docx = tmp_path / 'book.docx'
+    with zipfile.ZipFile(docx, 'w') as zf:
+        zf.writestr('[Content_Types].xml', '<Types/>')
+    assert get_mime_type(str(docx)) == \
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
@@ -0,0 +1,143 @@
+"""Tests of the search pipeline: cache, time limits and batch APIs."""
+import asyncio
+import random
+import time
+
+import pytest
+
+from benchmarks import corpus
+from find_isbns.lib import (StageTimeoutError, _get_worker_ocr_jobs, convert_to_txt,
+                            convert_to_txt_async, epubtxt, find_batch, find_isbns,
+                            find_stream, get_stage_runner, get_stage_timeout,
+                            get_timeout_checker, run_cmd_async, search_file_for_isbns)
+
+
+@pytest.fixture
+def book(tmp_path):
+    path = tmp_path / 'book.txt'
+    path.write_text('Copyright. ISBN 978-0-306-40615-7\n')
+    return str(path)
+
+
+# A pdf that can't be converted: no tools are found in PATH
+@pytest.fixture
+def broken_pdf(tmp_path, monkeypatch):
+    empty_dir = tmp_path / 'bin'
+    empty_dir.mkdir()
+    monkeypatch.setenv('PATH', str(empty_dir))
+    path = tmp_path / 'broken.pdf'
+    path.write_bytes(b'%PDF-1.4\n%%EOF\n')
+    return str(path)
+
+
+def test_find_isbns():
+    text = 'ISBN 978-0-306-40615-7, 0-306-40615-2 and 978-0-306-40615-8 (invalid)'
+    assert find_isbns(text, isbn_ret_separator=',') == '9780306406157,0306406152'
+    assert find_isbns('No ISBN here') == ''
+
+
+def test_cache(tmp_path, book):
+    cache_dir = str(tmp_path / 'cache')
+    report = {}
+    assert search_file_for_isbns(book, cache_dir=cache_dir, report=report) \
+        == '9780306406157'
+    assert report == {'stage': 'text'}
+    report = {}
+    assert search_file_for_isbns(book, cache_dir=cache_dir, report=report) \
+        == '9780306406157'
+    assert report == {'stage': 'cache'}
+    # A new content is searched again
+    with open(book, 'a') as f:
+        f.write('ISBN 0-306-40615-2\n')
+    report = {}
+    assert search_file_for_isbns(book, cache_dir=cache_dir, report=report) \
+        == '9780306406157\n0306406152'
+    assert report == {'stage': 'text'}
+
+
+def test_cache_no_isbn(tmp_path, monkeypatch):
+    path = tmp_path / 'empty.txt'
+    path.write_text('No ISBN here\n')
+    cache_dir = str(tmp_path / 'cache')
+    assert search_file_for_isbns(str(path), cache_dir=cache_dir) == ''
+
+    def search_file_content(*args, **kwargs):
+        raise AssertionError('The file content was searched again')
+    monkeypatch.setattr('find_isbns.lib._search_file_content', search_file_content)
+    assert search_file_for_isbns(str(path), cache_dir=cache_dir) == ''
+
+
+def test_cache_skips_failed_search(tmp_path, broken_pdf):
+    cache_dir = str(tmp_path / 'cache')
+    for _ in range(2):
+        report = {}
+        assert search_file_for_isbns(broken_pdf, cache_dir=cache_dir,
+                                     ocr_enabled='false', report=report) == ''
+        # Not cached, i.e. searched again once the tools are installed
+        assert report == {'failed_stage': 'convert'}
+
+
+def test_worker_ocr_jobs(monkeypatch):
+    monkeypatch.setattr('find_isbns.lib.OCR_JOBS', 8)
+    assert _get_worker_ocr_jobs(1) == 8
+    assert _get_worker_ocr_jobs(4) == 2
+    assert _get_worker_ocr_jobs(16) == 1
+    assert _get_worker_ocr_jobs(4, ocr_jobs=3) == 3
+
+
+def test_stage_timeout():
+    assert get_stage_timeout('convert', 10) == 10
+    assert get_stage_timeout('convert', 10, time.monotonic() + 1) <= 1
+    with pytest.raises(StageTimeoutError) as e:
+        get_stage_timeout('convert', 10, time.monotonic() - 1)
+    assert e.value.stage == 'convert'
+
+
+def test_timeout_checker():
+    # No time limit
+    get_timeout_checker()()
+    get_timeout_checker(get_stage_runner('convert'))()
+    check_timeout = get_timeout_checker(get_stage_runner('convert', timeout=0.05))
+    check_timeout()
+    time.sleep(0.1)
+    with pytest.raises(StageTimeoutError) as e:
+        check_timeout()
+    assert e.value.stage == 'convert'
+
+
+def test_in_process_converter_timeout(tmp_path):
+    data, isbns = corpus.make_epub(random.Random(0), 2, 'copyright')
+    epub = tmp_path / 'book.epub'
+    epub.write_bytes(data)
+    output_file = str(tmp_path / 'book.txt')
+    epubtxt(str(epub), output_file)
+    with open(output_file) as f:
+        assert find_isbns(f.read()) == isbns[0]
+
+    def check_timeout():
+        raise StageTimeoutError('convert', 0.1)
+    with pytest.raises(StageTimeoutError):
+        epubtxt(str(epub), output_file, check_timeout=check_timeout)
+
+
+def test_convert_to_txt_async_without_converter(tmp_path, book):
+    output_file = str(tmp_path / 'output.txt')
+    expected = convert_to_txt(book, output_file, 'application/x-unknown')
+    result = asyncio.run(convert_to_txt_async(book, output_file, 'application/x-unknown',
+                                              run_cmd_async))
+    assert result.returncode == expected.returncode == 1
+    assert result.stderr == expected.stderr
+
+
+def test_find_batch(book, broken_pdf):
+    assert sorted(find_batch([book, broken_pdf], jobs=2, ocr_enabled='false')) \
+        == sorted([(book, '9780306406157'), (broken_pdf, '')])
+
+
+def test_find_stream(book):
+    results = list(find_stream([book, 'ISBN 0-306-40615-2', 'nothing'], jobs=2,
+                               ordered=True))
+    assert [(result['input'], result['isbns'], result['stage'])
+            for result in results] == [(book, ['9780306406157'], 'text'),
+                                       ('ISBN 0-306-40615-2', ['0306406152'], 'string'),
+                                       ('nothing', [], None)]
@@ -0,0 +1,76 @@
+"""Tests of the server of the script ``find_isbns`` (see IsbnServer)."""
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+from find_isbns.lib import query_server
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# A tool that never ends, i.e. a search stuck in a conversion
+SLOW_TOOL = """#!/bin/sh
+echo "$0" >> "{log}"
+exec sleep 60
+"""
+
+
+def start_server(tmp_path, *args):
+    bin_dir = tmp_path / 'bin'
+    bin_dir.mkdir()
+    for cmd in ['pdfinfo', 'pdftotext', 'ebook-meta']:
+        tool = bin_dir / cmd
+        tool.write_text(SLOW_TOOL.format(log=tmp_path / 'calls.log'))
+        tool.chmod(0o755)
+    socket_path = str(tmp_path / 'find_isbns.sock')
+    env = dict(os.environ, PYTHONPATH=ROOT_DIR,
+               PATH=f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}")
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'find_isbns.scripts.find_isbns', '--serve',
+         socket_path] + list(args), cwd=ROOT_DIR, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(300):
+        if os.path.exists(socket_path):
+            return server, socket_path
+        time.sleep(0.1)
+    server.kill()
+    raise TimeoutError("The server didn't start")
+
+
+def test_query(tmp_path):
+    server, socket_path = start_server(tmp_path, '-j', '1')
+    try:
+        response = query_server(socket_path, 'ISBN 978-0-306-40615-7', timeout=30)
+        assert response['isbns'] == ['9780306406157']
+    finally:
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(30) == 0
+
+
+def test_drain_timeout_kills_workers(tmp_path):
+    server, socket_path = start_server(tmp_path, '-j', '2', '--drain-timeout', '1')
+    pdf = tmp_path / 'book.pdf'
+    pdf.write_bytes(b'%PDF-1.4\n%%EOF\n')
+    responses = []
+    client = threading.Thread(target=lambda: responses.append(
+        query_server(socket_path, str(pdf), timeout=60)), daemon=True)
+    try:
+        client.start()
+        for _ in range(300):
+            if (tmp_path / 'calls.log').exists():
+                break
+            time.sleep(0.1)
+        else:
+            raise TimeoutError('The search never ran a tool')
+        start = time.monotonic()
+        server.send_signal(signal.SIGTERM)
+        # The stuck search is killed after the drain timeout rather than
+        # finishing 60 s later
+        assert server.wait(20) == 0
+        assert time.monotonic() - start < 20
+        client.join(5)
+        assert not client.is_alive()
+    finally:
+        if server.poll() is None:
+            server.kill()